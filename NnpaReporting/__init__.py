@@ -9,8 +9,9 @@
 # (at your option) any later version.
 # ---------------------------------------------------------------------
 
-from .reporting_tool import ReportingTool
-
 
 def classFactory(iface):
+    # imported here so that the QGIS independent modules can be used without QGIS (e.g. in benchmarks)
+    from .reporting_tool import ReportingTool
+
     return ReportingTool(iface)
@@ -0,0 +1,237 @@
+from datetime import date, datetime
+
+from .precision import UNKNOWN_RANK
+
+# order of the attributes passed to `SpeciesAggregator.add`
+RECORD_FIELDS = ("name", "precision", "date", "grid_refer", "latin_name", "recorder", "survey_name")
+
+# aggregated fields keeping their distinct values
+DISTINCT_FIELDS = ("date", "grid_refer", "recorder", "survey_name")
+
+# formats of the text date values
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y")
+
+
+def distinct_text(values, truncated=False):
+    """Display string of a collection of distinct values"""
+    text = ", ".join(sorted(str(v) for v in values if v is not None))
+    return f"{text}, …" if truncated else text
+
+
+def comparable_date(value):
+    """Date of a date attribute value (QDate, date or text in a DATE_FORMATS format), None otherwise"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if hasattr(value, "toPyDateTime"):  # QDateTime
+        value = value.date()
+    if hasattr(value, "toPyDate"):  # QDate, invalid for NULL dates
+        return value.toPyDate() if value.isValid() else None
+    if isinstance(value, str):
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(value.strip()[:10], date_format).date()
+            except ValueError:
+                pass
+    return None
+
+
+class DateParser:
+    """Callable returning the comparable_date of date values, each distinct value is parsed once"""
+
+    def __init__(self):
+        self.dates = {}
+
+    def __call__(self, value):
+        try:
+            return self.dates[value]
+        except KeyError:
+            date_value = self.dates[value] = comparable_date(value)
+            return date_value
+        except TypeError:  # unhashable NULL variant
+            return None
+
+
+def date_range_text(value):
+    """Display string of the earliest and latest dates of a species, its distinct dates if none is known"""
+    if value.earliest_date is None:
+        return distinct_text(value.date, value.truncated)
+    if value.earliest_date == value.latest_date:
+        return value.earliest_date.isoformat()
+    return f"{value.earliest_date.isoformat()} – {value.latest_date.isoformat()}"
+
+
+class SpeciesAggregate:
+    """Aggregated records of a single species
+
+    The distinct values are kept in sets, or in dictionaries of value frequencies when the
+    aggregator tracks them. Once a distinct collection reaches the aggregator's limit, new values
+    are no longer added and `truncated` is set.
+    """
+
+    __slots__ = (
+        "count",
+        "latin_name",
+        "precision_min",
+        "precision_max",
+        "rank_min",
+        "rank_max",
+        "date",
+        "grid_refer",
+        "recorder",
+        "survey_name",
+        "earliest_date",
+        "latest_date",
+        "truncated",
+    )
+
+    def __init__(self, latin_name=None, precision=None, rank=UNKNOWN_RANK, distinct_type=set):
+        self.count = 0
+        self.latin_name = latin_name
+        self.precision_min = precision
+        self.precision_max = precision
+        self.rank_min = rank
+        self.rank_max = rank
+        self.date = distinct_type()
+        self.grid_refer = distinct_type()
+        self.recorder = distinct_type()
+        self.survey_name = distinct_type()
+        self.earliest_date = None
+        self.latest_date = None
+        self.truncated = False
+
+    def update_precision(self, precision, rank):
+        # unknown precisions have the lowest rank, they never win over a valid precision
+        if rank > self.rank_max:
+            self.rank_max = rank
+            self.precision_max = precision
+        if rank != UNKNOWN_RANK and (rank < self.rank_min or self.rank_min == UNKNOWN_RANK):
+            self.rank_min = rank
+            self.precision_min = precision
+
+    def update_dates(self, date):
+        if date is None:
+            return
+        if self.earliest_date is None or date < self.earliest_date:
+            self.earliest_date = date
+        if self.latest_date is None or date > self.latest_date:
+            self.latest_date = date
+
+
+class SpeciesAggregator:
+    """Streaming aggregation of records per species
+
+    Records are added one at a time, only the counts, the precision range and the bounded
+    distinct values are kept, so the memory does not grow with the number of records. Distinct
+    values shared by several species (dates, recorders, ...) are stored once.
+
+    :param precision_rank: callable returning the rank of a precision value
+    :param max_distinct: maximum number of distinct values kept per field and species, None for no limit
+    :param track_frequencies: keep the number of records of each distinct value
+    :param date_key: callable converting a date value to a comparable value (or None) to track
+        the earliest and latest date of each species
+    """
+
+    def __init__(self, precision_rank, max_distinct=None, track_frequencies=False, date_key=None):
+        self.precision_rank = precision_rank
+        self.max_distinct = max_distinct
+        self.track_frequencies = track_frequencies
+        self.date_key = date_key
+        self.results = {}
+        self.total_count = 0
+        self.values = {}
+
+    def add(self, name, precision, date, grid_refer, latin_name, recorder, survey_name):
+        rank = self.precision_rank(precision)
+        self.add_ranked(rank, name, precision, date, grid_refer, latin_name, recorder, survey_name)
+
+    def add_ranked(self, rank, name, precision, date, grid_refer, latin_name, recorder, survey_name):
+        """Adds a record whose precision rank is already known"""
+        aggregate = self.results.get(name)
+        if aggregate is None:
+            # the first occurrence
+            aggregate = SpeciesAggregate(latin_name, precision, rank, dict if self.track_frequencies else set)
+            self.results[name] = aggregate
+        else:
+            aggregate.update_precision(precision, rank)
+
+        aggregate.count += 1
+        self.total_count += 1
+        if self.track_frequencies:
+            self.add_distinct(aggregate, aggregate.date, date)
+            self.add_distinct(aggregate, aggregate.grid_refer, grid_refer)
+            self.add_distinct(aggregate, aggregate.recorder, recorder)
+            self.add_distinct(aggregate, aggregate.survey_name, survey_name)
+        else:
+            # most values are already known, only call add_distinct for the new ones
+            if date not in aggregate.date:
+                self.add_distinct(aggregate, aggregate.date, date)
+            if grid_refer not in aggregate.grid_refer:
+                self.add_distinct(aggregate, aggregate.grid_refer, grid_refer)
+            if recorder not in aggregate.recorder:
+                self.add_distinct(aggregate, aggregate.recorder, recorder)
+            if survey_name not in aggregate.survey_name:
+                self.add_distinct(aggregate, aggregate.survey_name, survey_name)
+        if self.date_key:
+            aggregate.update_dates(self.date_key(date))
+
+    def add_distinct(self, aggregate, values, value):
+        if value in values:
+            if self.track_frequencies:
+                values[value] += 1
+            return
+        if self.max_distinct is not None and len(values) >= self.max_distinct:
+            aggregate.truncated = True
+            return
+        value = self.values.setdefault(value, value)
+        if self.track_frequencies:
+            values[value] = 1
+        else:
+            values.add(value)
+
+    def add_aggregate(self, name, partial):
+        """Merges a partial aggregate of the species, e.g. computed for a subset of its records"""
+        aggregate = self.results.get(name)
+        if aggregate is None:
+            aggregate = SpeciesAggregate(
+                partial.latin_name, partial.precision_min, partial.rank_min, dict if self.track_frequencies else set
+            )
+            aggregate.precision_max = partial.precision_max
+            aggregate.rank_max = partial.rank_max
+            self.results[name] = aggregate
+        else:
+            aggregate.update_precision(partial.precision_min, partial.rank_min)
+            aggregate.update_precision(partial.precision_max, partial.rank_max)
+
+        aggregate.count += partial.count
+        self.total_count += partial.count
+        aggregate.truncated = aggregate.truncated or partial.truncated
+        for key in DISTINCT_FIELDS:
+            values = getattr(aggregate, key)
+            partial_values = getattr(partial, key)
+            for value in partial_values:
+                if self.track_frequencies and isinstance(partial_values, dict):
+                    # add the value once to apply the limit, then add the remaining frequency
+                    self.add_distinct(aggregate, values, value)
+                    if value in values:
+                        values[value] += partial_values[value] - 1
+                else:
+                    self.add_distinct(aggregate, values, value)
+        aggregate.update_dates(partial.earliest_date)
+        aggregate.update_dates(partial.latest_date)
+
+    def add_records(self, records):
+        """Adds a stream of records, tuples of attributes in the RECORD_FIELDS order"""
+        add = self.add
+        for record in records:
+            add(*record)
+        return self
+
+    def add_features(self, features, indexes):
+        """Adds a stream of features, `indexes` are the attribute indexes of the RECORD_FIELDS"""
+        add = self.add
+        for feature in features:
+            attributes = feature.attributes()
+            add(*[attributes[i] for i in indexes])
+        return self
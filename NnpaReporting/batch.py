@@ -0,0 +1,201 @@
+from qgis.core import (
+    QgsFeatureRequest,
+    QgsFeedback,
+    QgsRectangle,
+    QgsSpatialIndex,
+    QgsTask,
+    QgsVectorLayer,
+    QgsVectorLayerFeatureSource,
+)
+from qgis.PyQt.QtCore import QThread
+
+from .aggregator import DateParser, SpeciesAggregator
+from .engine import result_features, result_fields
+from .selection import SelectionTile
+
+# a chunk of sites is aggregated in a single pass over the records when it has more sites than this
+JOIN_MIN_SITES = 20
+
+# ... or when the site bounding boxes cover more than this ratio of the chunk extent
+JOIN_MIN_COVERAGE = 0.25
+
+
+def split_sites(sites, count):
+    """Splits the sites in `count` spatially compact chunks, sorted by the x of their centre"""
+    sites = sorted(sites, key=lambda site: site[1].boundingBox().center().x())
+    size = -(-len(sites) // count)
+    return [sites[i : i + size] for i in range(0, len(sites), size)]
+
+
+class SiteChunkTask(QgsTask):
+    """Aggregates the records of a chunk of sites, runs as a sub-task of BatchReportTask
+
+    Each chunk reads the records through its own feature source. Depending on the layout of
+    the sites, the records are either queried site by site or read once for the whole chunk and
+    joined to the sites with a spatial index. The DateRange is part of the requests and checked
+    on the fetched records.
+
+    A failure does not fail the task, so that the other chunks' reports are kept: the error of
+    each site without a report is kept in `failures`.
+    """
+
+    def __init__(self, engine, sites, buffer_value, record_filter, max_distinct, date_range=None):
+        super().__init__("NNPA Reporting batch chunk", QgsTask.CanCancel)
+        self.source = QgsVectorLayerFeatureSource(engine.layer)
+        self.sites = sites
+        self.buffer_value = buffer_value
+        self.indexes = engine.attribute_indexes
+        self.precision_rank = engine.precision.rank
+        self.record_filter = record_filter
+        self.max_distinct = max_distinct
+        self.date_range = date_range
+        self.date_expression = engine.date_expression(date_range)
+        self.date_key = DateParser()
+        self.feedback = QgsFeedback()
+        self.results = {}
+        self.failures = {}
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
+
+    def use_join(self):
+        extent = QgsRectangle()
+        extent.setMinimal()
+        sites_area = 0
+        for _, geom in self.sites:
+            bbox = geom.boundingBox().buffered(self.buffer_value)
+            extent.combineExtentWith(bbox)
+            sites_area += bbox.area()
+        return len(self.sites) > JOIN_MIN_SITES or sites_area > JOIN_MIN_COVERAGE * extent.area()
+
+    def new_aggregator(self):
+        return SpeciesAggregator(self.precision_rank, self.max_distinct, date_key=self.date_key)
+
+    def add_record(self, aggregator, attributes):
+        """Adds the record to the site's aggregate if it passes the precision, sensitive and date filters"""
+        record = [attributes[i] for i in self.indexes]  # in the RECORD_FIELDS order
+        rank = self.precision_rank(record[1])
+        if not (self.record_filter.accepts_rank(rank) and self.record_filter.accepts_name(record[0])):
+            return
+        if self.date_range and not self.date_range.accepts(self.date_key(record[2])):
+            return
+        aggregator.add_ranked(rank, *record)
+
+    def request(self):
+        """Request of the mapped attributes, with the date range if any"""
+        request = QgsFeatureRequest().setSubsetOfAttributes(self.indexes).setFeedback(self.feedback)
+        if self.date_expression:
+            request.setFilterExpression(self.date_expression)
+        return request
+
+    def run(self):
+        try:
+            if self.use_join():
+                self.run_join()
+            else:
+                self.run_scans()
+        except Exception as e:  # exceptions must not escape the task manager thread
+            for site_id, _ in self.sites:
+                if site_id not in self.results:
+                    self.failures[site_id] = str(e)
+        return not self.isCanceled()
+
+    def run_scans(self):
+        """One spatial query per site, the same request as the output dialog's"""
+        for i, (site_id, geom) in enumerate(self.sites):
+            try:
+                self.results[site_id] = self.scan_site(geom)
+            except Exception as e:  # exceptions must not escape the task manager thread
+                self.failures[site_id] = str(e)
+            if self.isCanceled():
+                return
+            self.setProgress(100 * (i + 1) / len(self.sites))
+
+    def scan_site(self, geom):
+        aggregator = self.new_aggregator()
+        request = self.request().setDistanceWithin(geom, self.buffer_value).setFlags(QgsFeatureRequest.NoGeometry)
+        for feature in self.source.getFeatures(request):
+            if self.isCanceled():
+                break
+            self.add_record(aggregator, feature.attributes())
+        return aggregator.results
+
+    def run_join(self):
+        """Single pass over the records of the chunk extent joined to the sites with a spatial index"""
+        index = QgsSpatialIndex()
+        tiles = {}
+        aggregators = {}
+        extent = QgsRectangle()
+        extent.setMinimal()
+        for i, (site_id, geom) in enumerate(self.sites):
+            # the exact distance to the site, as the scans' distance filter
+            tiles[i] = SelectionTile(geom, self.buffer_value)
+            aggregators[i] = self.new_aggregator()
+            index.addFeature(i, tiles[i].bbox)
+            extent.combineExtentWith(tiles[i].bbox)
+
+        request = self.request().setFilterRect(extent)
+        total = max(self.source.featureCount(), 1)
+        for count, feature in enumerate(self.source.getFeatures(request)):
+            if self.isCanceled():
+                return
+            geom = feature.geometry()
+            candidates = index.intersects(geom.boundingBox())
+            if candidates:
+                attributes = feature.attributes()
+                for i in candidates:
+                    if tiles[i].intersects(geom):
+                        self.add_record(aggregators[i], attributes)
+            if count % 1000 == 0:
+                self.setProgress(min(100 * count / total, 99))
+
+        for i, (site_id, _) in enumerate(self.sites):
+            self.results[site_id] = aggregators[i].results
+
+
+class BatchReportTask(QgsTask):
+    """Reports the records of every site of a polygon layer, the sites are split between parallel sub-tasks
+
+    The reports are in `results` once the task has completed, the errors of the sites that could
+    not be reported in `failures`, both keyed by site id.
+
+    :param sites: list of (site id, geometry in the records layer CRS)
+    :param date_range: DateRange of the reported records, None for all the dates
+    """
+
+    def __init__(self, engine, sites, buffer_value, record_filter, max_distinct=None, date_range=None):
+        super().__init__("NNPA Reporting batch report", QgsTask.CanCancel)
+        workers = max(1, min(QThread.idealThreadCount(), len(sites)))
+        self.chunks = [
+            SiteChunkTask(engine, chunk, buffer_value, record_filter, max_distinct, date_range)
+            for chunk in split_sites(sites, workers)
+        ]
+        for chunk in self.chunks:
+            self.addSubTask(chunk, [], QgsTask.ParentDependsOnSubTask)
+        self.results = {}
+        self.failures = {}
+
+    def run(self):
+        for chunk in self.chunks:
+            self.results.update(chunk.results)
+            self.failures.update(chunk.failures)
+        return not self.isCanceled()
+
+
+def results_table(results, site_id_field):
+    """Memory layer with one row per site and species
+
+    :param results: dictionary of site id -> dictionary of species name -> SpeciesAggregate
+    :param site_id_field: QgsField of the site id
+    """
+    vl = QgsVectorLayer("None", "batch_report_results", "memory")
+    dp = vl.dataProvider()
+    dp.addAttributes(result_fields(site_id_field).toList())
+    vl.updateFields()
+
+    features = []
+    for site_id, species in results.items():
+        features.extend(result_features(species, dp.fields(), site_id))
+    dp.addFeatures(features)
+    return vl
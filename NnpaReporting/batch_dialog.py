@@ -0,0 +1,50 @@
+from os import path
+
+from qgis.core import Qgis, QgsCoordinateTransform, QgsCsException, QgsFeatureRequest, QgsProject
+from qgis.PyQt import uic
+from qgis.PyQt.QtWidgets import QDialog
+
+ui_file = path.join(path.dirname(__file__), "batch_dialog.ui")
+
+
+class BatchDialog(QDialog):
+    """Dialog to select the polygon layer and site id field of a batch report"""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.ui = uic.loadUi(ui_file, self)
+        self.ui.layerComboBox.setFilters(Qgis.LayerFilter.PolygonLayer)
+        self.ui.layerComboBox.layerChanged.connect(self.ui.fieldComboBox.setLayer)
+        self.ui.fieldComboBox.setLayer(self.ui.layerComboBox.currentLayer())
+
+    def accept(self):
+        if not self.ui.layerComboBox.currentLayer() or not self.ui.fieldComboBox.currentField():
+            return
+        super().accept()
+
+    @property
+    def site_id_field(self):
+        layer = self.ui.layerComboBox.currentLayer()
+        return layer.fields().field(self.ui.fieldComboBox.currentField())
+
+    def sites(self, crs):
+        """List of (site id, geometry) of the selected sites, the geometries are transformed to `crs`"""
+        layer = self.ui.layerComboBox.currentLayer()
+        field_name = self.ui.fieldComboBox.currentField()
+        transform = QgsCoordinateTransform(layer.crs(), crs, QgsProject.instance())
+
+        request = QgsFeatureRequest().setSubsetOfAttributes([field_name], layer.fields())
+        if self.ui.selectedOnlyCheckBox.isChecked():
+            request.setFilterFids(layer.selectedFeatureIds())
+
+        sites = []
+        for feature in layer.getFeatures(request):
+            if not feature.hasGeometry():
+                continue
+            geom = feature.geometry()
+            try:
+                geom.transform(transform)
+            except QgsCsException:
+                continue
+            sites.append((feature[field_name], geom))
+        return sites
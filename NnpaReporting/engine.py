@@ -0,0 +1,433 @@
+import json
+
+from qgis.core import (
+    Qgis,
+    QgsCoordinateTransform,
+    QgsExpression,
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsField,
+    QgsFields,
+    QgsMessageLog,
+    QgsProject,
+    QgsRectangle,
+    QgsSettings,
+)
+from qgis.PyQt.QtCore import QVariant
+
+from .aggregator import RECORD_FIELDS, DateParser, date_range_text, distinct_text
+from .filters import RecordFilter
+from .layer_utils import field_indexes
+from .metadata_cache import LayerMetadataCache
+from .precision import PrecisionDomain
+from .provider_sql import GroupedQuery, supports_grouped_query
+from .record_cache import RecordCache
+from .selection import SelectionGeometry, SelectionTile, matches_tiles
+
+# settings key and default field name of each mapped field
+FIELD_SETTINGS = {
+    "name": ("name_field_name", "Common_Nam"),
+    "date": ("date_field_name", "Sample_Dat"),
+    "precision": ("precision_field_name", "Precision"),
+    "grid_refer": ("grid_refer_field_name", "grid refer"),
+    "latin_name": ("latin_name_field_name", "latin name"),
+    "recorder": ("recorder_field_name", "recorder"),
+    "survey_name": ("survey_field_name", "survey nam"),
+}
+
+# field types of the dates compared by the providers
+DATE_TYPES = (QVariant.Date, QVariant.DateTime)
+
+# number of feature ids per request when the records are read by id
+FID_BATCH_SIZE = 10000
+
+# estimated number of records of each partition of a partitioned scan, smaller selections are scanned at once
+PARTITION_RECORDS = 100000
+
+# fields of the reported results
+RESULT_FIELDS = [
+    ("Common Name", QVariant.String),
+    ("Count", QVariant.Int),
+    ("Observation Date", QVariant.String),
+    ("Precision Min", QVariant.String),
+    ("Precision Max", QVariant.String),
+    ("Grid Reference", QVariant.String),
+    ("Latin Name", QVariant.String),
+    ("Sample Recorder", QVariant.String),
+    ("Survey Name", QVariant.String),
+]
+
+# fields of the exported records, the feature id followed by the RECORD_FIELDS
+RECORD_EXPORT_FIELDS = [
+    ("Feature Id", QVariant.LongLong),
+    ("Common Name", QVariant.String),
+    ("Precision", QVariant.String),
+    ("Observation Date", QVariant.String),
+    ("Grid Reference", QVariant.String),
+    ("Latin Name", QVariant.String),
+    ("Sample Recorder", QVariant.String),
+    ("Survey Name", QVariant.String),
+]
+
+
+def field_mapping_from_settings():
+    """Field names of the records layer saved in the plugin settings, keyed by RECORD_FIELDS"""
+    s = QgsSettings()
+    return {
+        key: s.value(f"plugins/nnpa_reporting_plugin/{setting}", default)
+        for key, (setting, default) in FIELD_SETTINGS.items()
+    }
+
+
+def additional_layers_from_settings():
+    """Additional records layers saved in the plugin settings, dictionaries of uri, provider and fields"""
+    value = QgsSettings().value("plugins/nnpa_reporting_plugin/additional_layers", "")
+    return json.loads(value) if value else []
+
+
+def sensitive_species_from_settings():
+    """Names of the sensitive species excluded from the reports"""
+    return QgsSettings().value("plugins/nnpa_reporting_plugin/sensitive_species", [])
+
+
+def iso_date_text(column):
+    """Expression of a text date column as a yyyy-mm-dd string, dd/mm/yyyy values are reordered
+
+    Valid SQL for the SQL providers and a valid QGIS expression, the ISO strings of zero padded
+    DATE_FORMATS values then compare as their dates.
+    """
+    value = f"trim({column})"
+    return (
+        f"CASE WHEN substr({value}, 3, 1) = '/' "
+        f"THEN substr({value}, 7, 4) || '-' || substr({value}, 4, 2) || '-' || substr({value}, 1, 2) "
+        f"ELSE substr({value}, 1, 10) END"
+    )
+
+
+def result_fields(site_id_field=None):
+    """Fields of the reported results, optionally preceded by a site id field"""
+    fields = QgsFields()
+    if site_id_field is not None:
+        fields.append(QgsField(site_id_field))
+    for name, field_type in RESULT_FIELDS:
+        fields.append(QgsField(name, field_type))
+    return fields
+
+
+def record_export_fields():
+    fields = QgsFields()
+    for name, field_type in RECORD_EXPORT_FIELDS:
+        fields.append(QgsField(name, field_type))
+    return fields
+
+
+def result_attributes(name, value):
+    """Attributes of a reported species in the RESULT_FIELDS order"""
+    return [
+        name,
+        value.count,
+        date_range_text(value),
+        str(value.precision_min),
+        str(value.precision_max),
+        distinct_text(value.grid_refer, value.truncated),
+        value.latin_name,
+        distinct_text(value.recorder, value.truncated),
+        distinct_text(value.survey_name, value.truncated),
+    ]
+
+
+def result_features(results, fields, site_id=None):
+    """Features of the reported species, prefixed with the site id if the fields have a site id field
+
+    A missing site id is written as NULL, the attributes always match the fields.
+    """
+    prefix = [site_id] if fields.count() > len(RESULT_FIELDS) else []
+    features = []
+    for name, value in results.items():
+        f = QgsFeature(fields)
+        f.setAttributes(prefix + result_attributes(name, value))
+        features.append(f)
+    return features
+
+
+class ReportingEngine:
+    """Queries and aggregates the species records of a layer, independent from the GUI
+
+    Used by the output dialog, the batch report and the processing algorithm, and usable from
+    scripts::
+
+        engine = ReportingEngine(layer)
+        results = engine.report(geom, 100, engine.record_filter("100m", "1km"))
+
+    :param layer: the records layer
+    :param fields: field names keyed by RECORD_FIELDS, read from the plugin settings if not given
+    :param precision: PrecisionDomain of the layer, computed from the layer if not given
+    """
+
+    def __init__(self, layer, fields=None, precision=None):
+        self.layer = layer
+        self.fields = dict(fields or field_mapping_from_settings())
+        # saved between sessions, the layer is only scanned again when its data has changed
+        self.metadata = LayerMetadataCache(layer)
+        self.precision = precision if precision is not None else self.read_precision_domain()
+        self.attribute_indexes = field_indexes(layer, [self.fields[key] for key in RECORD_FIELDS])
+        # QgsSpatialIndex of the record bounding boxes, set when the layer has no spatial index of its own
+        self.spatial_index = None
+        # date and date time fields are compared as dates by the provider, text dates as ISO strings
+        date_index = self.attribute_indexes[RECORD_FIELDS.index("date")]
+        self.typed_dates = date_index >= 0 and layer.fields().field(date_index).type() in DATE_TYPES
+
+    def read_precision_domain(self):
+        """Unique precision values of the layer, sorted, with their ranks"""
+        return PrecisionDomain(self.metadata.precision_values(self.fields["precision"]))
+
+    @property
+    def missing_fields(self):
+        """Mapped field names not found in the layer"""
+        return [self.fields[key] for key, i in zip(RECORD_FIELDS, self.attribute_indexes) if i < 0]
+
+    def layer_selection(self, selection, crs):
+        """SelectionGeometry of a selection made in another CRS, in the CRS of the records layer"""
+        if crs == self.layer.crs():
+            return selection
+        return selection.transformed(QgsCoordinateTransform(crs, self.layer.crs(), QgsProject.instance()))
+
+    def build_request(self, geom, buffer_value=0, date_range=None):
+        """Spatial request for the records, the other filters are applied to the fetched records"""
+        request = (
+            QgsFeatureRequest()
+            .setDistanceWithin(geom, buffer_value)
+            # the provider reads the geometries for the exact test but does not return them
+            .setFlags(QgsFeatureRequest.NoGeometry | QgsFeatureRequest.ExactIntersect)
+            .setSubsetOfAttributes(self.attribute_indexes)
+        )
+        expression = self.date_expression(date_range)
+        if expression:
+            request.setFilterExpression(expression)
+        return request
+
+    def date_expression(self, date_range):
+        """Filter expression of a DateRange, valid SQL as well, None without a range
+
+        The ISO date literals are compared by the SQL providers and, as strings, by the QGIS
+        expression engine. Text dates are compared as ISO strings too, see `iso_date_text`, the
+        fetched records are still checked with the parsed dates, which drops the malformed values.
+        """
+        if not date_range:
+            return None
+        field = QgsExpression.quotedColumnRef(self.fields["date"])
+        if not self.typed_dates:
+            field = iso_date_text(field)
+        conditions = []
+        if date_range.start is not None:
+            conditions.append(f"{field} >= {QgsExpression.quotedString(date_range.start.isoformat())}")
+        if date_range.end is not None:
+            conditions.append(f"{field} < {QgsExpression.quotedString(date_range.end_exclusive.isoformat())}")
+        return " AND ".join(conditions)
+
+    def grouped_query(self, geom, buffer_value=0, date_range=None):
+        """Query grouping the records by species and precision, None if the provider is not able to run it"""
+        # a layer indexed in memory has no spatial index, the provider would scan the whole table
+        if self.spatial_index is not None or not supports_grouped_query(self.layer):
+            return None
+        date_condition = self.date_expression(date_range)
+        return GroupedQuery(self.layer, self.fields, self.precision, geom, buffer_value, date_condition)
+
+    def run_grouped_query(self, sql_query, feedback=None):
+        """Runs the grouped query, returns None if it failed"""
+        try:
+            return sql_query.execute(feedback)
+        except Exception as e:
+            QgsMessageLog.logMessage(
+                f"Grouped query failed, aggregating the features instead: {e}", "NNPA Reporting", Qgis.Warning
+            )
+        return None
+
+    def features(self, selection, source=None, feedback=None, fids=None):
+        """Iterates the features matching a SelectionGeometry, may run in a task thread
+
+        Small selections use the provider's distance filter. Large selections are read in two
+        stages: the ids of the records matching the prepared tile geometries are collected first,
+        reading the geometries without any attribute, then the attributes of the matching records
+        are read by id without their geometry. With the in-memory `spatial_index`, the candidate
+        geometries of all the selections are read by id as well.
+
+        The records out of the selection's date range are skipped, the range is also part of the
+        request of small selections.
+
+        :param source: feature source to read the features from when running in a thread, the layer by default
+        :param fids: ids of candidate records, e.g. from a FidPrefilter, each record read by id is tested
+        """
+        features = self.selection_features(selection, source or self.layer, feedback, fids)
+        if selection.date_range:
+            features = self.in_date_range(features, selection.date_range)
+        return features
+
+    def in_date_range(self, features, date_range):
+        """Iterates the features dated in the range, each distinct date value is parsed once"""
+        date_index = self.attribute_indexes[RECORD_FIELDS.index("date")]
+        date_key = DateParser()
+        for feature in features:
+            if date_range.accepts(date_key(feature.attribute(date_index))):
+                yield feature
+
+    def selection_features(self, selection, source, feedback=None, fids=None):
+        if fids is not None:
+            tiles = selection.tiles
+            for feature in self.features_by_id(fids, source, feedback, with_geometry=True):
+                if matches_tiles(tiles, feature.geometry()):
+                    yield feature
+            return
+        if self.spatial_index is not None:
+            yield from self.features_by_id(self.indexed_ids(selection, source, feedback), source, feedback)
+            return
+        if not selection.tiled:
+            request = self.build_request(selection.geometry, selection.buffer_value, selection.date_range)
+            if feedback:
+                request.setFeedback(feedback)
+            yield from source.getFeatures(request)
+            return
+
+        fids = set()
+        for tile in selection.tiles:
+            request = QgsFeatureRequest().setFilterRect(tile.bbox).setNoAttributes()
+            if feedback:
+                request.setFeedback(feedback)
+            for feature in source.getFeatures(request):
+                if feature.id() not in fids and tile.intersects(feature.geometry()):
+                    fids.add(feature.id())
+        yield from self.features_by_id(fids, source, feedback)
+
+    def partitions(self, selection, count):
+        """Vertical strips of the selection extent to be scanned in parallel, at most `count`
+
+        The number of strips follows the number of records of the extent, estimated from the
+        feature count and the extent of the layer, a small selection is a single strip.
+        """
+        extent = selection.extent
+        layer_extent = self.layer.extent()
+        overlap = extent.intersect(layer_extent)
+        if layer_extent.area() <= 0 or overlap.isEmpty():
+            return [extent]
+        estimate = self.layer.featureCount() * overlap.area() / layer_extent.area()
+        count = max(1, min(count, int(estimate // PARTITION_RECORDS)))
+        edges = [extent.xMinimum() + i * extent.width() / count for i in range(count)] + [extent.xMaximum()]
+        return [QgsRectangle(edges[i], extent.yMinimum(), edges[i + 1], extent.yMaximum()) for i in range(count)]
+
+    def partition_features(self, selection, rect, source, feedback=None):
+        """Iterates the features matching a SelectionGeometry within a partition of its extent
+
+        Each partition prepares its own tiles, so that the partitions of a selection can be scanned
+        in parallel task threads. The records crossing the border of two partitions are returned by
+        both, see `RecordCache.merged`.
+        """
+        if selection.tiled:
+            # the parts of the geometry within the buffer distance of the partition
+            clipped = selection.geometry.clipped(rect.buffered(selection.buffer_value))
+            tiles = [SelectionTile(part, selection.buffer_value) for part in SelectionGeometry.split(clipped)]
+        else:
+            tiles = [SelectionTile(selection.geometry, selection.buffer_value)]
+        request = QgsFeatureRequest().setFilterRect(rect).setSubsetOfAttributes(self.attribute_indexes)
+        expression = self.date_expression(selection.date_range)
+        if expression:
+            request.setFilterExpression(expression)
+        if feedback:
+            request.setFeedback(feedback)
+        features = (feature for feature in source.getFeatures(request) if matches_tiles(tiles, feature.geometry()))
+        if selection.date_range:
+            features = self.in_date_range(features, selection.date_range)
+        return features
+
+    def indexed_ids(self, selection, source, feedback=None):
+        """Ids of the records matching the selection, the candidates come from the in-memory spatial index"""
+        fids = set()
+        for tile in selection.tiles:
+            candidates = [fid for fid in self.spatial_index.intersects(tile.bbox) if fid not in fids]
+            for start in range(0, len(candidates), FID_BATCH_SIZE):
+                batch = candidates[start : start + FID_BATCH_SIZE]
+                request = QgsFeatureRequest().setFilterFids(batch).setNoAttributes()
+                if feedback:
+                    request.setFeedback(feedback)
+                for feature in source.getFeatures(request):
+                    if tile.intersects(feature.geometry()):
+                        fids.add(feature.id())
+        return fids
+
+    def features_by_id(self, fids, source=None, feedback=None, with_geometry=False):
+        """Iterates the mapped attributes of records by id, FID_BATCH_SIZE ids per request, geometries if asked"""
+        source = source or self.layer
+        fids = sorted(fids)
+        for start in range(0, len(fids), FID_BATCH_SIZE):
+            request = (
+                QgsFeatureRequest()
+                .setFilterFids(fids[start : start + FID_BATCH_SIZE])
+                .setSubsetOfAttributes(self.attribute_indexes)
+            )
+            if not with_geometry:
+                request.setFlags(QgsFeatureRequest.NoGeometry)
+            if feedback:
+                request.setFeedback(feedback)
+            yield from source.getFeatures(request)
+
+    def collect_records(self, features):
+        """Collects a stream of features in a columnar cache, may run in a task thread"""
+        return RecordCache(self.precision.rank).add_features(features, self.attribute_indexes)
+
+    def fetch(self, geom, buffer_value=0, feedback=None, source=None, simplify_tolerance=0, date_range=None):
+        """Fetches the records matching the geometry and the DateRange, ready to be aggregated with any filter"""
+        selection = SelectionGeometry(geom, buffer_value, simplify_tolerance, date_range)
+        return self.fetch_selection(selection, feedback, source)
+
+    def fetch_selection(self, selection, feedback=None, source=None):
+        """Records matching a SelectionGeometry
+
+        :param source: feature source to read the records from when running in a thread, only the
+            source is read then, the grouped query reading the layer properties is not used
+        """
+        sql_query = None
+        if source is None:
+            sql_query = self.grouped_query(selection.geometry, selection.buffer_value, selection.date_range)
+        if sql_query:
+            records = self.run_grouped_query(sql_query, feedback)
+            if records is not None:
+                return records
+        return self.collect_records(self.features(selection, source, feedback))
+
+    def record_filter(self, precision_min=None, precision_max=None, include_unknown=False, excluded_names=()):
+        """Filter of the records, the precision range is given by precision values ('100m', '1km', ...)
+
+        :param precision_min: most precise wanted value, the most precise of the layer if None
+        :param precision_max: least precise wanted value, the least precise of the layer if None
+        """
+        values = self.precision.values
+        rank_min = values.index(str(precision_min)) if precision_min else 0
+        rank_max = values.index(str(precision_max)) if precision_max else len(values) - 1
+        return RecordFilter(rank_min, rank_max, include_unknown, excluded_names)
+
+    def report(
+        self, geom, buffer_value=0, record_filter=None, feedback=None, max_distinct=None, date_range=None, source=None
+    ):
+        """Aggregated records matching the geometry and the filter, SpeciesAggregate keyed by species name
+
+        :param source: feature source to read the records from when running in a thread, see `fetch_selection`
+        """
+        records = self.fetch(geom, buffer_value, feedback, source, date_range=date_range)
+        if record_filter is None:
+            record_filter = self.record_filter()
+        return records.aggregate(record_filter, max_distinct)
+
+
+def federated_engines(layers):
+    """ReportingEngine of each (layer, fields), sharing the precision domain of all the layers' values
+
+    :param layers: list of (layer, field names keyed by RECORD_FIELDS or None for the plugin settings)
+    """
+    engines = [ReportingEngine(layer, fields) for layer, fields in layers]
+    if len(engines) > 1:
+        values = []
+        for engine in engines:
+            values.extend(engine.metadata.precision_values(engine.fields["precision"]))
+        precision = PrecisionDomain(values)
+        for engine in engines:
+            engine.precision = precision
+    return engines
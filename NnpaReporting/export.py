@@ -0,0 +1,115 @@
+import os
+
+from qgis.core import (
+    QgsFeature,
+    QgsFeatureRequest,
+    QgsProject,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+
+from .engine import record_export_fields, result_features, result_fields
+
+# number of features read from the records layer and written at once
+EXPORT_BATCH_SIZE = 10000
+
+# file writer driver of the export file extensions
+EXPORT_DRIVERS = {".gpkg": "GPKG", ".csv": "CSV"}
+
+
+class ExportError(Exception):
+    pass
+
+
+def species_features(results, fields, geom=None):
+    """One typed feature per species of the results, all sharing the selection geometry, in a single batch"""
+    features = result_features(results, fields)
+    if geom is not None:
+        for f in features:
+            f.setGeometry(geom)
+    yield features
+
+
+def record_features(layer, records, record_filter, fields):
+    """Features of the records passing the filter with their own geometry, in batches
+
+    The geometries are read from the layer by feature id, EXPORT_BATCH_SIZE records at a time, so
+    only one batch is held in memory.
+    """
+    positions = records.filtered_records(record_filter)
+    for start in range(0, len(positions), EXPORT_BATCH_SIZE):
+        by_fid = {records.fids[i]: i for i in positions[start : start + EXPORT_BATCH_SIZE]}
+        request = QgsFeatureRequest().setFilterFids(list(by_fid)).setNoAttributes()
+        batch = []
+        for feature in layer.getFeatures(request):
+            fid, values = records.record(by_fid[feature.id()])
+            f = QgsFeature(fields)
+            f.setAttributes([fid, *values])
+            f.setGeometry(feature.geometry())
+            batch.append(f)
+        yield batch
+
+
+class ResultsExport:
+    """Export of the aggregated results, one feature per species or per matched record
+
+    :param results: SpeciesAggregate keyed by species name
+    :param records: the cached records of the results, required for the per-record export
+    :param record_filter: the filter the results were aggregated with
+    :param geom: the selection geometry given to the species features, already buffered
+    """
+
+    def __init__(self, layer, results, records=None, record_filter=None, geom=None, per_record=False):
+        if per_record and (records is None or not records.has_records):
+            raise ExportError(
+                "The individual records are not available for the results of a grouped or multi-layer query"
+            )
+        self.layer = layer
+        self.per_record = per_record
+        if per_record:
+            self.fields = record_export_fields()
+            self.wkb_type = layer.wkbType()
+            self.batches = record_features(layer, records, record_filter, self.fields)
+        else:
+            self.fields = result_fields()
+            self.wkb_type = geom.wkbType() if geom is not None else QgsWkbTypes.NoGeometry
+            self.batches = species_features(results, self.fields, geom)
+
+    def to_memory_layer(self, name="query_results"):
+        """Memory layer of the features, added with one addFeatures call per batch"""
+        if self.wkb_type == QgsWkbTypes.NoGeometry:
+            vl = QgsVectorLayer("None", name, "memory")
+        else:
+            vl = QgsVectorLayer(QgsWkbTypes.displayString(self.wkb_type), name, "memory")
+        vl.setCrs(self.layer.crs())
+        dp = vl.dataProvider()
+        dp.addAttributes(self.fields.toList())
+        vl.updateFields()
+        for batch in self.batches:
+            dp.addFeatures(batch)
+        return vl
+
+    def to_file(self, path):
+        """Streams the features to a GeoPackage or CSV file, the CSV geometries are written as WKT"""
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in EXPORT_DRIVERS:
+            raise ExportError(f"Unsupported export format: {extension}")
+
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = EXPORT_DRIVERS[extension]
+        options.fileEncoding = "UTF-8"
+        if options.driverName == "CSV" and self.wkb_type != QgsWkbTypes.NoGeometry:
+            options.layerOptions = ["GEOMETRY=AS_WKT"]
+        writer = QgsVectorFileWriter.create(
+            path, self.fields, self.wkb_type, self.layer.crs(), QgsProject.instance().transformContext(), options
+        )
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise ExportError(writer.errorMessage())
+        count = 0
+        for batch in self.batches:
+            if not writer.addFeatures(batch):
+                raise ExportError(writer.errorMessage())
+            count += len(batch)
+        del writer  # flushes and closes the file
+        return count
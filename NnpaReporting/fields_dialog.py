@@ -5,11 +5,19 @@ from qgis.PyQt import uic
 from qgis.PyQt.QtCore import QVariant
 from qgis.PyQt.QtWidgets import QDialog
 
+from .engine import DATE_TYPES, FIELD_SETTINGS, field_mapping_from_settings
+
 ui_file = path.join(path.dirname(__file__), "fields_dialog.ui")
 
 
 class FieldsDialog(QDialog):
-    def __init__(self, parent, fields: QgsFields):
+    """Selection of the records layer fields
+
+    :param field_mapping: field names keyed by RECORD_FIELDS to start from, the selected mapping is
+        then only returned in `field_mapping`, otherwise it is read from and saved in the plugin settings
+    """
+
+    def __init__(self, parent, fields: QgsFields, field_mapping=None):
         super().__init__(parent)
         self.ui = uic.loadUi(ui_file, self)
 
@@ -19,56 +27,40 @@ class FieldsDialog(QDialog):
                     field_combo_box.addItem(field.name())
             elif field.type() in (QVariant.Int, QVariant.UInt, QVariant.LongLong, QVariant.ULongLong, QVariant.Double):
                 self.ui.precision_cbo.addItem(field.name())
+            elif field.type() in DATE_TYPES:
+                self.ui.date_cbo.addItem(field.name())
         for field_combo_box in self.field_selection_widgets:
             field_combo_box.setCurrentIndex(-1)
 
-        s = QgsSettings()
-        name_field_name = s.value("plugins/nnpa_reporting_plugin/name_field_name", "Common_Nam")
-        date_field_name = s.value("plugins/nnpa_reporting_plugin/date_field_name", "Sample_Dat")
-        precision_field_name = s.value("plugins/nnpa_reporting_plugin/precision_field_name", "Precision")
-        grid_refer_field_name = s.value("plugins/nnpa_reporting_plugin/grid_refer_field_name", "grid refer")
-        latin_name_field_name = s.value("plugins/nnpa_reporting_plugin/latin_name_field_name", "latin name")
-        recorder_field_name = s.value("plugins/nnpa_reporting_plugin/recorder_field_name", "recorder")
-        survey_field_name = s.value("plugins/nnpa_reporting_plugin/survey_field_name", "survey nam")
+        self.save_settings = field_mapping is None
+        self.field_mapping = field_mapping or field_mapping_from_settings()
+        for key, field_combo_box in self.field_widgets.items():
+            field_combo_box.setCurrentText(self.field_mapping[key])
 
-        self.ui.name_cbo.setCurrentText(name_field_name)
-        self.ui.date_cbo.setCurrentText(date_field_name)
-        self.ui.precision_cbo.setCurrentText(precision_field_name)
-        self.ui.grid_refer_cbo.setCurrentText(grid_refer_field_name)
-        self.ui.latin_name_cbo.setCurrentText(latin_name_field_name)
-        self.ui.recorder_cbo.setCurrentText(recorder_field_name)
-        self.ui.survey_cbo.setCurrentText(survey_field_name)
+    @property
+    def field_widgets(self):
+        """Field combo box of each key of FIELD_SETTINGS"""
+        return {
+            "name": self.ui.name_cbo,
+            "date": self.ui.date_cbo,
+            "precision": self.ui.precision_cbo,
+            "grid_refer": self.ui.grid_refer_cbo,
+            "latin_name": self.ui.latin_name_cbo,
+            "recorder": self.ui.recorder_cbo,
+            "survey_name": self.ui.survey_cbo,
+        }
 
     @property
     def field_selection_widgets(self):
-        field_combo_boxes = [
-            self.ui.name_cbo,
-            self.ui.date_cbo,
-            self.ui.precision_cbo,
-            self.ui.grid_refer_cbo,
-            self.ui.latin_name_cbo,
-            self.ui.recorder_cbo,
-            self.ui.survey_cbo,
-        ]
-        return field_combo_boxes
+        return list(self.field_widgets.values())
 
     def accept(self):
         if any(combo_box.currentIndex() < 0 for combo_box in self.field_selection_widgets):
             return
 
-        name_field_name = self.ui.name_cbo.currentText()
-        date_field_name = self.ui.date_cbo.currentText()
-        precision_field_name = self.ui.precision_cbo.currentText()
-        grid_refer_field_name = self.ui.grid_refer_cbo.currentText()
-        latin_name_field_name = self.ui.latin_name_cbo.currentText()
-        recorder_field_name = self.ui.recorder_cbo.currentText()
-        survey_field_name = self.ui.survey_cbo.currentText()
-        s = QgsSettings()
-        s.setValue("plugins/nnpa_reporting_plugin/name_field_name", name_field_name)
-        s.setValue("plugins/nnpa_reporting_plugin/date_field_name", date_field_name)
-        s.setValue("plugins/nnpa_reporting_plugin/precision_field_name", precision_field_name)
-        s.setValue("plugins/nnpa_reporting_plugin/grid_refer_field_name", grid_refer_field_name)
-        s.setValue("plugins/nnpa_reporting_plugin/latin_name_field_name", latin_name_field_name)
-        s.setValue("plugins/nnpa_reporting_plugin/recorder_field_name", recorder_field_name)
-        s.setValue("plugins/nnpa_reporting_plugin/survey_field_name", survey_field_name)
+        self.field_mapping = {key: combo_box.currentText() for key, combo_box in self.field_widgets.items()}
+        if self.save_settings:
+            s = QgsSettings()
+            for key, (setting, _) in FIELD_SETTINGS.items():
+                s.setValue(f"plugins/nnpa_reporting_plugin/{setting}", self.field_mapping[key])
         super().accept()
@@ -0,0 +1,82 @@
+from datetime import timedelta
+
+from .precision import UNKNOWN_RANK
+
+
+def normalized_name(name):
+    """Species name folded for the exclusion list comparison, case and whitespace insensitive"""
+    return " ".join(str(name).split()).casefold()
+
+
+class RecordFilter:
+    """Precision and sensitive species filters applied to the records fetched for a geometry
+
+    Keeping these filters out of the feature request allows the cached spatial results to be
+    re-filtered when the options change, without querying the provider again.
+
+    :param rank_min: lowest wanted precision rank
+    :param rank_max: highest wanted precision rank
+    :param include_unknown: also accept NULL and invalid precision values
+    :param excluded_names: species names to exclude, compared with `normalized_name`
+    """
+
+    def __init__(self, rank_min, rank_max, include_unknown=False, excluded_names=()):
+        self.rank_min = min(rank_min, rank_max)
+        self.rank_max = max(rank_min, rank_max)
+        self.include_unknown = include_unknown
+        self.excluded_names = {normalized_name(name) for name in excluded_names if name is not None}
+        self.accepted_names = {}  # result per raw name, a name is only normalized once
+
+    def accepts_rank(self, rank):
+        if rank == UNKNOWN_RANK:
+            return self.include_unknown
+        return self.rank_min <= rank <= self.rank_max
+
+    def accepts_name(self, name):
+        if not self.excluded_names:
+            return True
+        try:
+            return self.accepted_names[name]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable NULL variant
+            return False
+        # same as the former `"name" not in (...)` expression, NULL names do not pass the exclusion
+        accepted = name is not None and normalized_name(name) not in self.excluded_names
+        self.accepted_names[name] = accepted
+        return accepted
+
+
+class DateRange:
+    """Observation date range of the queried records
+
+    Unlike the RecordFilter, the range is part of the query: it is pushed into the feature
+    request or the grouped query, so that the records out of the range are not fetched. Records
+    without a valid date are not in any range.
+
+    :param start: first accepted date (datetime.date), None for no lower bound
+    :param end: last accepted date, None for no upper bound
+    """
+
+    def __init__(self, start=None, end=None):
+        if start is not None and end is not None and start > end:
+            start, end = end, start
+        self.start = start
+        self.end = end
+
+    def __bool__(self):
+        return self.start is not None or self.end is not None
+
+    def __str__(self):
+        return f"{self.start or ''}..{self.end or ''}"
+
+    @property
+    def end_exclusive(self):
+        """Day after the last accepted date, also covers the times of that day for date and time values"""
+        return None if self.end is None else self.end + timedelta(days=1)
+
+    def accepts(self, date):
+        """True if a comparable_date is in the range"""
+        if date is None:
+            return False
+        return (self.start is None or date >= self.start) and (self.end is None or date <= self.end)
@@ -0,0 +1,200 @@
+import os
+import pickle
+import shutil
+
+from qgis.core import QgsFeatureRequest, QgsGeometry, QgsRectangle, QgsTask, QgsUnitTypes
+
+from .aggregator import SpeciesAggregator
+from .engine import FID_BATCH_SIZE
+from .grid_squares import GRID_SIZES, build_levels, grid_square, inner_grid_squares, square_bounds
+from .record_cache import FederatedRecords, GroupedRecords
+from .selection import SelectionGeometry, SelectionTile, matches_tiles
+from .snapshot import SnapshotBuildTask, snapshot_directory, snapshot_key
+
+# changed when the layout of the saved pyramids changes
+PYRAMID_VERSION = 1
+
+
+def pyramid_available(layer):
+    """The grid squares are measured in meters, the layer CRS must be projected in meters"""
+    return layer.crs().mapUnits() == QgsUnitTypes.DistanceMeters
+
+
+def pyramid_key(engine):
+    """Description of the pyramid matching the engine's layer, field mapping and precision values"""
+    return dict(snapshot_key(engine), version=PYRAMID_VERSION, sizes=list(GRID_SIZES))
+
+
+def pyramid_directory(layer, key):
+    return snapshot_directory(layer, key, "grid_pyramids")
+
+
+def box_bounds(rect):
+    return rect.xMinimum(), rect.yMinimum(), rect.xMaximum(), rect.yMaximum()
+
+
+def write_pyramid(directory, key, levels, spanning):
+    """Saves a pyramid, the file is replaced at once when complete"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "pyramid.pickle")
+    with open(f"{path}.partial", "wb") as f:
+        pickle.dump((key, levels, spanning), f, pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{path}.partial", path)
+    # pyramids of the previous data
+    parent = os.path.dirname(directory)
+    for name in os.listdir(parent):
+        if os.path.join(parent, name) != directory:
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+class GridPyramid:
+    """Per species and precision aggregates of the records of each 10 km, 2 km and 1 km grid square
+
+    A record belongs to the square of each level containing its bounding box, so the squares of
+    a selection lying inside the selection geometry are answered from their aggregates: the
+    coarsest inner squares are taken, the others are split in the squares of the next level.
+    Only the records of the 1 km squares crossing the border of the selection and the few
+    records crossing a 1 km grid line, which are not in the inner squares, are read from the
+    provider and tested exactly.
+
+    The aggregates keep the count, the precision range, the earliest and latest dates and the
+    distinct values of each species and precision, so the reports are the same as the ones
+    aggregated from the records. Saved in the QGIS profile and rebuilt when the layer data changes.
+    """
+
+    def __init__(self, key, levels, spanning):
+        self.key = key
+        self.levels = levels
+        self.spanning = spanning
+
+    @classmethod
+    def load(cls, layer, key):
+        """Saved pyramid matching the key, None if there is none"""
+        return cls.read(os.path.join(pyramid_directory(layer, key), "pyramid.pickle"), key)
+
+    @classmethod
+    def read(cls, path, key):
+        """Pyramid saved in the file if it matches the key, None otherwise, may run in a task thread"""
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            saved_key, levels, spanning = pickle.load(f)
+        return cls(saved_key, levels, spanning) if saved_key == key else None
+
+    def inner_squares(self, selection):
+        """Squares of each level inside the selection and 1 km squares with records crossing its border
+
+        :returns: ({size: set of (column, row)}, list of the border squares)
+        """
+        tiles = selection.tiles
+        # the segmented buffer lies within the buffer distance, a square inside it matches
+        inner_tiles = [SelectionTile(part) for part in SelectionGeometry.split(selection.buffered)]
+        bbox = QgsRectangle(tiles[0].bbox)
+        for tile in tiles[1:]:
+            bbox.combineExtentWith(tile.bbox)
+        return inner_grid_squares(
+            self.levels,
+            box_bounds(bbox),
+            lambda *bounds: any(tile.contains_box(*bounds) for tile in inner_tiles),
+            lambda *bounds: matches_tiles(tiles, QgsGeometry.fromRect(QgsRectangle(*bounds))),
+        )
+
+    def fetch(self, selection, engine, source, feedback=None):
+        """Records matching a SelectionGeometry, may run in a task thread
+
+        :returns: FederatedRecords of the aggregates of the inner squares and of the RecordCache of
+            the other matching records, None if no square lies inside the selection or if cancelled
+        """
+        inner, border = self.inner_squares(selection)
+        if not any(inner.values()):
+            return None
+
+        merged = SpeciesAggregator(engine.precision.rank)
+        for size, squares in inner.items():
+            for square in squares:
+                for key, partial in self.levels[size][square].items():
+                    merged.add_aggregate(key, partial)
+        grouped = GroupedRecords(engine.precision.rank)
+        for (name, rank), partial in merged.results.items():
+            grouped.add_group(name, rank, partial)
+
+        records = engine.collect_records(self.remaining_features(selection, inner, border, engine, source, feedback))
+        if feedback and feedback.isCanceled():
+            return None
+        return FederatedRecords(engine.precision.rank, [grouped, records])
+
+    def remaining_features(self, selection, inner, border, engine, source, feedback=None):
+        """Iterates the matching features not aggregated in the inner squares"""
+        tiles = selection.tiles
+        size = GRID_SIZES[-1]
+        for square in border:
+            request = (
+                QgsFeatureRequest()
+                .setFilterRect(QgsRectangle(*square_bounds(square, size)))
+                .setSubsetOfAttributes(engine.attribute_indexes)
+            )
+            if feedback:
+                request.setFeedback(feedback)
+            for feature in source.getFeatures(request):
+                geom = feature.geometry()
+                # the records crossing the square's border are read with the spanning ones
+                if grid_square(*box_bounds(geom.boundingBox()), size) == square and matches_tiles(tiles, geom):
+                    yield feature
+
+        fids = [
+            fid
+            for fid, *box in self.spanning
+            if not any(grid_square(*box, level_size) in inner[level_size] for level_size in GRID_SIZES)
+            and any(tile.bbox.intersects(QgsRectangle(*box)) for tile in tiles)
+        ]
+        for start in range(0, len(fids), FID_BATCH_SIZE):
+            request = (
+                QgsFeatureRequest()
+                .setFilterFids(fids[start : start + FID_BATCH_SIZE])
+                .setSubsetOfAttributes(engine.attribute_indexes)
+            )
+            if feedback:
+                request.setFeedback(feedback)
+            for feature in source.getFeatures(request):
+                if matches_tiles(tiles, feature.geometry()):
+                    yield feature
+
+
+class GridPyramidLoadTask(QgsTask):
+    """Background task reading the saved grid pyramid of a layer, unpickling a large pyramid takes a while
+
+    The pyramid is in `result` once the task has completed, None if there is no current one.
+    """
+
+    def __init__(self, layer, key):
+        super().__init__("NNPA Reporting grid pyramid loading", QgsTask.Silent)
+        self.path = os.path.join(pyramid_directory(layer, key), "pyramid.pickle")
+        self.key = key
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = GridPyramid.read(self.path, self.key)
+        except Exception as e:  # exceptions must not escape the task manager thread
+            self.error = str(e)
+            return False
+        return True
+
+
+class GridPyramidBuildTask(SnapshotBuildTask):
+    """Background task reading every record of the layer once and saving its grid pyramid
+
+    The built pyramid is also kept in `pyramid`, so that it does not have to be loaded again.
+    """
+
+    def __init__(self, engine):
+        super().__init__(engine, "NNPA Reporting grid pyramid")
+        self.key = pyramid_key(engine)
+        self.directory = pyramid_directory(engine.layer, self.key)
+        self.pyramid = None
+
+    def save(self, fids, ranks, boxes, columns):
+        levels, spanning = build_levels(fids, ranks, boxes, columns, self.precision_rank)
+        write_pyramid(self.directory, self.key, levels, spanning)
+        self.pyramid = GridPyramid(self.key, levels, spanning)
@@ -0,0 +1,96 @@
+import math
+
+from .aggregator import SpeciesAggregator, comparable_date
+
+# sides of the grid squares of each level in meters, from the coarsest: hectads, tetrads and 1 km squares
+GRID_SIZES = (10000, 2000, 1000)
+
+
+def grid_square(xmin, ymin, xmax, ymax, size):
+    """(column, row) of the grid square of `size` containing the box, None if the box crosses a grid line"""
+    column = math.floor(xmin / size)
+    row = math.floor(ymin / size)
+    if xmax > (column + 1) * size or ymax > (row + 1) * size:
+        return None
+    return column, row
+
+
+def square_bounds(square, size):
+    column, row = square
+    return column * size, row * size, (column + 1) * size, (row + 1) * size
+
+
+def build_levels(fids, ranks, boxes, columns, precision_rank):
+    """Aggregates of the grid squares of each level and boxes of the records crossing a 1 km grid line
+
+    :param columns: DictionaryColumn of each of the RECORD_FIELDS
+    :returns: ({size: {(column, row): {(name, rank): SpeciesAggregate}}}, [(fid, xmin, ymin, xmax, ymax)])
+    """
+    # each distinct date value is parsed once
+    dates = {value: comparable_date(value) for value in columns["date"].values}
+    shared_values = {}  # distinct values shared by the aggregates of all the squares
+    aggregators = {size: {} for size in GRID_SIZES}
+    spanning = []
+    columns = [(column.values, column.codes) for column in columns.values()]
+    for i, box in enumerate(zip(*boxes)):
+        rank = ranks[i]
+        name, *record = [values[codes[i]] for values, codes in columns]
+        for size in GRID_SIZES:
+            square = grid_square(*box, size)
+            if square is None:
+                if size == GRID_SIZES[-1]:
+                    spanning.append((fids[i], *box))
+                continue
+            aggregator = aggregators[size].get(square)
+            if aggregator is None:
+                aggregator = SpeciesAggregator(precision_rank, date_key=dates.get)
+                aggregator.values = shared_values
+                aggregators[size][square] = aggregator
+            # keyed by species and precision rank, the squares are filtered like GroupedRecords
+            aggregator.add_ranked(rank, (name, rank), *record)
+    levels = {
+        size: {square: aggregator.results for square, aggregator in squares.items()}
+        for size, squares in aggregators.items()
+    }
+    return levels, spanning
+
+
+def inner_grid_squares(levels, bounds, contains, intersects):
+    """Squares of each level inside a selection and 1 km squares with records crossing its border
+
+    The squares of the coarsest level covering the selection bounds are visited, a square inside
+    the selection is kept, the others are split in the squares of the next level. The squares
+    without records are skipped with their children.
+
+    :param levels: aggregates of the grid squares of each level, see `build_levels`
+    :param bounds: (xmin, ymin, xmax, ymax) of the selection
+    :param contains: called with the bounds of a square, True if the square lies inside the selection
+    :param intersects: called with the bounds of a square, True if the square intersects the selection
+    :returns: ({size: set of (column, row)}, list of the border squares)
+    """
+    inner = {size: set() for size in GRID_SIZES}
+    border = []
+    size = GRID_SIZES[0]
+    xmin, ymin, xmax, ymax = bounds
+    squares = [
+        (column, row)
+        for column in range(math.floor(xmin / size), math.floor(xmax / size) + 1)
+        for row in range(math.floor(ymin / size), math.floor(ymax / size) + 1)
+    ]
+    for level, size in enumerate(GRID_SIZES):
+        squares_with_records = levels[size]
+        child_squares = []
+        for square in squares:
+            if square not in squares_with_records:
+                continue  # neither has any of its children
+            bounds = square_bounds(square, size)
+            if contains(*bounds):
+                inner[size].add(square)
+            elif level + 1 < len(GRID_SIZES):
+                ratio = size // GRID_SIZES[level + 1]
+                column, row = square
+                child_squares.extend((column * ratio + i, row * ratio + j) for i in range(ratio) for j in range(ratio))
+            elif intersects(*bounds):
+                border.append(square)
+        squares = child_squares
+    return inner, border
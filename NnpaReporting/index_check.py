@@ -0,0 +1,139 @@
+from qgis.core import (
+    Qgis,
+    QgsApplication,
+    QgsFeatureRequest,
+    QgsFeatureSource,
+    QgsFeedback,
+    QgsMessageLog,
+    QgsSpatialIndex,
+    QgsTask,
+    QgsVectorDataProvider,
+    QgsVectorLayer,
+    QgsVectorLayerFeatureSource,
+)
+from qgis.PyQt.QtWidgets import QCheckBox, QMessageBox
+
+from .metadata_cache import LayerMetadataCache
+from .provider_sql import indexed_columns
+
+# mapped fields the provider filters and groups the records on
+INDEXED_FIELDS = ("name", "precision")
+
+
+def missing_spatial_index(layer):
+    return layer.hasSpatialIndex() == QgsFeatureSource.SpatialIndexNotPresent
+
+
+def uses_memory_index(layer):
+    """True if the in-memory spatial index was chosen for a layer without spatial index"""
+    return missing_spatial_index(layer) and LayerMetadataCache(layer).read("spatial_index") == "memory"
+
+
+def unindexed_fields(layer, field_mapping):
+    """Mapped name and precision fields without attribute index, empty if the indexes are not known"""
+    try:
+        indexed = indexed_columns(layer)
+    except Exception as e:
+        QgsMessageLog.logMessage(f"Attribute indexes not read: {e}", "NNPA Reporting", Qgis.Warning)
+        return []
+    if indexed is None:
+        return []
+    return [field_mapping[key] for key in INDEXED_FIELDS if field_mapping[key] not in indexed]
+
+
+class SpatialIndexTask(QgsTask):
+    """Builds the spatial index of a layer's data source in the background
+
+    The index is created through a layer opened in the task thread, the provider of the layer
+    used by the plugin is not shared with the thread.
+    """
+
+    def __init__(self, layer):
+        super().__init__(f"NNPA Reporting spatial index of {layer.name()}")
+        self.uri = layer.source()
+        self.provider = layer.providerType()
+        self.error = None
+
+    def run(self):
+        layer = QgsVectorLayer(self.uri, "nnpa_reporting_index", self.provider)
+        if not layer.isValid():
+            self.error = "The layer could not be opened"
+            return False
+        if not layer.dataProvider().createSpatialIndex():
+            self.error = "The provider failed to create the spatial index"
+            return False
+        return True
+
+    def finished(self, result):
+        if result:
+            QgsMessageLog.logMessage("Spatial index of the records layer created", "NNPA Reporting", Qgis.Info)
+        else:
+            QgsMessageLog.logMessage(f"Spatial index not created: {self.error}", "NNPA Reporting", Qgis.Warning)
+
+
+class MemoryIndexTask(QgsTask):
+    """Builds an in-memory QgsSpatialIndex of the bounding boxes of a layer without spatial index
+
+    The index is available in `index` once the task has completed.
+    """
+
+    def __init__(self, layer):
+        super().__init__("NNPA Reporting in-memory spatial index", QgsTask.CanCancel)
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.feedback = QgsFeedback()
+        self.index = None
+
+    def run(self):
+        request = QgsFeatureRequest().setNoAttributes()
+        self.index = QgsSpatialIndex(self.source.getFeatures(request), self.feedback)
+        return not self.isCanceled()
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
+
+
+def check_layer_indexes(parent, layer, field_mapping):
+    """Warns about a missing spatial index and mapped fields without attribute index
+
+    Offers to build the spatial index in a background task or to use an in-memory index, the
+    choice is kept in the layer's metadata cache until its data changes.
+
+    :returns: the started SpatialIndexTask, to be kept by the caller, or None
+    """
+    metadata = LayerMetadataCache(layer)
+    if metadata.read("index_check") == "ignored":
+        return None
+    missing = missing_spatial_index(layer) and metadata.read("spatial_index") != "memory"
+    fields = unindexed_fields(layer, field_mapping)
+    if not missing and not fields:
+        return None
+
+    lines = []
+    if missing:
+        lines.append("The records layer has no spatial index, every report reads the whole layer.")
+    if fields:
+        lines.append(
+            f"The fields {', '.join(fields)} have no attribute index in the database, "
+            "creating one speeds up the grouped queries."
+        )
+    box = QMessageBox(QMessageBox.Warning, "NNPA Reporting", "\n\n".join(lines), QMessageBox.NoButton, parent)
+    build_button = memory_button = None
+    if missing and layer.dataProvider().capabilities() & QgsVectorDataProvider.CreateSpatialIndex:
+        build_button = box.addButton("Build spatial index", QMessageBox.AcceptRole)
+    if missing:
+        memory_button = box.addButton("Use an in-memory index", QMessageBox.ActionRole)
+    box.addButton(QMessageBox.Ignore)
+    box.setCheckBox(QCheckBox("Do not warn again until the layer data changes"))
+    box.exec()
+
+    if box.checkBox().isChecked():
+        metadata.write("index_check", "ignored")
+    clicked = box.clickedButton()
+    if clicked is not None and clicked == memory_button:
+        metadata.write("spatial_index", "memory")
+    elif clicked is not None and clicked == build_button:
+        task = SpatialIndexTask(layer)
+        QgsApplication.taskManager().addTask(task)
+        return task
+    return None
@@ -0,0 +1,44 @@
+import os
+
+from qgis.core import QgsProviderRegistry
+
+
+def source_path(layer):
+    """Path of the layer's source file, None for database and other non-file providers"""
+    decoded = QgsProviderRegistry.instance().decodeUri(layer.providerType(), layer.source())
+    path = decoded.get("path")
+    if path and os.path.isfile(path):
+        return path
+    return None
+
+
+def field_indexes(layer, field_names):
+    """Indexes of the fields in the layer, -1 for missing fields"""
+    fields = layer.fields()
+    return [fields.indexOf(name) for name in field_names]
+
+
+def source_fingerprint(layer):
+    """Value changing when the layer's data source changes
+
+    For file based layers the modification time and size of the file are used, other
+    providers rely on the layer's data changed signals.
+    """
+    fingerprint = (layer.providerType(), layer.source(), layer.subsetString())
+    path = source_path(layer)
+    if path:
+        stat = os.stat(path)
+        fingerprint += (stat.st_mtime_ns, stat.st_size)
+    return fingerprint
+
+
+def persistent_fingerprint(layer):
+    """Fingerprint of the layer's data comparable between QGIS sessions
+
+    The data changed signals relied on by `source_fingerprint` do not survive a restart, for
+    database and other non-file providers the feature count is added instead.
+    """
+    fingerprint = source_fingerprint(layer)
+    if len(fingerprint) == 3:  # no source file
+        fingerprint += (layer.featureCount(),)
+    return fingerprint
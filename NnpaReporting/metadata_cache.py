@@ -0,0 +1,53 @@
+import hashlib
+import json
+
+from qgis.core import QgsSettings
+
+from .layer_utils import persistent_fingerprint
+
+SETTINGS_GROUP = "plugins/nnpa_reporting_plugin/layer_metadata"
+
+
+def json_value(value):
+    """Attribute value as saved in the cache, None for NULL and other non JSON values"""
+    return value if isinstance(value, (str, int, float)) and not isinstance(value, bool) else None
+
+
+class LayerMetadataCache:
+    """Precision values and other metadata of a records layer saved in the settings between sessions
+
+    The entries are keyed by the layer source and only used while the layer's persistent
+    fingerprint is unchanged, so the precision scan of `uniqueValues` runs again only when the
+    data has changed.
+    """
+
+    def __init__(self, layer):
+        self.layer = layer
+        key = hashlib.sha1(f"{layer.providerType()}|{layer.source()}".encode()).hexdigest()
+        self.group = f"{SETTINGS_GROUP}/{key}"
+        self.fingerprint = json.dumps(persistent_fingerprint(layer), default=str)
+
+    def read(self, name):
+        """Value saved for the current fingerprint, None if missing or outdated"""
+        s = QgsSettings()
+        if s.value(f"{self.group}/fingerprint", None) != self.fingerprint:
+            return None
+        value = s.value(f"{self.group}/{name}", None)
+        return json.loads(value) if value else None
+
+    def write(self, name, value):
+        s = QgsSettings()
+        if s.value(f"{self.group}/fingerprint", None) != self.fingerprint:
+            s.remove(self.group)  # entries of the previous data
+            s.setValue(f"{self.group}/fingerprint", self.fingerprint)
+        s.setValue(f"{self.group}/{name}", json.dumps(value))
+
+    def precision_values(self, field_name):
+        """Unique values of the precision field, scanned and saved if not cached"""
+        cached = self.read("precision")
+        if cached and cached["field"] == field_name:
+            return cached["values"]
+        index = self.layer.fields().indexFromName(field_name)
+        values = [json_value(value) for value in self.layer.uniqueValues(index)]
+        self.write("precision", {"field": field_name, "values": values})
+        return values
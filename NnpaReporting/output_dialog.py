@@ -1,13 +1,42 @@
 from enum import Enum
 from os import path
 
-from qgis.core import Qgis, QgsFeature, QgsFeatureRequest, QgsField, QgsProject, QgsSettings, QgsVectorLayer
+from qgis.core import (
+    Qgis,
+    QgsApplication,
+    QgsMessageLog,
+    QgsProject,
+    QgsSettings,
+    QgsTask,
+)
 from qgis.PyQt import uic
-from qgis.PyQt.QtCore import QVariant
-from qgis.PyQt.QtWidgets import QDialog, QHeaderView, QTreeWidgetItem
+from qgis.PyQt.QtCore import QDate, Qt, QThread, QTimer
+from qgis.PyQt.QtWidgets import QDialog, QFileDialog, QHeaderView
+
+from .batch import BatchReportTask, results_table
+from .batch_dialog import BatchDialog
+from .engine import federated_engines, sensitive_species_from_settings
+from .export import ExportError, ResultsExport
+from .filters import DateRange, RecordFilter
+from .grid_pyramid import GridPyramidBuildTask, GridPyramidLoadTask, pyramid_available, pyramid_key
+from .index_check import MemoryIndexTask, uses_memory_index
+from .layer_utils import source_fingerprint
+from .preview import FidPrefilter, PreviewTask
+from .query_task import FederatedQueryTask, QueryTask
+from .result_cache import ResultCache, cache_key
+from .results_model import ResultsModel
+from .selection import SelectionGeometry
+from .snapshot import RecordSnapshot, SnapshotBuildTask, snapshot_available, snapshot_key
+from .timing import PhaseTimer, timed_phase
 
 ui_file = path.join(path.dirname(__file__), "output_dialog.ui")
 
+# maximum number of distinct dates, grid references, recorders and surveys kept per species
+MAX_DISTINCT_VALUES = 10000
+
+# delay after the last change of the date range before the geometry is queried again
+DATE_RANGE_DELAY_MS = 500
+
 
 class IdentifyMode(Enum):
     POINT = 1
@@ -16,267 +45,464 @@ class IdentifyMode(Enum):
 
 
 class OutputDialog(QDialog):
-    """Dialog to display the selected features"""
+    """Dialog to display the selected features
+
+    :param additional_layers: (layer, field names keyed by RECORD_FIELDS) of other records layers
+        queried with the same selection, their results are merged with the layer's
+    """
 
-    def __init__(self, layer):
+    def __init__(self, layer, additional_layers=()):
         super().__init__()
         self.ui = uic.loadUi(ui_file, self)
         self.ui.loadAsLayerButton.clicked.connect(self.load_results_as_layer)
+        self.ui.loadAsLayerButton.clicked.connect(self.show_timing)
+        self.ui.exportButton.clicked.connect(self.export_results)
+        self.ui.exportButton.clicked.connect(self.show_timing)
+        self.ui.batchReportButton.clicked.connect(self.run_batch_report)
+        self.ui.cancelButton.clicked.connect(self.cancel_query)
         self.ui.cbMode.addItem("Point / Rectangle", IdentifyMode.POINT)
         self.ui.cbMode.addItem("Polygon", IdentifyMode.POLYGON)
         self.ui.cbMode.addItem("Existing layer polygon", IdentifyMode.LAYER)
         self.layer = layer
-        self.geom = None
-        self.treeResults.setHeaderLabels(
-            [
-                "Common Name",
-                "Count",
-                "Observation Date",
-                "Precision Min",
-                "Precision Max",
-                "Grid Reference",
-                "Latin Name",
-                "Sample Recorder",
-                "Survey Name",
-            ]
-        )
+        self.layers = [layer] + [additional_layer for additional_layer, _ in additional_layers]
+        self.selection = None  # SelectionGeometry of the last query
+        self.selected_geom = None  # geometry of the last query before simplification
+        self.task = None
+        self.batch_task = None
+        self.records = None  # cached records matching the last geometry
+        self.show_progress(False)
+        self.model = ResultsModel(self)
+        self.treeResults.setModel(self.model)
+        self.treeResults.sortByColumn(1, Qt.DescendingOrder)
         self.treeResults.header().resizeSections(QHeaderView.ResizeToContents)
+        self.excluded_names = sensitive_species_from_settings()
         s = QgsSettings()
-        self.excluded_names = s.value("plugins/nnpa_reporting_plugin/sensitive_species", [])
-        self.name_field_name = s.value("plugins/nnpa_reporting_plugin/name_field_name", "Common_Nam")
-        self.date_field_name = s.value("plugins/nnpa_reporting_plugin/date_field_name", "Sample_Dat")
-        self.precision_field_name = s.value("plugins/nnpa_reporting_plugin/precision_field_name", "Precision")
-        self.grid_refer_field_name = s.value("plugins/nnpa_reporting_plugin/grid_refer_field_name", "grid refer")
-        self.latin_name_field_name = s.value("plugins/nnpa_reporting_plugin/latin_name_field_name", "latin name")
-        self.recorder_field_name = s.value("plugins/nnpa_reporting_plugin/recorder_field_name", "recorder")
-        self.survey_field_name = s.value("plugins/nnpa_reporting_plugin/survey_field_name", "survey nam")
-
-        self.precision_values = []
-        self.precision_unknown_values = set()
+        cache_size_mb = s.value("plugins/nnpa_reporting_plugin/cache_size_mb", 256, type=int)
+
+        # optional timing of the report phases, shown under the total and written to the message log
+        self.timer = PhaseTimer(s.value("plugins/nnpa_reporting_plugin/timing_enabled", False, type=bool), log_timing)
+        self.lbTiming.setVisible(self.timer.enabled)
+
+        # query results of the recently selected geometries, cleared when the records layer changes
+        self.result_cache = ResultCache(cache_size_mb * 1024 * 1024)
+        for records_layer in self.layers:
+            records_layer.dataChanged.connect(self.result_cache.clear)
+            records_layer.dataSourceChanged.connect(self.result_cache.clear)
+            records_layer.subsetStringChanged.connect(self.result_cache.clear)
+        self.cache_key = None
+
+        # field mapping of each records layer, the precision domain is shared by all the layers
+        with self.timer.phase("precision values"):
+            self.engines = federated_engines([(self.layer, None), *additional_layers])
+            self.engine = self.engines[0]
+
+        # in-memory spatial index of the records layers without one, when chosen in the index check
+        self.index_tasks = []
+        for engine in self.engines:
+            if uses_memory_index(engine.layer):
+                task = MemoryIndexTask(engine.layer)
+                task.taskCompleted.connect(lambda engine=engine, task=task: self.on_memory_index_built(engine, task))
+                self.index_tasks.append(task)
+                QgsApplication.taskManager().addTask(task)
         self.populate_ranges()
 
-    @property
-    def desired_fields(self):
-        fields = [
-            self.name_field_name,
-            self.date_field_name,
-            self.precision_field_name,
-            self.grid_refer_field_name,
-            self.latin_name_field_name,
-            self.recorder_field_name,
-            self.survey_field_name,
-        ]
-        return fields
+        # optional local snapshot of the records layer, rebuilt in the background when its data changes
+        self.snapshot_enabled = s.value("plugins/nnpa_reporting_plugin/snapshot_enabled", False, type=bool)
+        self.snapshot_enabled = self.snapshot_enabled and snapshot_available()
+        self.snapshot = None
+        self.snapshot_task = None
+
+        # optional per grid square aggregates of the records layer, rebuilt in the background as well
+        self.pyramid_enabled = s.value("plugins/nnpa_reporting_plugin/grid_pyramid_enabled", False, type=bool)
+        self.pyramid_enabled = self.pyramid_enabled and pyramid_available(self.layer)
+        self.pyramid = None
+        self.pyramid_task = None
+
+        # optional live count of the geometry being drawn, its record ids prefilter the final query
+        # the live count only covers a single records layer
+        self.cbLivePreview.setEnabled(len(self.engines) == 1)
+        self.cbLivePreview.setChecked(
+            len(self.engines) == 1 and s.value("plugins/nnpa_reporting_plugin/live_preview", False, type=bool)
+        )
+        self.cbLivePreview.toggled.connect(self.on_live_preview_toggled)
+        self.preview_task = None
+        self.prefilter = None
+        self.prefilter_fingerprint = None
+        self.layer.dataChanged.connect(self.clear_prefilter)
+        self.layer.dataSourceChanged.connect(self.clear_prefilter)
+        self.layer.subsetStringChanged.connect(self.clear_prefilter)
+
+        # the date range is part of the query, the last geometry is queried again when it changes
+        today = QDate.currentDate()
+        self.dateTo.setDate(today)
+        self.dateFrom.setDate(today.addYears(-10))
+        self.date_timer = QTimer(self)
+        self.date_timer.setSingleShot(True)
+        self.date_timer.setInterval(DATE_RANGE_DELAY_MS)
+        self.date_timer.timeout.connect(self.on_date_range_changed)
+        self.cbDateRange.toggled.connect(self.dateFrom.setEnabled)
+        self.cbDateRange.toggled.connect(self.dateTo.setEnabled)
+        self.cbDateRange.toggled.connect(lambda: self.date_timer.start())
+        self.dateFrom.dateChanged.connect(lambda: self.date_timer.start())
+        self.dateTo.dateChanged.connect(lambda: self.date_timer.start())
+
+        # filter changes re-aggregate the cached records
+        self.cbPrecisionMin.currentIndexChanged.connect(self.refresh_results)
+        self.cbPrecisionMax.currentIndexChanged.connect(self.refresh_results)
+        self.cbIncludeNullPrecision.toggled.connect(self.refresh_results)
+        self.cbExcludeSensitive.toggled.connect(self.refresh_results)
+
+    def on_memory_index_built(self, engine, task):
+        """The following queries of the engine use the in-memory spatial index"""
+        engine.spatial_index = task.index
+        self.index_tasks.remove(task)
 
     def populate_ranges(self):
         """Populate the precision fields in the plugin dialog with the unique values"""
-        self.populate_precision_values()
-        self.cbPrecisionMin.addItems(self.precision_values)
-        self.cbPrecisionMax.addItems(self.precision_values)
+        self.cbPrecisionMin.addItems(self.engine.precision.values)
+        self.cbPrecisionMax.addItems(self.engine.precision.values)
 
         # set the highest and the lowest values as default
         self.cbPrecisionMin.setCurrentIndex(0)
         self.cbPrecisionMax.setCurrentIndex(self.cbPrecisionMax.count() - 1)
 
     def search_using_geometry(self, geom):
-        self.geom = geom
-        req = self.build_request()
-        output_dict = self.perform_request(req)
-        self.populate_results(output_dict)
-
-    def build_request(self):
-        # precision filter
-        prec_min = min(self.cbPrecisionMin.currentIndex(), self.cbPrecisionMax.currentIndex())
-        prec_max = max(self.cbPrecisionMin.currentIndex(), self.cbPrecisionMax.currentIndex())
-
-        wanted_list_prec = []
-        for i in range(prec_min, prec_max + 1):
-            wanted_list_prec.append(self.precision_values[i])
-
-        wanted_string_prec = f"""'{"','".join(wanted_list_prec)}'"""
-        precision_filter = f'"{self.precision_field_name}" in ({wanted_string_prec})'
-
-        if self.cbIncludeNullPrecision.isChecked():
-            unwanted_string_prec = f"""'{"','".join(self.precision_unknown_values)}'"""
-            precision_filter = (
-                f"""({precision_filter} or """
-                f""""{self.precision_field_name}" is null or """
-                f""""{self.precision_field_name}" in ({unwanted_string_prec}))"""
-            )
+        """Starts a background query for the geometry, any query still running is cancelled"""
+        self.cancel_query()
+        self.cancel_preview()
+        self.records = None
+        self.selected_geom = geom
+        date_range = self.date_range()
+        self.selection = SelectionGeometry(
+            geom, self.qgsDoubleSpinBoxBuffer.value(), self.qgsDoubleSpinBoxSimplify.value(), date_range
+        )
+        self.timer.reset()
+        self.timer.start("query")
+
+        subsets = "|".join(records_layer.subsetString() for records_layer in self.layers)
+        if date_range:
+            subsets += f"|{date_range}"
+        self.cache_key = cache_key(self.selection.geometry, self.selection.buffer_value, subsets)
+        self.result_cache.validate(tuple(source_fingerprint(records_layer) for records_layer in self.layers))
+        records = self.result_cache.get(self.cache_key)
+        self.show_cache_stats()
+        if records is not None:
+            self.timer.stop("query", fetched=len(records))
+            self.records = records
+            self.refresh_results()
+            return
 
-        # buffer
-        self.buffer_value = self.qgsDoubleSpinBoxBuffer.value()
-
-        # exclusion filter
-        excluded_names = self.excluded_names if self.cbExcludeSensitive.isChecked() else []
-        expression_filter = precision_filter
-        if excluded_names:
-            excluded_names_str = f"""'{"','".join(excluded_names)}'"""
-            excluded_names_filter = f'"{self.name_field_name}" not in ({excluded_names_str})'
-            expression_filter += f" and {excluded_names_filter}"
-
-        return (
-            QgsFeatureRequest()
-            .setDistanceWithin(self.geom, self.buffer_value)
-            .setFilterExpression(expression_filter)
-            .setFlags(QgsFeatureRequest.NoGeometry)
-            .setFlags(QgsFeatureRequest.ExactIntersect)
-            .setSubsetOfAttributes(self.desired_fields, self.layer.fields())
+        if len(self.engines) > 1:
+            task = FederatedQueryTask(self.engines, self.selection, self.current_snapshot(), self.current_pyramid())
+        else:
+            prefilter = None
+            if self.cbLivePreview.isChecked() and not self.selection.tiled:
+                # the ids of the previewed geometry only help if it covers most of the selection
+                prefilter = self.current_prefilter()
+                if not prefilter.overlaps(self.selection.covering):
+                    prefilter = None
+            task = QueryTask(
+                self.engine,
+                self.selection,
+                self.current_snapshot(),
+                prefilter,
+                self.current_pyramid(),
+                QThread.idealThreadCount(),
+            )
+        task.countChanged.connect(self.show_count)
+        task.taskCompleted.connect(lambda: self.on_query_finished(task))
+        task.taskTerminated.connect(lambda: self.on_query_finished(task))
+        self.task = task
+
+        self.model.clear()
+        self.show_count(0)
+        self.show_progress(True)
+        QgsApplication.taskManager().addTask(task)
+
+    def date_range(self):
+        """DateRange selected in the dialog, None when the date range is not used"""
+        if not self.cbDateRange.isChecked():
+            return None
+        return DateRange(self.dateFrom.date().toPyDate(), self.dateTo.date().toPyDate())
+
+    def on_date_range_changed(self):
+        if self.selected_geom is not None:
+            self.search_using_geometry(self.selected_geom)
+
+    def current_snapshot(self):
+        """Snapshot matching the current data of the layer, None while it is missing or being rebuilt"""
+        if not self.snapshot_enabled:
+            return None
+        key = snapshot_key(self.engine)
+        if self.snapshot is None or self.snapshot.key != key:
+            try:
+                self.snapshot = RecordSnapshot.load(self.layer, key)
+            except Exception as e:
+                QgsMessageLog.logMessage(f"Snapshot not loaded: {e}", "NNPA Reporting", Qgis.Warning)
+                self.snapshot = None
+        if self.snapshot is None and self.snapshot_task is None:
+            task = SnapshotBuildTask(self.engine)
+            task.taskCompleted.connect(lambda: self.on_snapshot_built(task))
+            task.taskTerminated.connect(lambda: self.on_snapshot_built(task))
+            self.snapshot_task = task
+            QgsApplication.taskManager().addTask(task)
+        return self.snapshot
+
+    def on_snapshot_built(self, task):
+        """The snapshot is loaded by the next query"""
+        self.snapshot_task = None
+        if task.error:
+            QgsMessageLog.logMessage(f"Snapshot not built: {task.error}", "NNPA Reporting", Qgis.Warning)
+
+    def current_pyramid(self):
+        """Grid pyramid matching the current data of the layer, None while it is loaded, missing or being rebuilt
+
+        The saved pyramid is loaded in the background, it is built if there is none.
+        """
+        if not self.pyramid_enabled:
+            return None
+        key = pyramid_key(self.engine)
+        if self.pyramid is not None and self.pyramid.key == key:
+            return self.pyramid
+        self.pyramid = None
+        if self.pyramid_task is None:
+            task = GridPyramidLoadTask(self.layer, key)
+            task.taskCompleted.connect(lambda: self.on_pyramid_loaded(task))
+            task.taskTerminated.connect(lambda: self.on_pyramid_loaded(task))
+            self.pyramid_task = task
+            QgsApplication.taskManager().addTask(task)
+        return None
+
+    def on_pyramid_loaded(self, task):
+        """The loaded pyramid is used by the next query, the pyramid is built if there is no current one"""
+        self.pyramid_task = None
+        if task.error:
+            QgsMessageLog.logMessage(f"Grid pyramid not loaded: {task.error}", "NNPA Reporting", Qgis.Warning)
+        if task.result is not None:
+            self.pyramid = task.result
+            return
+        build_task = GridPyramidBuildTask(self.engine)
+        build_task.taskCompleted.connect(lambda: self.on_pyramid_built(build_task))
+        build_task.taskTerminated.connect(lambda: self.on_pyramid_built(build_task))
+        self.pyramid_task = build_task
+        QgsApplication.taskManager().addTask(build_task)
+
+    def on_pyramid_built(self, task):
+        """The built pyramid is used by the next query"""
+        self.pyramid_task = None
+        if task.error:
+            QgsMessageLog.logMessage(f"Grid pyramid not built: {task.error}", "NNPA Reporting", Qgis.Warning)
+        self.pyramid = task.pyramid
+
+    def preview_geometry(self, geom):
+        """Starts counting the records of a geometry being drawn, the running preview is dropped"""
+        self.cancel_preview()
+        if self.task:
+            return  # the report of the previous geometry is still running
+        selection = SelectionGeometry(geom, self.qgsDoubleSpinBoxBuffer.value(), self.qgsDoubleSpinBoxSimplify.value())
+        if selection.tiled or selection.geometry.isEmpty():
+            return
+        task = PreviewTask(self.layer, self.current_prefilter(), selection.covering)
+        task.taskCompleted.connect(lambda: self.on_preview_finished(task))
+        task.taskTerminated.connect(lambda: self.on_preview_finished(task))
+        self.preview_task = task
+        QgsApplication.taskManager().addTask(task)
+
+    def cancel_preview(self):
+        if self.preview_task:
+            self.preview_task.cancel()
+            self.preview_task = None
+
+    def on_preview_finished(self, task):
+        if task is not self.preview_task:
+            return  # count of a geometry changed since
+        self.preview_task = None
+        if task.result is None:
+            return
+        self.prefilter = task.result
+        self.lbTotal.setText(f"Preview: {len(task.result)} records")
+
+    def current_prefilter(self):
+        """Record ids of the last previewed geometry, empty if the layer has changed since"""
+        fingerprint = source_fingerprint(self.layer)
+        if self.prefilter is None or fingerprint != self.prefilter_fingerprint:
+            self.prefilter = FidPrefilter()
+            self.prefilter_fingerprint = fingerprint
+        return self.prefilter
+
+    def clear_prefilter(self):
+        self.prefilter = None
+
+    def on_live_preview_toggled(self, checked):
+        QgsSettings().setValue("plugins/nnpa_reporting_plugin/live_preview", checked)
+        if not checked:
+            self.cancel_preview()
+            self.clear_prefilter()
+
+    def cancel_query(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+        self.show_progress(False)
+
+    def on_query_finished(self, task):
+        """Called on the main thread when a query task completes or gets terminated"""
+        if task is not self.task:
+            return  # results of a cancelled query
+        self.task = None
+        self.show_progress(False)
+        if task.result is None or task.isCanceled():
+            self.timer.stop("query")
+            self.lbTotal.setText(f"Query failed: {task.error}" if task.error else "")
+            return
+        self.timer.stop("query", fetched=len(task.result))
+        self.records = task.result
+        if task.prefilter is not None:
+            self.prefilter = task.prefilter
+        self.result_cache.put(self.cache_key, self.records)
+        self.refresh_results()
+
+    def refresh_results(self):
+        """Aggregates the cached records with the current filters, no provider query is needed"""
+        if self.records is None or self.task:
+            return
+        self.populate_results(self.perform_request(self.records))
+        self.show_timing()
+
+    def show_count(self, count):
+        self.lbTotal.setText(f"Scanned: {count}")
+
+    def show_cache_stats(self):
+        cache = self.result_cache
+        self.lbCache.setText(f"Cache: {cache.hits} hits, {cache.misses} misses")
+
+    def show_timing(self):
+        if self.timer.enabled:
+            self.lbTiming.setText(self.timer.summary())
+
+    def show_progress(self, running):
+        self.progressBar.setVisible(running)
+        self.cancelButton.setVisible(running)
+
+    def record_filter(self):
+        """Precision and sensitive species filters selected in the dialog"""
+        return RecordFilter(
+            self.cbPrecisionMin.currentIndex(),
+            self.cbPrecisionMax.currentIndex(),
+            self.cbIncludeNullPrecision.isChecked(),
+            self.excluded_names if self.cbExcludeSensitive.isChecked() else (),
         )
 
-    def perform_request(self, req):
-        """Format the features that are passing through the filter to the desired format"""
-        output_dict = {}
-        for sel_feat in self.layer.getFeatures(req):
-            if sel_feat[self.name_field_name] not in output_dict:
-                # the first occurrence
-                output_dict[sel_feat[self.name_field_name]] = {
-                    "date": [sel_feat[self.date_field_name]],
-                    "grid_refer": [sel_feat[self.grid_refer_field_name]],
-                    "latin_name": sel_feat[self.latin_name_field_name],
-                    "recorder": [sel_feat[self.recorder_field_name]],
-                    "survey_name": [sel_feat[self.survey_field_name]],
-                    "precision_min": sel_feat[self.precision_field_name],
-                    "precision_max": sel_feat[self.precision_field_name],
-                    "count": 1,
-                }
-            else:
-                # the feature is already in the dict -> increase count, update date and precision fields
-                dict_feature = output_dict[sel_feat[self.name_field_name]]
-
-                dict_feature["count"] += 1
-                dict_feature["date"].append(sel_feat[self.date_field_name])
-                dict_feature["grid_refer"].append(sel_feat[self.grid_refer_field_name])
-                dict_feature["recorder"].append(sel_feat[self.recorder_field_name])
-                dict_feature["survey_name"].append(sel_feat[self.survey_field_name])
-
-                try:
-                    if not dict_feature["precision_max"] or self.precision_values.index(
-                            str(sel_feat[self.precision_field_name])) > self.precision_values.index(
-                            str(dict_feature["precision_max"])):
-                        dict_feature["precision_max"] = sel_feat[self.precision_field_name]
-                except ValueError:
-                    pass
-
-                try:
-                    if not dict_feature["precision_min"] or self.precision_values.index(
-                            str(sel_feat[self.precision_field_name])) < self.precision_values.index(
-                            str(dict_feature["precision_min"])):
-                        dict_feature["precision_min"] = sel_feat[self.precision_field_name]
-                except ValueError:
-                    pass
-
-        return output_dict
+    @timed_phase("aggregation")
+    def perform_request(self, records):
+        """Aggregates the cached records passing the filters selected in the dialog"""
+        return records.aggregate(self.record_filter(), MAX_DISTINCT_VALUES)
 
+    @timed_phase("tree")
     def populate_results(self, feature_dict):
-        """Display the selected features in the tree widget"""
-        self.treeResults.clear()
-
-        root_item = self.treeResults.invisibleRootItem()
-        for key, value in feature_dict.items():
-            item = TreeWidgetItem(
-                [
-                    key,
-                    str(value["count"]),
-                    ", ".join(set(value["date"])),
-                    str(value["precision_min"]),
-                    str(value["precision_max"]),
-                    ", ".join(set(value["grid_refer"])),
-                    value["latin_name"],
-                    ", ".join(set(value["recorder"])),
-                    ", ".join(set(value["survey_name"])),
-                ]
-            )
-            root_item.addChild(item)
+        """Display the aggregated species in the results view, the cell texts are computed when displayed"""
+        self.model.set_results(feature_dict, self.records, self.record_filter())
+        header = self.treeResults.header()
+        self.treeResults.sortByColumn(header.sortIndicatorSection(), header.sortIndicatorOrder())
 
-        total_count = sum(item["count"] for item in feature_dict.values())
-        self.treeResults.expandItem(root_item)
+        total_count = sum(item.count for item in feature_dict.values())
+        self.timer.count(matched=total_count)
         self.lbTotal.setText(f"Total: {total_count}")
         self.show_and_activate()
 
-    def populate_precision_values(self):
-        """Populates a sorted list of unique precision values from the layer
-        ['100m', '1km', '10km', etc.]"""
-        fields = self.layer.fields()
-        precision_idx = fields.indexFromName(self.precision_field_name)
-        unique_list = self.layer.uniqueValues(precision_idx)
-
-        precision_dict = {}
-        for value in unique_list:
-            try:
-                string_value = str(value)
-                meters = string_value.upper().replace("KM", "000").replace("M", "").replace(" ", "")
-                meters = float(meters)
-            except (ValueError, TypeError):  # handle not identified values
-                self.precision_unknown_values.add(string_value)
-                continue
-            except AttributeError:  # ignore null values
-                continue
-
-            precision_dict[meters] = string_value
-
-        self.precision_values = [v[1] for v in sorted(precision_dict.items())]
-
     def show_and_activate(self):
         self.show()
         self.activateWindow()
 
-    def load_results_as_layer(self):
-        root_item = self.treeResults.invisibleRootItem()
-        if root_item.childCount() == 0:
+    def run_batch_report(self):
+        """Reports every polygon of a sites layer with the current buffer and filters"""
+        if self.batch_task:
+            return
+        dlg = BatchDialog(self)
+        if dlg.exec() != QDialog.Accepted:
+            return
+        sites = dlg.sites(self.layer.crs())
+        if not sites:
             return
 
-        if self.buffer_value:
-            geom = self.geom.buffer(self.buffer_value, 20)
-        else:
-            geom = self.geom
-
-        if geom.type() == Qgis.GeometryType.Point:
-            vl = QgsVectorLayer("Point", "query_results", "memory")
-        else:
-            vl = QgsVectorLayer("Polygon", "query_results", "memory")
-
-        vl.setCrs(self.layer.crs())
-        dp = vl.dataProvider()
-        dp.addAttributes(
-            [
-                QgsField("Common Name", QVariant.String),
-                QgsField("Count", QVariant.Int),
-                QgsField("Observation Date", QVariant.String),
-                QgsField("Precision Min", QVariant.String),
-                QgsField("Precision Max", QVariant.String),
-                QgsField("Grid Reference", QVariant.String),
-                QgsField("Latin Name", QVariant.String),
-                QgsField("Sample Recorder", QVariant.String),
-                QgsField("Survey Name", QVariant.String),
-            ]
+        task = BatchReportTask(
+            self.engine,
+            sites,
+            self.qgsDoubleSpinBoxBuffer.value(),
+            self.record_filter(),
+            MAX_DISTINCT_VALUES,
+            self.date_range(),
         )
-        vl.updateFields()
+        site_id_field = dlg.site_id_field
+        task.taskCompleted.connect(lambda: self.on_batch_finished(task, site_id_field))
+        task.taskTerminated.connect(lambda: self.on_batch_finished(task, site_id_field))
+        self.batch_task = task
+        self.batchReportButton.setEnabled(False)
+        QgsApplication.taskManager().addTask(task)
+
+    def on_batch_finished(self, task, site_id_field):
+        self.batch_task = None
+        self.batchReportButton.setEnabled(True)
+        if task.status() != QgsTask.Complete:
+            self.lbTotal.setText("Batch report cancelled")
+            return
+        QgsProject.instance().addMapLayer(results_table(task.results, site_id_field))
+        for site_id, error in task.failures.items():
+            QgsMessageLog.logMessage(f"Batch report of site {site_id} failed: {error}", "NNPA Reporting", Qgis.Warning)
+        failed = f", {len(task.failures)} failed, see the message log" if task.failures else ""
+        self.lbTotal.setText(f"Batch report: {len(task.results)} sites{failed}")
+
+    def results_export(self):
+        """Export of the displayed results, None if there are no results or the export is not possible"""
+        if not self.model.results:
+            return None
 
-        root_item = self.treeResults.invisibleRootItem()
-        for i in range(root_item.childCount()):
-            item = root_item.child(i)
-            f = QgsFeature(dp.fields())
-            f.setAttributes([item.text(i) for i in range(9)])
-            f.setGeometry(geom)
-            dp.addFeature(f)
+        try:
+            return ResultsExport(
+                self.layer,
+                self.model.results,
+                self.records,
+                self.model.record_filter,
+                self.selection.buffered,
+                self.cbRecordGeometries.isChecked(),
+            )
+        except ExportError as e:
+            self.lbTotal.setText(f"Export failed: {e}")
+            return None
 
-        QgsProject.instance().addMapLayer(vl)
+    @timed_phase("export")
+    def load_results_as_layer(self):
+        export = self.results_export()
+        if export:
+            QgsProject.instance().addMapLayer(export.to_memory_layer())
+
+    @timed_phase("export")
+    def export_results(self):
+        """Writes the results to a GeoPackage or CSV file without creating a layer"""
+        export = self.results_export()
+        if not export:
+            return
+        file_filter = "GeoPackage (*.gpkg);;CSV Files (*.csv)"
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export results", "", file_filter)
+        if not file_name:
+            return
+        try:
+            count = export.to_file(file_name)
+        except ExportError as e:
+            self.lbTotal.setText(f"Export failed: {e}")
+            return
+        self.lbTotal.setText(f"Exported {count} features to {path.basename(file_name)}")
 
     def clearResults(self):
-        self.treeResults.clear()
+        self.date_timer.stop()
+        self.selected_geom = None
+        self.cancel_query()
+        self.cancel_preview()
+        self.records = None
+        self.model.clear()
         self.lbTotal.clear()
+        self.lbTiming.clear()
 
 
-class TreeWidgetItem(QTreeWidgetItem):
-    """Custom class to enable sorting 'Count' column - integers converted to string"""
-
-    def __init__(self, parent=None):
-        QTreeWidgetItem.__init__(self, parent)
-
-    def __lt__(self, other_item):
-        column = self.treeWidget().sortColumn()
-        try:
-            return float(self.text(column)) > float(other_item.text(column))
-        except ValueError:
-            return self.text(column) > other_item.text(column)
+def log_timing(message):
+    QgsMessageLog.logMessage(message, "NNPA Reporting", Qgis.Info)
@@ -0,0 +1,71 @@
+import math
+
+try:
+    import numpy
+except ImportError:  # optional, the snapshot mode is not available without NumPy
+    numpy = None
+
+# number of children of each node of the packed R-tree
+NODE_SIZE = 64
+
+
+def expand_ranges(starts, ends):
+    """Concatenated ranges [start, end) of the arrays of starts and ends"""
+    lengths = ends - starts
+    offsets = numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths)
+    return offsets + numpy.arange(lengths.sum())
+
+
+def str_order(xmin, ymin, xmax, ymax):
+    """Sort-Tile-Recursive order of boxes: vertical slices by center x, each slice sorted by center y"""
+    count = len(xmin)
+    cx = (xmin + xmax) / 2
+    cy = (ymin + ymax) / 2
+    slice_size = NODE_SIZE * math.ceil(math.sqrt(math.ceil(count / NODE_SIZE)))
+    order = numpy.argsort(cx, kind="stable")
+    for start in range(0, count, max(slice_size, 1)):
+        part = order[start : start + slice_size]
+        order[start : start + slice_size] = part[numpy.argsort(cy[part], kind="stable")]
+    return order
+
+
+def intersecting(boxes, candidates, rect):
+    """Candidates whose box intersects the rectangle, `boxes` are the (xmin, ymin, xmax, ymax) arrays"""
+    xmin, ymin, xmax, ymax = (b[candidates] for b in boxes)
+    return candidates[
+        (xmin <= rect.xMaximum()) & (xmax >= rect.xMinimum()) & (ymin <= rect.yMaximum()) & (ymax >= rect.yMinimum())
+    ]
+
+
+class PackedIndex:
+    """Packed R-tree of boxes saved in STR order
+
+    Each node covers NODE_SIZE consecutive entries of the level below, so the tree is just the
+    bounding box arrays of each level. A query tests all the children of the intersecting nodes
+    of a level at once, from the root down to the records.
+    """
+
+    def __init__(self, boxes):
+        self.levels = [boxes]  # from the records up to the root
+        while len(self.levels[-1][0]) > NODE_SIZE:
+            xmin, ymin, xmax, ymax = self.levels[-1]
+            starts = numpy.arange(0, len(xmin), NODE_SIZE)
+            self.levels.append(
+                (
+                    numpy.minimum.reduceat(xmin, starts),
+                    numpy.minimum.reduceat(ymin, starts),
+                    numpy.maximum.reduceat(xmax, starts),
+                    numpy.maximum.reduceat(ymax, starts),
+                )
+            )
+
+    def query(self, rect):
+        """Positions of the records whose box intersects the rectangle, in increasing order"""
+        candidates = numpy.arange(len(self.levels[-1][0]))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            candidates = intersecting(self.levels[depth], candidates, rect)
+            if depth:
+                starts = candidates * NODE_SIZE
+                ends = numpy.minimum(starts + NODE_SIZE, len(self.levels[depth - 1][0]))
+                candidates = expand_ranges(starts, ends)
+        return candidates
@@ -0,0 +1,54 @@
+# rank of the NULL and unrecognised precision values, lower than any valid precision
+UNKNOWN_RANK = -1
+
+
+def precision_in_meters(value):
+    """Parses a precision value ('100m', '1km', 10000, ...) to meters, raises ValueError for invalid values"""
+    string_value = str(value)
+    meters = string_value.upper().replace("KM", "000").replace("M", "").replace(" ", "")
+    return float(meters)
+
+
+class PrecisionDomain:
+    """Precision values of a layer sorted from the most to the least precise with a rank lookup
+
+    The ranks are the positions in the sorted `values` list. The lookup is keyed by the raw
+    attribute values as well as their string representations, so that the per-record cost does not
+    depend on the number of precision categories and no string conversion is needed.
+    """
+
+    def __init__(self, unique_values=()):
+        self.values = []
+        self.unknown_values = set()
+        self.ranks = {}
+
+        precision_dict = {}
+        raw_values = {}
+        for value in unique_values:
+            string_value = str(value)
+            try:
+                meters = precision_in_meters(value)
+            except (ValueError, TypeError):  # handle not identified values
+                self.unknown_values.add(string_value)
+                continue
+            except AttributeError:  # ignore null values
+                continue
+
+            # values of the same size ('1km', '1000m', 1000) share the rank of the first one
+            precision_dict.setdefault(meters, string_value)
+            raw_values.setdefault(meters, []).append(value)
+
+        sorted_values = sorted(precision_dict.items())
+        self.values = [string_value for _, string_value in sorted_values]
+        for rank, (meters, string_value) in enumerate(sorted_values):
+            self.ranks[string_value] = rank
+            for value in raw_values[meters]:
+                self.ranks[value] = rank
+                self.ranks.setdefault(str(value), rank)
+
+    def rank(self, value):
+        """Rank of a raw attribute value, UNKNOWN_RANK for NULL and invalid values"""
+        try:
+            return self.ranks.get(value, UNKNOWN_RANK)
+        except TypeError:  # unhashable NULL variant
+            return UNKNOWN_RANK
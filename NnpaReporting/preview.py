@@ -0,0 +1,103 @@
+from qgis.core import QgsFeatureRequest, QgsFeedback, QgsTask, QgsVectorLayerFeatureSource
+
+from .selection import SelectionTile
+
+# minimum part of the new geometry covered by the previous one to update its ids instead of querying them again
+PREFILTER_MIN_OVERLAP = 0.5
+
+
+def matching_ids(source, geom, feedback=None):
+    """Ids of the records intersecting the geometry, neither their geometry nor their attributes are returned"""
+    request = (
+        QgsFeatureRequest()
+        .setDistanceWithin(geom, 0)
+        .setFlags(QgsFeatureRequest.NoGeometry | QgsFeatureRequest.ExactIntersect)
+        .setNoAttributes()
+    )
+    if feedback:
+        request.setFeedback(feedback)
+    return {feature.id() for feature in source.getFeatures(request)}
+
+
+class FidPrefilter:
+    """Ids of the records matching a geometry, updated from the previous geometry when it changes
+
+    While a polygon is drawn most of the new geometry is covered by the previous one, so only the
+    differences are queried: the records of the newly covered part are added, and the previous
+    records reaching the uncovered part are kept only if they still intersect the new geometry.
+    The geometry is the covering buffer of the selection (`SelectionGeometry.covering`), so the ids
+    may include records just outside the buffer distance, the query tests the records read by id.
+
+    A prefilter is never modified, `updated` returns a new one, so that a preview task cancelled
+    while still running does not affect the ids of the last completed one.
+    """
+
+    def __init__(self, geometry=None, fids=frozenset()):
+        self.geometry = geometry
+        self.fids = fids
+
+    def __len__(self):
+        return len(self.fids)
+
+    def overlaps(self, geom):
+        if self.geometry is None or geom.area() <= 0:
+            return False
+        return self.geometry.intersection(geom).area() >= PREFILTER_MIN_OVERLAP * geom.area()
+
+    def updated(self, source, geom, feedback=None):
+        """Prefilter of the geometry, None if cancelled, may run in a task thread"""
+        if self.geometry is not None and self.geometry.isGeosEqual(geom):
+            return self
+        if not self.overlaps(geom):
+            fids = matching_ids(source, geom, feedback)
+        else:
+            fids = set(self.fids)
+            uncovered = self.geometry.difference(geom)
+            if not uncovered.isEmpty():
+                tile = SelectionTile(geom)
+                request = (
+                    QgsFeatureRequest()
+                    .setDistanceWithin(uncovered, 0)
+                    .setFlags(QgsFeatureRequest.ExactIntersect)
+                    .setNoAttributes()
+                )
+                if feedback:
+                    request.setFeedback(feedback)
+                for feature in source.getFeatures(request):
+                    if feature.id() in fids and not tile.intersects(feature.geometry()):
+                        fids.discard(feature.id())
+            added = geom.difference(self.geometry)
+            if not added.isEmpty():
+                fids.update(matching_ids(source, added, feedback))
+        if feedback and feedback.isCanceled():
+            return None
+        return FidPrefilter(geom, frozenset(fids))
+
+
+class PreviewTask(QgsTask):
+    """Background task counting the records of a geometry being drawn
+
+    The updated FidPrefilter is available in `result` once the task has completed, None if it was
+    cancelled because the geometry changed again.
+    """
+
+    def __init__(self, layer, prefilter, geom):
+        super().__init__("NNPA Reporting preview", QgsTask.CanCancel | QgsTask.Silent)
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.prefilter = prefilter
+        self.geom = geom
+        self.feedback = QgsFeedback()
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.prefilter.updated(self.source, self.geom, self.feedback)
+        except Exception as e:  # exceptions must not escape the task manager thread
+            self.error = str(e)
+            return False
+        return self.result is not None
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
@@ -0,0 +1,19 @@
+from qgis.core import QgsProcessingProvider
+
+from .report_algorithm import SpeciesReportAlgorithm
+
+
+class NnpaReportingProvider(QgsProcessingProvider):
+    """Processing provider of the NNPA Reporting algorithms"""
+
+    def id(self):
+        return "nnpa_reporting"
+
+    def name(self):
+        return "NNPA Reporting"
+
+    def longName(self):
+        return self.name()
+
+    def loadAlgorithms(self):
+        self.addAlgorithm(SpeciesReportAlgorithm())
@@ -0,0 +1,246 @@
+import json
+
+from qgis.core import NULL, QgsDataSourceUri, QgsExpression, QgsFeatureSource, QgsProviderRegistry
+
+from .aggregator import DISTINCT_FIELDS, DateParser, SpeciesAggregate
+from .precision import UNKNOWN_RANK
+from .record_cache import GroupedRecords
+
+# providers able to run the grouped species query on their side
+SQL_PROVIDERS = ("postgres", "spatialite", "ogr")
+
+
+def supports_grouped_query(layer):
+    """Returns True if the species aggregation can be pushed down to the layer's data provider"""
+    if layer.isModified():  # uncommitted edits are only visible to the feature iterators
+        return False
+    return is_database_layer(layer)
+
+
+def is_database_layer(layer):
+    """Returns True if the layer is a table of a database able to run SQL queries"""
+    provider = layer.providerType()
+    if provider == "ogr":
+        return layer.dataProvider().storageType() == "GPKG"
+    return provider in SQL_PROVIDERS
+
+
+def table_location(layer):
+    """(connection uri, schema, table) of a database layer"""
+    uri = layer.dataProvider().dataSourceUri()
+    if layer.providerType() == "ogr":
+        decoded = QgsProviderRegistry.instance().decodeUri("ogr", uri)
+        return decoded["path"], "", decoded.get("layerName")
+    decoded = QgsDataSourceUri(uri)
+    return uri, decoded.schema(), decoded.table()
+
+
+def indexed_columns(layer):
+    """Names of the columns starting an index of a database layer's table, None if they are not known"""
+    if not is_database_layer(layer):
+        return None
+    connection_uri, schema, table = table_location(layer)
+    if not table or table.startswith("("):  # postgres query layer
+        return None
+    if layer.providerType() == "postgres":
+        table_ref = f"{quoted_column(schema)}.{quoted_column(table)}" if schema else quoted_column(table)
+        sql = (
+            "SELECT a.attname FROM pg_index i JOIN pg_attribute a "
+            "ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0] "
+            f"WHERE i.indrelid = {quoted_value(table_ref)}::regclass"
+        )
+    else:
+        sql = (
+            f"SELECT ii.name FROM pragma_index_list({quoted_value(table)}) AS il, "
+            "pragma_index_info(il.name) AS ii WHERE ii.seqno = 0"
+        )
+    metadata = QgsProviderRegistry.instance().providerMetadata(layer.providerType())
+    conn = metadata.createConnection(connection_uri, {})
+    return {row[0] for row in conn.executeSql(sql)}
+
+
+def quoted_column(name):
+    return QgsExpression.quotedColumnRef(name)
+
+
+def quoted_value(value):
+    return QgsExpression.quotedString(str(value))
+
+
+def is_null(value):
+    return value is None or value == NULL
+
+
+class GroupedQuery:
+    """Species aggregation running as a single spatially filtered GROUP BY query in the data provider
+
+    The records are grouped by species and precision value, the returned `GroupedRecords` can
+    then be filtered by precision and species name and merged to the same results as the ones
+    built from the features, without querying the provider again.
+    All the layer properties are read in the constructor, `execute` may run in a task thread.
+
+    :param date_condition: SQL condition of the queried date range, see `ReportingEngine.date_expression`
+    """
+
+    def __init__(self, layer, fields, precision_domain, geom, buffer_value, date_condition=None):
+        self.provider = layer.providerType()
+        self.fields = dict(fields)
+        self.precision = precision_domain
+        self.precision_values = list(precision_domain.values)
+        self.numeric_precision = layer.fields().field(self.fields["precision"]).isNumeric()
+        self.wkt = geom.asWkt()
+        self.bbox = geom.boundingBox().buffered(buffer_value)
+        self.buffer_value = buffer_value
+        self.subset = layer.subsetString()
+        self.date_condition = date_condition
+        self.has_spatial_index = layer.hasSpatialIndex() == QgsFeatureSource.SpatialIndexPresent
+        self.uri = layer.dataProvider().dataSourceUri()
+        self.srid = layer.crs().postgisSrid()
+        self.connection_uri, self.schema, self.table = table_location(layer)
+
+        if self.provider == "ogr":
+            self.geometry_column = None  # read from the GeoPackage metadata tables
+            self.primary_key = "fid"
+        else:
+            uri = QgsDataSourceUri(self.uri)
+            self.geometry_column = uri.geometryColumn()
+            self.primary_key = uri.keyColumn()
+
+    def execute(self, feedback=None):
+        """Runs the query, raises an exception if the provider is not able to run it"""
+        if not self.table:
+            raise ValueError("Unable to determine the table name of the layer")
+
+        metadata = QgsProviderRegistry.instance().providerMetadata(self.provider)
+        conn = metadata.createConnection(self.connection_uri, {})
+        if self.provider == "ogr":
+            self.read_geopackage_metadata(conn, feedback)
+
+        rows = conn.executeSql(self.sql(), feedback)
+        if feedback and feedback.isCanceled():
+            return None
+        return self.rows_to_groups(rows)
+
+    def read_geopackage_metadata(self, conn, feedback):
+        table = quoted_value(self.table)
+        rows = conn.executeSql(
+            f"SELECT column_name, srs_id FROM gpkg_geometry_columns WHERE table_name = {table}", feedback
+        )
+        if not rows:
+            raise ValueError(f"Table {self.table} has no geometry column")
+        self.geometry_column, self.srid = rows[0][0], rows[0][1]
+        rows = conn.executeSql(f"SELECT name FROM pragma_table_info({table}) WHERE pk > 0", feedback)
+        if rows:
+            self.primary_key = rows[0][0]
+
+    @property
+    def table_ref(self):
+        if self.table.startswith("("):  # postgres query layer
+            return f"{self.table} AS t"
+        if self.schema:
+            return f"{quoted_column(self.schema)}.{quoted_column(self.table)}"
+        return quoted_column(self.table)
+
+    def sql(self):
+        name = quoted_column(self.fields["name"])
+        latin_name = quoted_column(self.fields["latin_name"])
+        precision = quoted_column(self.fields["precision"])
+
+        # precision min/max are evaluated on the rank of the value in the sorted precision list
+        rank_cases = " ".join(f"WHEN {precision} = {value} THEN {rank}" for value, rank in self.rank_literals())
+        rank = f"CASE {rank_cases} END" if rank_cases else "NULL"
+
+        columns = [
+            name,
+            precision,
+            "COUNT(*)",
+            f"MIN({latin_name})",
+            f"MIN({rank})",
+        ]
+        for key in DISTINCT_FIELDS:
+            columns.append(self.distinct_values(quoted_column(self.fields[key])))
+
+        where = " AND ".join(f"({condition})" for condition in self.conditions())
+        return f"SELECT {', '.join(columns)} FROM {self.table_ref} WHERE {where} GROUP BY {name}, {precision}"
+
+    def distinct_values(self, column):
+        """Aggregate returning the distinct values of the column as a JSON array"""
+        if self.provider == "postgres":
+            return f"json_agg(DISTINCT {column})::text"
+        return f"json_group_array(DISTINCT {column})"
+
+    def conditions(self):
+        conditions = []
+        if self.subset:
+            conditions.append(self.subset)
+        if self.date_condition:
+            conditions.append(self.date_condition)
+        conditions.extend(self.spatial_conditions())
+        return conditions
+
+    def spatial_conditions(self):
+        geometry = quoted_column(self.geometry_column)
+        wkt = quoted_value(self.wkt)
+        rect = self.bbox
+        if self.provider == "postgres":
+            return [f"ST_DWithin({geometry}, ST_GeomFromText({wkt}, {self.srid}), {self.buffer_value})"]
+
+        selection = f"GeomFromText({wkt}, {self.srid})"
+        if self.buffer_value:
+            selection = f"ST_Buffer({selection}, {self.buffer_value})"
+        conditions = [f"ST_Intersects({geometry}, {selection}) = 1"]
+        if not self.has_spatial_index:
+            return conditions
+
+        # SQLite based formats do not use the spatial index implicitly
+        if self.provider == "ogr":
+            rtree = quoted_column(f"rtree_{self.table}_{self.geometry_column}")
+            conditions.append(
+                f"{quoted_column(self.primary_key)} IN (SELECT id FROM {rtree} WHERE "
+                f"minx <= {rect.xMaximum()} AND maxx >= {rect.xMinimum()} AND "
+                f"miny <= {rect.yMaximum()} AND maxy >= {rect.yMinimum()})"
+            )
+        else:
+            conditions.append(
+                f"ROWID IN (SELECT ROWID FROM SpatialIndex WHERE f_table_name = {quoted_value(self.table)} AND "
+                f"f_geometry_column = {quoted_value(self.geometry_column)} AND search_frame = "
+                f"BuildMbr({rect.xMinimum()}, {rect.yMinimum()}, {rect.xMaximum()}, {rect.yMaximum()}))"
+            )
+        return conditions
+
+    def rows_to_groups(self, rows):
+        groups = GroupedRecords(self.precision.rank)
+        date_key = DateParser()
+        for row in rows:
+            name, raw_precision, count, latin_name, rank = row[:5]
+            precision, rank = self.precision_value(rank, raw_precision)
+            partial = SpeciesAggregate(latin_name, precision, rank)
+            partial.count = int(count)
+            for key, distinct in zip(DISTINCT_FIELDS, row[5:]):
+                getattr(partial, key).update(v for v in json.loads(distinct) if v is not None)
+            for date in partial.date:
+                partial.update_dates(date_key(date))
+            groups.add_group(None if is_null(name) else name, rank, partial)
+        return groups
+
+    def rank_literals(self):
+        """(SQL literal, rank) of the precision values of the field's type
+
+        The domain may be shared with other layers, only the raw values of the same type as the
+        field are compared, a numeric field compared to '100m' would fail.
+        """
+        literals = {}
+        for value, rank in self.precision.ranks.items():
+            if isinstance(value, bool):
+                continue
+            if self.numeric_precision and isinstance(value, (int, float)):
+                literals.setdefault(repr(value), rank)
+            elif not self.numeric_precision and isinstance(value, str):
+                literals.setdefault(quoted_value(value), rank)
+        return literals.items()
+
+    def precision_value(self, rank, raw_precision):
+        """Precision value and rank, falls back to the raw value when there is no valid precision"""
+        if is_null(rank):
+            return (None if is_null(raw_precision) else raw_precision), UNKNOWN_RANK
+        return self.precision_values[int(rank)], int(rank)
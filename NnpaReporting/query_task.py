@@ -0,0 +1,222 @@
+from qgis.core import QgsFeedback, QgsTask, QgsVectorLayerFeatureSource
+from qgis.PyQt.QtCore import pyqtSignal
+
+from .record_cache import FederatedRecords, RecordCache
+
+
+class QueryTask(QgsTask):
+    """Background task fetching the records matching a geometry with a ReportingEngine
+
+    The feature source and the grouped query are created from the layer on the main thread,
+    everything else, including the preparation of the selection geometry, runs in the task
+    manager thread. The collected records are
+    available in `result` once the task has completed.
+
+    When the provider supports it, the aggregation is first pushed down to the data provider,
+    the features are only fetched and collected in Python if the provider fails to run it. When
+    a current RecordSnapshot of the layer is given, the records are read from it instead. When the
+    FidPrefilter of a previewed geometry is given, it is updated to the selection and the records
+    are read by id, the updated prefilter is kept in `prefilter`. When a current GridPyramid of the
+    layer is given, the grid squares inside the selection are answered from it first.
+
+    When the features have to be scanned and the selection holds many records, its extent is
+    split in up to `workers` partitions scanned by parallel PartitionTask sub-tasks, the records
+    they both return are kept once.
+    """
+
+    countChanged = pyqtSignal(int)
+
+    # number of features between two `countChanged` notifications
+    COUNT_INTERVAL = 1000
+
+    def __init__(self, engine, selection, snapshot=None, prefilter=None, pyramid=None, workers=1):
+        super().__init__("NNPA Reporting query", QgsTask.CanCancel)
+        self.engine = engine
+        self.source = QgsVectorLayerFeatureSource(engine.layer)
+        self.selection = selection
+        self.snapshot = snapshot
+        # the grid square aggregates include the records of every date
+        self.pyramid = None if selection.date_range else pyramid
+        self.prefilter = None if snapshot else prefilter
+        self.sql_query = None
+        if not snapshot and prefilter is None:
+            self.sql_query = engine.grouped_query(selection.geometry, selection.buffer_value, selection.date_range)
+        # partitions of a large selection, when its features are scanned
+        self.partitions = []
+        paths = (snapshot, self.pyramid, self.prefilter, self.sql_query, engine.spatial_index)
+        if workers > 1 and all(path is None for path in paths):
+            rects = engine.partitions(selection, workers)
+            if len(rects) > 1:
+                self.partitions = [PartitionTask(engine, selection, rect) for rect in rects]
+        self.counts = [0] * len(self.partitions)
+        for i, partition in enumerate(self.partitions):
+            partition.countChanged.connect(lambda count, i=i: self.on_partition_count_changed(i, count))
+            self.addSubTask(partition, [], QgsTask.ParentDependsOnSubTask)
+        self.feedback = QgsFeedback()
+        self.count = 0
+        self.result = None
+        self.query_error = None
+
+    @property
+    def error(self):
+        """Error of the query or of a failed partition, the task manager terminates the query without running it then"""
+        return self.query_error or next((partition.error for partition in self.partitions if partition.error), None)
+
+    def on_partition_count_changed(self, i, count):
+        self.counts[i] = count
+        self.countChanged.emit(sum(self.counts))
+
+    def run(self):
+        if self.partitions:
+            parts = [partition.result for partition in self.partitions]
+            if any(part is None for part in parts):
+                return False
+            self.result = RecordCache.merged(self.engine.precision.rank, parts)
+            self.count = len(self.result)
+            self.countChanged.emit(self.count)
+            return not self.isCanceled()
+
+        if self.pyramid:
+            try:
+                self.result = self.pyramid.fetch(self.selection, self.engine, self.source, self.feedback)
+            except Exception as e:  # exceptions must not escape the task manager thread
+                self.query_error = str(e)
+                return False
+            if self.result is not None:
+                self.count = len(self.result)
+                self.countChanged.emit(self.count)
+                return not self.isCanceled()
+            if self.isCanceled():
+                return False
+
+        if self.snapshot:
+            try:
+                self.result = self.snapshot.fetch(
+                    self.selection, self.source, self.engine.precision.rank, self.feedback
+                )
+            except Exception as e:  # exceptions must not escape the task manager thread
+                self.query_error = str(e)
+                return False
+            if self.result is not None:
+                self.count = len(self.result)
+                self.countChanged.emit(self.count)
+            return not self.isCanceled()
+
+        if self.sql_query:
+            self.result = self.engine.run_grouped_query(self.sql_query, self.feedback)
+            if self.result is not None:
+                return not self.isCanceled()
+
+        try:
+            fids = None
+            if self.prefilter is not None:
+                self.prefilter = self.prefilter.updated(self.source, self.selection.covering, self.feedback)
+                if self.prefilter is None:
+                    return False
+                fids = self.prefilter.fids
+            self.result = self.engine.collect_records(self.features(fids))
+        except Exception as e:  # exceptions must not escape the task manager thread
+            self.query_error = str(e)
+            return False
+        return not self.isCanceled()
+
+    def cancel(self):
+        self.feedback.cancel()
+        for partition in self.partitions:
+            partition.feedback.cancel()
+        super().cancel()
+
+    def features(self, fids=None):
+        """Iterates the matching features, stops early when the task gets cancelled"""
+        for feature in self.engine.features(self.selection, self.source, self.feedback, fids):
+            if self.isCanceled():
+                return
+            self.count += 1
+            if self.count % self.COUNT_INTERVAL == 0:
+                self.countChanged.emit(self.count)
+            yield feature
+        self.countChanged.emit(self.count)
+
+
+class PartitionTask(QgsTask):
+    """Collects the records matching a selection in a partition of its extent, a sub-task of QueryTask
+
+    Each partition reads the records through its own feature source, the collected RecordCache is
+    available in `result` once the task has completed.
+    """
+
+    countChanged = pyqtSignal(int)
+
+    def __init__(self, engine, selection, rect):
+        super().__init__("NNPA Reporting query partition", QgsTask.CanCancel)
+        self.engine = engine
+        self.source = QgsVectorLayerFeatureSource(engine.layer)
+        self.selection = selection
+        self.rect = rect
+        self.feedback = QgsFeedback()
+        self.count = 0
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.engine.collect_records(self.features())
+        except Exception as e:  # exceptions must not escape the task manager thread
+            self.error = str(e)
+            return False
+        return not self.isCanceled()
+
+    def features(self):
+        """Iterates the matching features of the partition, stops early when the task gets cancelled"""
+        for feature in self.engine.partition_features(self.selection, self.rect, self.source, self.feedback):
+            if self.isCanceled():
+                return
+            self.count += 1
+            if self.count % QueryTask.COUNT_INTERVAL == 0:
+                self.countChanged.emit(self.count)
+            yield feature
+        self.countChanged.emit(self.count)
+
+
+class FederatedQueryTask(QgsTask):
+    """Queries the same selection in several records layers, one parallel QueryTask sub-task per layer
+
+    The selection is made in the CRS of the first engine's layer, it is transformed to the CRS of
+    each other layer. Each sub-task reads its layer through its own feature source. Once they have
+    all completed, `result` holds their records as FederatedRecords, aggregated with the shared
+    precision domain of the engines (see `federated_engines`).
+
+    :param snapshot: RecordSnapshot of the first engine's layer, if current
+    :param pyramid: GridPyramid of the first engine's layer, if current
+    """
+
+    countChanged = pyqtSignal(int)
+
+    def __init__(self, engines, selection, snapshot=None, pyramid=None):
+        super().__init__("NNPA Reporting query", QgsTask.CanCancel)
+        self.precision_rank = engines[0].precision.rank
+        crs = engines[0].layer.crs()
+        self.queries = [QueryTask(engines[0], selection, snapshot, pyramid=pyramid)] + [
+            QueryTask(engine, engine.layer_selection(selection, crs)) for engine in engines[1:]
+        ]
+        self.counts = [0] * len(self.queries)
+        for i, query in enumerate(self.queries):
+            query.countChanged.connect(lambda count, i=i: self.on_count_changed(i, count))
+            self.addSubTask(query, [], QgsTask.ParentDependsOnSubTask)
+        self.prefilter = None  # the live count only previews the first layer
+        self.result = None
+
+    @property
+    def error(self):
+        return next((query.error for query in self.queries if query.error), None)
+
+    def on_count_changed(self, i, count):
+        self.counts[i] = count
+        self.countChanged.emit(sum(self.counts))
+
+    def run(self):
+        parts = [query.result for query in self.queries]
+        if any(part is None for part in parts):
+            return False
+        self.result = FederatedRecords(self.precision_rank, parts)
+        return not self.isCanceled()
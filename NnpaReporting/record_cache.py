@@ -0,0 +1,214 @@
+import sys
+from array import array
+
+from .aggregator import DISTINCT_FIELDS, RECORD_FIELDS, SpeciesAggregator, comparable_date
+
+
+def array_size(a):
+    return a.buffer_info()[1] * a.itemsize
+
+
+class DictionaryColumn:
+    """Dictionary encoded column, each distinct value is stored once and the records keep its code"""
+
+    __slots__ = ("values", "index", "codes")
+
+    def __init__(self):
+        self.values = []
+        self.index = {}
+        self.codes = array("i")
+
+    def append(self, value):
+        self.codes.append(self.code(value))
+
+    def code(self, value):
+        """Code of a value, added to the distinct values if new"""
+        try:
+            code = self.index.get(value)
+        except TypeError:  # unhashable NULL variant
+            value = None
+            code = self.index.get(value)
+        if code is None:
+            code = len(self.values)
+            self.index[value] = code
+            self.values.append(value)
+        return code
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def memory_size(self):
+        """Estimated size in bytes"""
+        values_size = sum(sys.getsizeof(v) for v in self.values)
+        # the index dictionary references the same values
+        return values_size + sys.getsizeof(self.values) + sys.getsizeof(self.index) + array_size(self.codes)
+
+
+class RecordCache:
+    """Columnar in-memory cache of the records matching a selection geometry
+
+    Keeps the feature id, the precision rank and the dictionary encoded attributes of every record,
+    so that the results can be aggregated again with different filters without querying the
+    provider.
+    """
+
+    has_records = True
+
+    def __init__(self, precision_rank):
+        self.precision_rank = precision_rank
+        self.fids = array("q")
+        self.ranks = array("h")
+        self.columns = {key: DictionaryColumn() for key in RECORD_FIELDS}
+
+    def __len__(self):
+        return len(self.fids)
+
+    @classmethod
+    def merged(cls, precision_rank, parts):
+        """Cache of the records of several caches, a record cached by several of them is kept once
+
+        The values of each part are encoded once, its records only copy the codes.
+        """
+        records = cls(precision_rank)
+        seen = set()
+        for part in parts:
+            keep = [i for i, fid in enumerate(part.fids) if fid not in seen]
+            seen.update(part.fids)
+            records.fids.extend(part.fids[i] for i in keep)
+            records.ranks.extend(part.ranks[i] for i in keep)
+            for key, column in records.columns.items():
+                part_column = part.columns[key]
+                codes = [column.code(value) for value in part_column.values]
+                column.codes.extend(codes[part_column.codes[i]] for i in keep)
+        return records
+
+    def memory_size(self):
+        """Estimated size in bytes"""
+        return (
+            array_size(self.fids)
+            + array_size(self.ranks)
+            + sum(column.memory_size() for column in self.columns.values())
+        )
+
+    def add_features(self, features, indexes):
+        """Adds a stream of features, `indexes` are the attribute indexes of the RECORD_FIELDS"""
+        precision_rank = self.precision_rank
+        columns = [self.columns[key] for key in RECORD_FIELDS]
+        precision_index = indexes[RECORD_FIELDS.index("precision")]
+        for feature in features:
+            attributes = feature.attributes()
+            self.fids.append(feature.id())
+            self.ranks.append(precision_rank(attributes[precision_index]))
+            for column, i in zip(columns, indexes):
+                column.append(attributes[i])
+        return self
+
+    def aggregate(self, record_filter, max_distinct=None):
+        """Aggregates the cached records passing the filter, returns SpeciesAggregate keyed by name"""
+        names = self.columns["name"]
+        name_ok = [record_filter.accepts_name(name) for name in names.values]
+        rank_ok = {rank: record_filter.accepts_rank(rank) for rank in set(self.ranks)}
+
+        # the earliest and latest dates are compared on the values parsed once per distinct date
+        dates = self.columns["date"].values
+        date_key = dict(zip(dates, map(comparable_date, dates))).get
+
+        aggregator = SpeciesAggregator(self.precision_rank, max_distinct, date_key=date_key)
+        add_ranked = aggregator.add_ranked
+        name_codes = names.codes
+        ranks = self.ranks
+        columns = [(column.values, column.codes) for column in self.columns.values()]
+        for i in range(len(self.fids)):
+            rank = ranks[i]
+            if not (name_ok[name_codes[i]] and rank_ok[rank]):
+                continue
+            add_ranked(rank, *[values[codes[i]] for values, codes in columns])
+        return aggregator.results
+
+    def species_records(self, name, record_filter):
+        """Positions of the cached records of a species passing the filter"""
+        names = self.columns["name"]
+        code = names.index.get(name)
+        if code is None or not record_filter.accepts_name(name):
+            return []
+        accepts_rank = record_filter.accepts_rank
+        ranks = self.ranks
+        return [i for i, c in enumerate(names.codes) if c == code and accepts_rank(ranks[i])]
+
+    def filtered_records(self, record_filter):
+        """Positions of the cached records passing the filter"""
+        names = self.columns["name"]
+        name_ok = [record_filter.accepts_name(name) for name in names.values]
+        rank_ok = {rank: record_filter.accepts_rank(rank) for rank in set(self.ranks)}
+        ranks = self.ranks
+        return [i for i, code in enumerate(names.codes) if name_ok[code] and rank_ok[ranks[i]]]
+
+    def record(self, i):
+        """Feature id and values in the RECORD_FIELDS order of the cached record at position `i`"""
+        return self.fids[i], tuple(column[i] for column in self.columns.values())
+
+
+class GroupedRecords:
+    """Partial aggregates per species and precision value, as returned by a grouped provider query
+
+    Since the filters only depend on the species name and the precision, the cached groups can be
+    filtered and merged to the final results without querying the provider again.
+    """
+
+    has_records = False  # the individual records are not fetched
+
+    def __init__(self, precision_rank):
+        self.precision_rank = precision_rank
+        self.groups = []  # (name, rank, SpeciesAggregate)
+
+    def __len__(self):
+        return sum(partial.count for _, _, partial in self.groups)
+
+    def memory_size(self):
+        """Estimated size in bytes"""
+        size = sys.getsizeof(self.groups)
+        for name, _, partial in self.groups:
+            size += sys.getsizeof(name) + sys.getsizeof(partial)
+            for key in DISTINCT_FIELDS:
+                values = getattr(partial, key)
+                size += sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+        return size
+
+    def add_group(self, name, rank, partial):
+        self.groups.append((name, rank, partial))
+
+    def aggregate(self, record_filter, max_distinct=None):
+        aggregator = SpeciesAggregator(self.precision_rank, max_distinct)
+        for name, rank, partial in self.groups:
+            if record_filter.accepts_name(name) and record_filter.accepts_rank(rank):
+                aggregator.add_aggregate(name, partial)
+        return aggregator.results
+
+
+class FederatedRecords:
+    """Records of several layers matching the same selection, one RecordCache or GroupedRecords per layer
+
+    The layers share a precision domain, so the aggregates of each layer are merged with the
+    precision min/max compared on the same ranks. Also holds the two parts of a selection answered
+    from a GridPyramid: the aggregates of the inner grid squares and the records of the others.
+    """
+
+    has_records = False  # the record positions of the parts are not comparable
+
+    def __init__(self, precision_rank, parts):
+        self.precision_rank = precision_rank
+        self.parts = parts
+
+    def __len__(self):
+        return sum(len(part) for part in self.parts)
+
+    def memory_size(self):
+        """Estimated size in bytes"""
+        return sum(part.memory_size() for part in self.parts)
+
+    def aggregate(self, record_filter, max_distinct=None):
+        aggregator = SpeciesAggregator(self.precision_rank, max_distinct)
+        for part in self.parts:
+            for name, partial in part.aggregate(record_filter, max_distinct).items():
+                aggregator.add_aggregate(name, partial)
+        return aggregator.results
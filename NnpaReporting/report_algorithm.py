@@ -0,0 +1,182 @@
+from qgis.core import (
+    QgsCoordinateTransform,
+    QgsCsException,
+    QgsFeatureRequest,
+    QgsFeatureSink,
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterDateTime,
+    QgsProcessingParameterDistance,
+    QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterFeatureSource,
+    QgsProcessingParameterField,
+    QgsProcessingParameterString,
+    QgsProcessingParameterVectorLayer,
+    QgsVectorLayerFeatureSource,
+    QgsWkbTypes,
+)
+
+from .engine import (
+    FIELD_SETTINGS,
+    ReportingEngine,
+    field_mapping_from_settings,
+    result_features,
+    result_fields,
+    sensitive_species_from_settings,
+)
+from .filters import DateRange
+
+
+class SpeciesReportAlgorithm(QgsProcessingAlgorithm):
+    """Species report of every polygon of a sites layer, the same report as the output dialog's
+
+    Runs the ReportingEngine without any GUI, e.g. from the processing toolbox, the graphical
+    modeler or ``qgis_process run nnpa_reporting:speciesreport``.
+    """
+
+    INPUT = "INPUT"
+    SITES = "SITES"
+    SITE_ID = "SITE_ID"
+    BUFFER = "BUFFER"
+    PRECISION_MIN = "PRECISION_MIN"
+    PRECISION_MAX = "PRECISION_MAX"
+    INCLUDE_UNKNOWN_PRECISION = "INCLUDE_UNKNOWN_PRECISION"
+    EXCLUDE_SENSITIVE = "EXCLUDE_SENSITIVE"
+    DATE_FROM = "DATE_FROM"
+    DATE_TO = "DATE_TO"
+    OUTPUT = "OUTPUT"
+
+    def name(self):
+        return "speciesreport"
+
+    def displayName(self):
+        return "Species report"
+
+    def shortHelpString(self):
+        return (
+            "Reports the species records within the buffer distance of each site: record count, dates, "
+            "precision range, grid references, latin name, recorders and surveys.\n"
+            "When observation dates are given, only the records observed in that date range are reported.\n"
+            "The record fields default to the fields configured in the plugin settings."
+        )
+
+    def createInstance(self):
+        return SpeciesReportAlgorithm()
+
+    @staticmethod
+    def field_parameter(key):
+        return f"{key.upper()}_FIELD"
+
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterVectorLayer(self.INPUT, "Records layer"))
+        self.addParameter(
+            QgsProcessingParameterFeatureSource(self.SITES, "Sites layer", [QgsProcessing.TypeVectorPolygon])
+        )
+        self.addParameter(
+            QgsProcessingParameterField(
+                self.SITE_ID, "Site id field", parentLayerParameterName=self.SITES, optional=True
+            )
+        )
+        self.addParameter(QgsProcessingParameterDistance(self.BUFFER, "Buffer", 0, self.INPUT, minValue=0))
+        defaults = field_mapping_from_settings()
+        for key in FIELD_SETTINGS:
+            self.addParameter(
+                QgsProcessingParameterField(
+                    self.field_parameter(key),
+                    f"{key.replace('_', ' ').capitalize()} field",
+                    defaults[key],
+                    self.INPUT,
+                    optional=True,
+                )
+            )
+        self.addParameter(QgsProcessingParameterString(self.PRECISION_MIN, "Minimum precision", optional=True))
+        self.addParameter(QgsProcessingParameterString(self.PRECISION_MAX, "Maximum precision", optional=True))
+        self.addParameter(
+            QgsProcessingParameterBoolean(self.INCLUDE_UNKNOWN_PRECISION, "Include unknown precision", False)
+        )
+        self.addParameter(QgsProcessingParameterBoolean(self.EXCLUDE_SENSITIVE, "Exclude sensitive species", True))
+        for name, description in ((self.DATE_FROM, "Observed from"), (self.DATE_TO, "Observed until")):
+            self.addParameter(
+                QgsProcessingParameterDateTime(name, description, QgsProcessingParameterDateTime.Date, optional=True)
+            )
+        self.addParameter(QgsProcessingParameterFeatureSink(self.OUTPUT, "Species report", QgsProcessing.TypeVector))
+
+    def prepareAlgorithm(self, parameters, context, feedback):
+        """Reads the records layer on the main thread, `processAlgorithm` only reads its feature source"""
+        layer = self.parameterAsVectorLayer(parameters, self.INPUT, context)
+        if layer is None:
+            raise QgsProcessingException("Invalid records layer")
+        fields = field_mapping_from_settings()
+        for key in FIELD_SETTINGS:
+            fields[key] = self.parameterAsString(parameters, self.field_parameter(key), context) or fields[key]
+        self.engine = ReportingEngine(layer, fields)
+        if self.engine.missing_fields:
+            missing = ", ".join(self.engine.missing_fields)
+            raise QgsProcessingException(f"Fields not found in the records layer: {missing}")
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.crs = layer.crs()
+        return True
+
+    def processAlgorithm(self, parameters, context, feedback):
+        sites = self.parameterAsSource(parameters, self.SITES, context)
+        if sites is None:
+            raise QgsProcessingException("Invalid sites layer")
+        site_id_name = self.parameterAsString(parameters, self.SITE_ID, context)
+        buffer_value = self.parameterAsDouble(parameters, self.BUFFER, context)
+        engine = self.engine
+
+        precision_min = self.parameterAsString(parameters, self.PRECISION_MIN, context)
+        precision_max = self.parameterAsString(parameters, self.PRECISION_MAX, context)
+        for value in (precision_min, precision_max):
+            if value and value not in engine.precision.values:
+                raise QgsProcessingException(
+                    f"Unknown precision '{value}', the layer has: {', '.join(engine.precision.values)}"
+                )
+        excluded_names = (
+            sensitive_species_from_settings()
+            if self.parameterAsBool(parameters, self.EXCLUDE_SENSITIVE, context)
+            else ()
+        )
+        record_filter = engine.record_filter(
+            precision_min,
+            precision_max,
+            self.parameterAsBool(parameters, self.INCLUDE_UNKNOWN_PRECISION, context),
+            excluded_names,
+        )
+
+        dates = [self.parameterAsDate(parameters, name, context) for name in (self.DATE_FROM, self.DATE_TO)]
+        date_range = DateRange(*(value.toPyDate() if value.isValid() else None for value in dates))
+
+        site_id_field = sites.fields().field(site_id_name) if site_id_name else None
+        output_fields = result_fields(site_id_field)
+        sink, dest_id = self.parameterAsSink(
+            parameters, self.OUTPUT, context, output_fields, QgsWkbTypes.NoGeometry, self.crs
+        )
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, self.OUTPUT))
+
+        transform = QgsCoordinateTransform(sites.sourceCrs(), self.crs, context.transformContext())
+        request = QgsFeatureRequest()
+        request.setSubsetOfAttributes([site_id_name] if site_id_name else [], sites.fields())
+        total = 100 / sites.featureCount() if sites.featureCount() else 0
+        for i, site in enumerate(sites.getFeatures(request)):
+            if feedback.isCanceled():
+                break
+            if not site.hasGeometry():
+                continue
+            geom = site.geometry()
+            try:
+                geom.transform(transform)
+            except QgsCsException:
+                feedback.reportError(f"Site {site.id()} could not be transformed to the records layer CRS")
+                continue
+            results = engine.report(
+                geom, buffer_value, record_filter, feedback, date_range=date_range, source=self.source
+            )
+            site_id = site[site_id_name] if site_id_name else None
+            sink.addFeatures(result_features(results, output_fields, site_id), QgsFeatureSink.FastInsert)
+            feedback.setProgress(int((i + 1) * total))
+
+        return {self.OUTPUT: dest_id}
@@ -1,20 +1,23 @@
 from qgis.core import Qgis, QgsApplication, QgsCsException, QgsGeometry, QgsRectangle
 from qgis.gui import QgsIdentifyMenu, QgsMapTool, QgsRubberBand
-from qgis.PyQt.QtCore import QPoint, Qt
+from qgis.PyQt.QtCore import QPoint, Qt, QTimer
 from qgis.PyQt.QtGui import QColor
 
 from .output_dialog import IdentifyMode, OutputDialog
 
+# pause of the mouse before the live count of the geometry being drawn starts
+PREVIEW_DELAY_MS = 300
+
 
 class ReportingMapTool(QgsMapTool):
     """A class fot handling map tool mouse events"""
 
-    def __init__(self, iface, layer):
+    def __init__(self, iface, layer, additional_layers=()):
         super(ReportingMapTool, self).__init__(iface.mapCanvas())
 
         self.iface = iface
         self.layer = layer
-        self.dialog = OutputDialog(self.layer)
+        self.dialog = OutputDialog(self.layer, additional_layers)
         self.rubberBand = QgsRubberBand(self.canvas())
         self.rubberBand.setColor(Qt.red)
         self.rubberBand.setFillColor(QColor(255, 0, 0, 127))  # semi-transparent red
@@ -23,6 +26,10 @@ class ReportingMapTool(QgsMapTool):
         self.press_point = None
         self.pressed = False
         self.digitizing_polygon = False
+        self.previewTimer = QTimer(self)
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.setInterval(PREVIEW_DELAY_MS)
+        self.previewTimer.timeout.connect(self.preview)
 
         self.activated.connect(self.dialog.show_and_activate)
         self.reactivated.connect(self.dialog.show_and_activate)
@@ -67,12 +74,9 @@ class ReportingMapTool(QgsMapTool):
             identifyMenu.setAllowMultipleReturn(False)
             identifyMenu.setExecWithSingleResult(True)
             results = QgsIdentifyMenu.findFeaturesOnCanvas(e, self.canvas(), [Qgis.GeometryType.Polygon])
-            # remove results from our own layer
-            results = [
-                r
-                for r in results
-                if r.mLayer.dataProvider().dataSourceUri() != self.layer.dataProvider().dataSourceUri()
-            ]
+            # remove results from our own layers
+            own_uris = {records_layer.dataProvider().dataSourceUri() for records_layer in self.dialog.layers}
+            results = [r for r in results if r.mLayer.dataProvider().dataSourceUri() not in own_uris]
             globalPos = self.canvas().mapToGlobal(QPoint(e.pos().x() + 5, e.pos().y() + 5))
             selectedFeatures = identifyMenu.exec(results, globalPos)
             if selectedFeatures and selectedFeatures[0].mFeature.hasGeometry():
@@ -93,20 +97,36 @@ class ReportingMapTool(QgsMapTool):
         elif self.dialog.cbMode.currentData() == IdentifyMode.POLYGON and self.digitizing_polygon:
             self.rubberBand.movePoint(e.mapPoint())
             self.rubberBand.show()
+        else:
+            return
 
-    def finishDigitizing(self):
+        if self.dialog.cbLivePreview.isChecked():
+            # the count of the previous geometry is stale, a new one starts when the mouse pauses
+            self.dialog.cancel_preview()
+            self.previewTimer.start()
+
+    def layerGeometry(self):
+        """The rubber band geometry in the records layer CRS"""
         transform = self.canvas().mapSettings().layerTransform(self.layer)
         geom = self.rubberBand.asGeometry()
         try:
             geom.transform(transform, Qgis.TransformDirection.ReverseTransform)
         except QgsCsException:
             pass
+        return geom
+
+    def preview(self):
+        if self.pressed or self.digitizing_polygon:
+            self.dialog.preview_geometry(self.layerGeometry())
 
-        self.dialog.search_using_geometry(geom)
+    def finishDigitizing(self):
+        self.previewTimer.stop()
+        self.dialog.search_using_geometry(self.layerGeometry())
         self.pressed = False
         self.digitizing_polygon = False
 
     def resetDigitizing(self):
+        self.previewTimer.stop()
         self.pressed = False
         self.digitizing_polygon = False
         self.rubberBand.reset()
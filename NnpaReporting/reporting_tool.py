@@ -1,7 +1,10 @@
-from qgis.core import QgsSettings, QgsVectorLayer
+from qgis.core import Qgis, QgsApplication, QgsMessageLog, QgsSettings, QgsVectorLayer
 from qgis.PyQt.QtWidgets import QAction, QDialog
 
-from .reporting_map_tool import ReportingMapTool
+from .engine import additional_layers_from_settings, field_mapping_from_settings
+from .index_check import check_layer_indexes
+from .layer_utils import field_indexes
+from .processing_provider import NnpaReportingProvider
 from .settings_dialog import SettingsDialog
 
 
@@ -12,17 +15,53 @@ class ReportingTool:
         self.iface = iface
         self.layer = None
         self.mapTool = None
+        self.provider = None
+        self.indexTask = None
+        self.indexCheckedUri = None  # the index check runs once per records layer source
+        # the records layer is opened on the first run, not when QGIS starts
         s = QgsSettings()
-        layer_uri = s.value("plugins/nnpa_reporting_plugin/layer_uri", None)
-        layer_provider = s.value("plugins/nnpa_reporting_plugin/layer_provider", None)
-        if layer_uri and layer_provider:
-            self.setLayer(layer_uri, layer_provider)
+        self.layer_uri = s.value("plugins/nnpa_reporting_plugin/layer_uri", None)
+        self.layer_provider = s.value("plugins/nnpa_reporting_plugin/layer_provider", None)
 
     def setLayer(self, uri, provider):
-        self.layer = QgsVectorLayer(uri, "nnpa_reporting_layer", provider)
-        self.mapTool = ReportingMapTool(self.iface, self.layer)
+        """Sets the records layer source, the layer is opened and its indexes are checked by the next run"""
+        self.layer_uri = uri
+        self.layer_provider = provider
+        self.layer = None
+        if self.mapTool:
+            self.iface.mapCanvas().unsetMapTool(self.mapTool)
+            self.mapTool.deleteLater()
+            self.mapTool = None
+
+    def loadLayer(self):
+        """Opens the records layer, the map tool and its dialog are only created once it is valid"""
+        if self.layer is None and self.layer_uri and self.layer_provider:
+            self.layer = QgsVectorLayer(self.layer_uri, "nnpa_reporting_layer", self.layer_provider)
+        return self.layer
+
+    def loadAdditionalLayers(self):
+        """(layer, field mapping) of the valid additional records layers of the settings"""
+        layers = []
+        for entry in additional_layers_from_settings():
+            layer = QgsVectorLayer(entry["uri"], "nnpa_reporting_layer", entry["provider"])
+            if not layer.isValid() or min(field_indexes(layer, entry["fields"].values())) < 0:
+                QgsMessageLog.logMessage(
+                    f"Additional records layer skipped, invalid or missing fields: {entry['uri']}",
+                    "NNPA Reporting",
+                    Qgis.Warning,
+                )
+                continue
+            layers.append((layer, entry["fields"]))
+        return layers
+
+    def initProcessing(self):
+        if self.provider:
+            return
+        self.provider = NnpaReportingProvider()
+        QgsApplication.processingRegistry().addProvider(self.provider)
 
     def initGui(self):
+        self.initProcessing()
         action = QAction("Reporting tool", self.iface.mainWindow())
         action.triggered.connect(self.run)
         settingsAction = QAction("Settings", self.iface.mainWindow())
@@ -34,38 +73,42 @@ class ReportingTool:
         self.toolBar.addAction(settingsAction)
 
     def unload(self):
-        self.mapTool.deleteLater()
+        if self.provider:
+            QgsApplication.processingRegistry().removeProvider(self.provider)
+            self.provider = None
+        self.indexTask = None
+        self.indexCheckedUri = None
+        if self.mapTool:
+            self.mapTool.deleteLater()
         self.toolBar.deleteLater()
         del self.toolBar
 
     def run(self):
-        s = QgsSettings()
-        name_field_name = s.value("plugins/nnpa_reporting_plugin/name_field_name", "Common_nam")
-        date_field_name = s.value("plugins/nnpa_reporting_plugin/date_field_name", "Sample_dat")
-        precision_field_name = s.value("plugins/nnpa_reporting_plugin/precision_field_name", "Precision")
-        grid_refer_field_name = s.value("plugins/nnpa_reporting_plugin/grid_refer_field_name", "grid refer")
-        latin_name_field_name = s.value("plugins/nnpa_reporting_plugin/latin_name_field_name", "latin name")
-        recorder_field_name = s.value("plugins/nnpa_reporting_plugin/recorder_field_name", "recorder")
-        survey_field_name = s.value("plugins/nnpa_reporting_plugin/survey_field_name", "survey nam")
-        field_names = [
-            name_field_name,
-            date_field_name,
-            precision_field_name,
-            grid_refer_field_name,
-            latin_name_field_name,
-            recorder_field_name,
-            survey_field_name,
-        ]
+        layer = self.loadLayer()
         if (
-            not self.layer
-            or not self.layer.isValid()
-            or any(self.layer.fields().indexOf(field_name) < 0 for field_name in field_names)
+            not layer
+            or not layer.isValid()
+            or min(field_indexes(layer, field_mapping_from_settings().values())) < 0
         ):
             self.openSettings()
             return
+        if self.indexCheckedUri != self.layer_uri:
+            self.indexCheckedUri = self.layer_uri
+            task = check_layer_indexes(self.iface.mainWindow(), layer, field_mapping_from_settings())
+            self.indexTask = task or self.indexTask
+        if self.mapTool is None:
+            # imported here, the output dialog and its dependencies are not needed before the first run
+            from .reporting_map_tool import ReportingMapTool
+
+            self.mapTool = ReportingMapTool(self.iface, layer, self.loadAdditionalLayers())
         self.iface.mapCanvas().setMapTool(self.mapTool)
 
     def openSettings(self):
         dlg = SettingsDialog(self.iface)
-        if dlg.exec() == QDialog.Accepted:
+        accepted = dlg.exec() == QDialog.Accepted
+        if dlg.index_task:
+            self.indexTask = dlg.index_task
+        if accepted:
             self.setLayer(dlg.layer_uri, dlg.layer_provider)
+            if dlg.index_checked:
+                self.indexCheckedUri = dlg.layer_uri
@@ -0,0 +1,59 @@
+import hashlib
+from collections import OrderedDict
+
+
+def cache_key(geom, buffer_value, expression=""):
+    """Cache key of a query, the WKB hash of the selection geometry, the buffer and the filter expression"""
+    wkb_hash = hashlib.sha1(bytes(geom.asWkb())).hexdigest()
+    return wkb_hash, float(buffer_value), expression or ""
+
+
+class ResultCache:
+    """LRU cache of the records matching the queried geometries, bounded by an estimated memory size
+
+    The cached records are not filtered, so that an entry serves any precision or sensitive
+    species filter. Entries are evicted from the least recently used when the memory ceiling
+    is reached, the cache is cleared when the fingerprint of the layer's source changes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (records, size)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.fingerprint = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def validate(self, fingerprint):
+        """Clears the cache if the source fingerprint differs from the one of the cached entries"""
+        if fingerprint != self.fingerprint:
+            self.clear()
+            self.fingerprint = fingerprint
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, records):
+        if key in self.entries:
+            self.size -= self.entries.pop(key)[1]
+        size = records.memory_size()
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (records, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
@@ -0,0 +1,57 @@
+from datetime import date
+
+from .aggregator import RECORD_FIELDS, date_range_text, distinct_text
+
+# attribute of the distinct values shown in each column of the RESULT_FIELDS
+DISTINCT_COLUMNS = {2: "date", 5: "grid_refer", 7: "recorder", 8: "survey_name"}
+
+
+def species_text(name, value, column):
+    """Display text of a species row cell, in the RESULT_FIELDS order"""
+    if column == 0:
+        return name
+    if column == 1:
+        return str(value.count)
+    if column == 2:
+        return date_range_text(value)
+    if column == 3:
+        return str(value.precision_min)
+    if column == 4:
+        return str(value.precision_max)
+    if column == 6:
+        return value.latin_name
+    return distinct_text(getattr(value, DISTINCT_COLUMNS[column]), value.truncated)
+
+
+def species_sort_key(name, value, column):
+    """Typed sort key of a species row cell, counts and precisions are sorted as numbers"""
+    if column == 0:
+        return (name or "").casefold()
+    if column == 1:
+        return value.count
+    if column == 2:
+        return value.earliest_date or date.min, value.latest_date or date.min
+    if column == 3:
+        return value.rank_min
+    if column == 4:
+        return value.rank_max
+    if column == 6:
+        return (value.latin_name or "").casefold()
+    values = getattr(value, DISTINCT_COLUMNS[column])
+    return sorted(str(v) for v in values if v is not None)
+
+
+def record_row_text(fid, record):
+    """Display texts of a record row, the record values are in the RECORD_FIELDS order"""
+    values = dict(zip(RECORD_FIELDS, ("" if v is None else str(v) for v in record)))
+    return [
+        f"Feature {fid}",
+        "",
+        values["date"],
+        values["precision"],
+        values["precision"],
+        values["grid_refer"],
+        values["latin_name"],
+        values["recorder"],
+        values["survey_name"],
+    ]
@@ -0,0 +1,152 @@
+from qgis.PyQt.QtCore import QAbstractItemModel, QModelIndex, Qt
+
+from .engine import RESULT_FIELDS
+from .result_rows import record_row_text, species_sort_key, species_text
+
+# number of record rows added each time a species row fetches more children
+RECORD_BATCH_SIZE = 500
+
+
+class SpeciesRow:
+    """Top level row of the results model, its record rows are fetched when it gets expanded"""
+
+    __slots__ = ("position", "name", "value", "texts", "record_positions", "record_rows")
+
+    def __init__(self, position, name, value):
+        self.position = position  # position in ResultsModel.species
+        self.name = name
+        self.value = value
+        self.texts = {}  # display texts computed when first displayed
+        self.record_positions = None  # positions in the record cache, read on the first fetch
+        self.record_rows = []
+
+
+class ResultsModel(QAbstractItemModel):
+    """Item model of the aggregated species results
+
+    The species rows are created from the SpeciesAggregate objects without any text, the cell
+    texts are computed and kept the first time the view displays them. Sorting uses typed keys
+    and only moves the species rows. When the results come from a RecordCache, each species row
+    can be expanded to the individual records, fetched in batches of RECORD_BATCH_SIZE.
+
+    The internal pointer of a record index is its SpeciesRow, species indexes have none.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.results = {}
+        self.records = None
+        self.record_filter = None
+        self.species = []
+        self.order = []  # species positions in the displayed order
+        self.rows = []  # displayed row of each species position
+
+    def set_results(self, results, records=None, record_filter=None):
+        """Replaces the displayed results
+
+        :param results: SpeciesAggregate keyed by species name
+        :param records: the cached records the results were aggregated from, to list the records of a species
+        :param record_filter: the filter the results were aggregated with
+        """
+        self.beginResetModel()
+        self.results = results
+        self.records = records if records is not None and records.has_records else None
+        self.record_filter = record_filter
+        self.species = [SpeciesRow(i, name, value) for i, (name, value) in enumerate(results.items())]
+        self.order = list(range(len(self.species)))
+        self.rows = list(self.order)
+        self.endResetModel()
+
+    def clear(self):
+        self.set_results({})
+
+    def species_row(self, index):
+        """SpeciesRow of a species or record index"""
+        return index.internalPointer() or self.species[self.order[index.row()]]
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column)
+        return self.createIndex(row, column, self.species_row(parent))
+
+    def parent(self, index):
+        row = index.internalPointer() if index.isValid() else None
+        if row is None:
+            return QModelIndex()
+        return self.createIndex(self.rows[row.position], 0)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.species)
+        if parent.internalPointer() or parent.column() != 0:
+            return 0
+        return len(self.species_row(parent).record_rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(RESULT_FIELDS)
+
+    def hasChildren(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return bool(self.species)
+        return self.records is not None and not parent.internalPointer() and parent.column() == 0
+
+    def canFetchMore(self, parent):
+        if self.records is None or not parent.isValid() or parent.internalPointer():
+            return False
+        row = self.species_row(parent)
+        return row.record_positions is None or len(row.record_rows) < len(row.record_positions)
+
+    def fetchMore(self, parent):
+        row = self.species_row(parent)
+        if row.record_positions is None:
+            row.record_positions = self.records.species_records(row.name, self.record_filter)
+        start = len(row.record_rows)
+        end = min(start + RECORD_BATCH_SIZE, len(row.record_positions))
+        if end <= start:
+            return
+        self.beginInsertRows(parent, start, end - 1)
+        for position in row.record_positions[start:end]:
+            row.record_rows.append(record_row_text(*self.records.record(position)))
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        row = self.species_row(index)
+        column = index.column()
+        if index.internalPointer():
+            return row.record_rows[index.row()][column]
+        text = row.texts.get(column)
+        if text is None:
+            text = row.texts[column] = species_text(row.name, row.value, column)
+        return text
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return RESULT_FIELDS[section][0]
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """Sorts the species rows with typed keys, the record rows keep their order"""
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        positions = [None if i.internalPointer() else self.order[i.row()] for i in persistent]
+
+        self.order.sort(
+            key=lambda i: species_sort_key(self.species[i].name, self.species[i].value, column),
+            reverse=order == Qt.DescendingOrder,
+        )
+        for row, position in enumerate(self.order):
+            self.rows[position] = row
+
+        # record indexes point to their species row, they do not change
+        self.changePersistentIndexList(
+            persistent,
+            [
+                i if position is None else self.createIndex(self.rows[position], i.column())
+                for i, position in zip(persistent, positions)
+            ],
+        )
+        self.layoutChanged.emit()
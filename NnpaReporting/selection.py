@@ -0,0 +1,158 @@
+import math
+
+from qgis.core import QgsGeometry, QgsRectangle, QgsUnitTypes
+
+# selection geometries with more vertices than this are split in tiles
+TILE_MIN_VERTICES = 5000
+
+# target number of vertices of a tile
+TILE_VERTICES = 1000
+
+# segments per quarter circle of the buffers
+BUFFER_SEGMENTS = 20
+
+
+class SelectionTile:
+    """Part of a selection geometry with its GEOS prepared geometry
+
+    :param distance: records within this distance of the geometry match, its bounding box is grown accordingly
+    """
+
+    __slots__ = ("geometry", "distance", "bbox", "engine")
+
+    def __init__(self, geometry, distance=0):
+        self.geometry = geometry  # the engine does not own the geometry
+        self.distance = distance
+        self.bbox = geometry.boundingBox().buffered(distance) if distance else geometry.boundingBox()
+        self.engine = QgsGeometry.createGeometryEngine(geometry.constGet())
+        self.engine.prepareGeometry()
+
+    def intersects(self, geom):
+        if self.distance:
+            return self.engine.distanceWithin(geom.constGet(), self.distance)
+        return self.engine.intersects(geom.constGet())
+
+    def contains_box(self, xmin, ymin, xmax, ymax):
+        """True if a bounding box lies inside the tile, any record within the box then matches"""
+        if xmin >= xmax or ymin >= ymax:
+            return False  # degenerate boxes are tested against the record geometry
+        box = QgsGeometry.fromRect(QgsRectangle(xmin, ymin, xmax, ymax))  # kept alive during the test
+        return self.engine.contains(box.constGet())
+
+
+def matches_tiles(tiles, geom):
+    """True if the record geometry matches one of the selection tiles"""
+    bbox = geom.boundingBox()
+    return any(tile.bbox.intersects(bbox) and tile.intersects(geom) for tile in tiles)
+
+
+class SelectionGeometry:
+    """Geometry selecting the records of a report, with its buffer computed once
+
+    Small geometries are left to the provider's distance filter. Geometries with more than
+    TILE_MIN_VERTICES vertices, e.g. protected area boundaries picked from a layer, are split in
+    a grid of tiles with a prepared geometry each, so that each tile's bounding box pre-filters
+    the records tightly and each record is tested against a small prepared part only.
+
+    :param geom: the selection geometry in the records layer CRS
+    :param buffer_value: distance around the geometry
+    :param simplify_tolerance: the geometry is simplified with this tolerance first if not 0
+    :param date_range: DateRange of the selected records, None for all the dates
+    """
+
+    def __init__(self, geom, buffer_value=0, simplify_tolerance=0, date_range=None):
+        if simplify_tolerance:
+            simplified = geom.simplify(simplify_tolerance)
+            if not simplified.isEmpty():
+                geom = simplified
+        self.geometry = geom
+        self.buffer_value = buffer_value
+        self.simplify_tolerance = simplify_tolerance
+        self.date_range = date_range or None
+        self.buffered_geometry = None
+        self.covering_geometry = None
+        self.prepared_tiles = None
+
+    @property
+    def buffered(self):
+        """The buffered geometry, computed on first use and shared by the query and the export"""
+        if self.buffered_geometry is None:
+            if self.buffer_value:
+                self.buffered_geometry = self.geometry.buffer(self.buffer_value, BUFFER_SEGMENTS)
+            else:
+                self.buffered_geometry = self.geometry
+        return self.buffered_geometry
+
+    @property
+    def covering(self):
+        """Segmented buffer containing every point within the buffer distance, a superset of the selection
+
+        The vertices of the `buffered` geometry lie on the buffer circles and its segments inside,
+        the segments of the covering buffer touch the circles from outside instead.
+        """
+        if self.covering_geometry is None:
+            if self.buffer_value:
+                distance = self.buffer_value / math.cos(math.pi / (4 * BUFFER_SEGMENTS))
+                self.covering_geometry = self.geometry.buffer(distance, BUFFER_SEGMENTS)
+            else:
+                self.covering_geometry = self.geometry
+        return self.covering_geometry
+
+    @property
+    def extent(self):
+        """Bounding box of the buffered geometry, computed without buffering it"""
+        return self.geometry.boundingBox().buffered(self.buffer_value)
+
+    def transformed(self, transform):
+        """SelectionGeometry of the same records in the destination CRS of a QgsCoordinateTransform
+
+        The buffer distance is converted to the destination map units. A distance in degrees has
+        no fixed length, between degrees and linear units the buffered geometry is transformed.
+        """
+        source_units = transform.sourceCrs().mapUnits()
+        destination_units = transform.destinationCrs().mapUnits()
+        degrees = QgsUnitTypes.DistanceDegrees
+        if self.buffer_value and source_units != destination_units and degrees in (source_units, destination_units):
+            geom = QgsGeometry(self.buffered)
+            buffer_value = 0
+        else:
+            geom = QgsGeometry(self.geometry)
+            buffer_value = self.buffer_value * QgsUnitTypes.fromUnitToUnitFactor(source_units, destination_units)
+        geom.transform(transform)
+        return SelectionGeometry(geom, buffer_value, date_range=self.date_range)
+
+    @property
+    def tiled(self):
+        return self.geometry.constGet().nCoordinates() > TILE_MIN_VERTICES
+
+    @property
+    def tiles(self):
+        """Prepared tiles of the geometry, each testing the exact buffer distance to its part
+
+        The distance to the geometry itself is tested, as the provider's distance filter does,
+        instead of the segmented buffer. Small geometries are a single tile.
+        """
+        if self.prepared_tiles is None:
+            parts = self.split(self.geometry) if self.tiled else [self.geometry]
+            self.prepared_tiles = [SelectionTile(part, self.buffer_value) for part in parts]
+        return self.prepared_tiles
+
+    @staticmethod
+    def split(geom):
+        """Parts of the geometry clipped to a grid of about TILE_VERTICES vertices per cell"""
+        vertices = geom.constGet().nCoordinates()
+        if vertices <= TILE_MIN_VERTICES:
+            return [geom]
+        side = math.ceil(math.sqrt(vertices / TILE_VERTICES))
+        bbox = geom.boundingBox()
+        width = bbox.width() / side
+        height = bbox.height() / side
+        parts = []
+        for i in range(side):
+            for j in range(side):
+                x = bbox.xMinimum() + i * width
+                y = bbox.yMinimum() + j * height
+                part = geom.clipped(QgsRectangle(x, y, x + width, y + height))
+                if not part.isEmpty():
+                    parts.append(part)
+        return parts
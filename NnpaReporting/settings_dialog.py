@@ -1,11 +1,14 @@
 import csv
+import json
 from os import path
 
 from qgis.core import Qgis, QgsSettings
 from qgis.PyQt import uic
 from qgis.PyQt.QtWidgets import QDialog, QFileDialog, QMessageBox
 
+from .engine import additional_layers_from_settings, field_mapping_from_settings
 from .fields_dialog import FieldsDialog
+from .index_check import check_layer_indexes
 
 ui_file = path.join(path.dirname(__file__), "settings_dialog.ui")
 
@@ -20,13 +23,29 @@ class SettingsDialog(QDialog):
         self.ui.layerComboBox.setFilters(Qgis.LayerFilter.PolygonLayer)
         self.ui.setFromLayerButton.clicked.connect(self.on_pick_layer)
         self.ui.loadCsvButton.clicked.connect(self.load_csv)
+        self.ui.addLayerButton.clicked.connect(self.on_add_layer)
+        self.ui.removeLayerButton.clicked.connect(self.on_remove_layer)
 
         s = QgsSettings()
         self.layer_uri = s.value("plugins/nnpa_reporting_plugin/layer_uri", None)
         self.layer_provider = s.value("plugins/nnpa_reporting_plugin/layer_provider", None)
         self.ui.uriLineEdit.setText(self.layer_uri)
+        self.index_task = None
+        self.index_checked = False  # the index check of the picked layer was shown
+        self.additional_layers = additional_layers_from_settings()
+        self.ui.additionalLayersList.addItems([entry["uri"] for entry in self.additional_layers])
         self.sensitive_species = s.value("plugins/nnpa_reporting_plugin/sensitive_species", [])
         self.ui.sensitiveSpeciesTextEdit.setPlainText("\n".join(self.sensitive_species))
+        self.ui.cacheSizeSpinBox.setValue(s.value("plugins/nnpa_reporting_plugin/cache_size_mb", 256, type=int))
+        self.ui.timingCheckBox.setChecked(s.value("plugins/nnpa_reporting_plugin/timing_enabled", False, type=bool))
+        self.ui.snapshotCheckBox.setChecked(s.value("plugins/nnpa_reporting_plugin/snapshot_enabled", False, type=bool))
+        # imported here, the settings dialog is imported when QGIS loads the plugin, NumPy is not needed then
+        from .snapshot import snapshot_available
+
+        self.ui.snapshotCheckBox.setEnabled(snapshot_available())
+        self.ui.pyramidCheckBox.setChecked(
+            s.value("plugins/nnpa_reporting_plugin/grid_pyramid_enabled", False, type=bool)
+        )
 
     def on_pick_layer(self):
         layer = self.ui.layerComboBox.currentLayer()
@@ -38,6 +57,28 @@ class SettingsDialog(QDialog):
             self.layer_uri = layer.dataProvider().dataSourceUri(True)
             self.layer_provider = layer.dataProvider().name()
             self.ui.uriLineEdit.setText(self.layer_uri)
+            self.index_task = check_layer_indexes(self, layer, dlg.field_mapping) or self.index_task
+            self.index_checked = True
+
+    def on_add_layer(self):
+        """Adds the selected project layer as an additional records layer with its own field mapping"""
+        layer = self.ui.layerComboBox.currentLayer()
+        if not layer or not layer.isValid():
+            return
+
+        dlg = FieldsDialog(self, layer.fields(), field_mapping_from_settings())
+        if dlg.exec() == QDialog.Accepted:
+            uri = layer.dataProvider().dataSourceUri(True)
+            self.additional_layers.append(
+                {"uri": uri, "provider": layer.dataProvider().name(), "fields": dlg.field_mapping}
+            )
+            self.ui.additionalLayersList.addItem(uri)
+
+    def on_remove_layer(self):
+        row = self.ui.additionalLayersList.currentRow()
+        if row >= 0:
+            self.ui.additionalLayersList.takeItem(row)
+            del self.additional_layers[row]
 
     def accept(self):
         self.save_settings()
@@ -47,7 +88,12 @@ class SettingsDialog(QDialog):
         s = QgsSettings()
         s.setValue("plugins/nnpa_reporting_plugin/layer_uri", self.layer_uri)
         s.setValue("plugins/nnpa_reporting_plugin/layer_provider", self.layer_provider)
+        s.setValue("plugins/nnpa_reporting_plugin/additional_layers", json.dumps(self.additional_layers))
         s.setValue("plugins/nnpa_reporting_plugin/sensitive_species", self.sensitive_species)
+        s.setValue("plugins/nnpa_reporting_plugin/cache_size_mb", self.ui.cacheSizeSpinBox.value())
+        s.setValue("plugins/nnpa_reporting_plugin/timing_enabled", self.ui.timingCheckBox.isChecked())
+        s.setValue("plugins/nnpa_reporting_plugin/snapshot_enabled", self.ui.snapshotCheckBox.isChecked())
+        s.setValue("plugins/nnpa_reporting_plugin/grid_pyramid_enabled", self.ui.pyramidCheckBox.isChecked())
 
     def load_csv(self):
         """Loads CSV file and adds items to the exclusion list"""
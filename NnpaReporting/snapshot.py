@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from array import array
+
+try:
+    import numpy
+except ImportError:  # optional, the snapshot mode is not available without NumPy
+    numpy = None
+
+from qgis.core import QgsApplication, QgsFeatureRequest, QgsFeedback, QgsTask, QgsVectorLayerFeatureSource
+
+from .aggregator import RECORD_FIELDS, comparable_date
+from .engine import FID_BATCH_SIZE
+from .layer_utils import persistent_fingerprint
+from .packed_index import PackedIndex, str_order
+from .record_cache import DictionaryColumn, RecordCache
+
+# changed when the layout of the saved snapshots changes
+SNAPSHOT_VERSION = 1
+
+BOX_ARRAYS = ("xmin", "ymin", "xmax", "ymax")
+
+
+def snapshot_available():
+    return numpy is not None
+
+
+def snapshot_key(engine):
+    """Description of the snapshot matching the engine's layer, field mapping and precision values"""
+    return {
+        "version": SNAPSHOT_VERSION,
+        "fingerprint": json.dumps(persistent_fingerprint(engine.layer), default=str),
+        "fields": [engine.fields[key] for key in RECORD_FIELDS],
+        "precision": engine.precision.values,
+    }
+
+
+def snapshot_directory(layer, key, folder="snapshots"):
+    """Directory of a snapshot, one per layer source and snapshot key, in the profile's `folder`"""
+    layer_hash = hashlib.sha1(f"{layer.providerType()}|{layer.source()}".encode()).hexdigest()
+    key_hash = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), "nnpa_reporting", folder, layer_hash, key_hash)
+
+
+class RecordSnapshot:
+    """Local columnar copy of the records layer with a spatial index
+
+    Keeps the feature id, the bounding box, the precision rank and the dictionary encoded mapped
+    attributes of every record in NumPy arrays saved in the QGIS profile and memory-mapped when
+    loaded. The records are stored in STR order and indexed by a PackedIndex, so a query only
+    reads the provider for the geometries of the records whose bounding box crosses the border
+    of the selection, the attributes come from the snapshot.
+    """
+
+    def __init__(self, directory, key):
+        self.directory = directory
+        self.key = key
+        self.fids = self.load_array("fids")
+        self.ranks = self.load_array("ranks")
+        self.boxes = tuple(self.load_array(name) for name in BOX_ARRAYS)
+        self.codes = {name: self.load_array(f"codes_{name}") for name in RECORD_FIELDS}
+        with open(os.path.join(directory, "values.pickle"), "rb") as f:
+            self.values = pickle.load(f)
+        self.index = PackedIndex(self.boxes)
+
+    def __len__(self):
+        return len(self.fids)
+
+    def load_array(self, name):
+        return numpy.load(os.path.join(self.directory, f"{name}.npy"), mmap_mode="r")
+
+    @classmethod
+    def load(cls, layer, key):
+        """Saved snapshot matching the key, None if there is none"""
+        directory = snapshot_directory(layer, key)
+        # written last, the snapshot is complete if it exists
+        if not os.path.isfile(os.path.join(directory, "key.json")):
+            return None
+        return cls(directory, key)
+
+    def fetch(self, selection, source, precision_rank, feedback=None):
+        """Records matching a SelectionGeometry as a RecordCache, None if cancelled, may run in a task thread
+
+        The candidates of each tile come from the index. Those whose box lies inside the tile
+        match without reading their geometry, the others are read by id and tested exactly.
+        The records out of the selection's date range are never candidates.
+        """
+        matched = numpy.zeros(len(self.fids), dtype=bool)
+        if selection.date_range:
+            # each distinct date value is parsed once
+            dates = [selection.date_range.accepts(comparable_date(value)) for value in self.values["date"]]
+            excluded = ~numpy.array(dates, dtype=bool)[self.codes["date"]]
+        else:
+            excluded = numpy.zeros(len(self.fids), dtype=bool)
+        for tile in selection.tiles:
+            candidates = self.index.query(tile.bbox)
+            candidates = candidates[~(matched[candidates] | excluded[candidates])]
+            boxes = zip(*(b[candidates].tolist() for b in self.boxes))
+            border = []
+            for i, box in zip(candidates.tolist(), boxes):
+                if tile.contains_box(*box):
+                    matched[i] = True
+                else:
+                    border.append(i)
+
+            for start in range(0, len(border), FID_BATCH_SIZE):
+                if feedback and feedback.isCanceled():
+                    return None
+                batch = border[start : start + FID_BATCH_SIZE]
+                by_fid = dict(zip(self.fids[batch].tolist(), batch))
+                request = QgsFeatureRequest().setFilterFids(list(by_fid)).setNoAttributes()
+                if feedback:
+                    request.setFeedback(feedback)
+                for feature in source.getFeatures(request):
+                    if tile.intersects(feature.geometry()):
+                        matched[by_fid[feature.id()]] = True
+        return self.records(numpy.flatnonzero(matched), precision_rank)
+
+    def records(self, positions, precision_rank):
+        """RecordCache of the records at the positions, with dictionaries of the values they use only"""
+        records = RecordCache(precision_rank)
+        records.fids.frombytes(self.fids[positions].astype(numpy.int64).tobytes())
+        records.ranks.frombytes(self.ranks[positions].astype(numpy.int16).tobytes())
+        for key, column in records.columns.items():
+            used, codes = numpy.unique(self.codes[key][positions], return_inverse=True)
+            values = self.values[key]
+            column.values = [values[code] for code in used.tolist()]
+            column.index = {value: code for code, value in enumerate(column.values)}
+            column.codes.frombytes(codes.astype(numpy.int32).tobytes())
+        return records
+
+
+def write_snapshot(directory, key, fids, ranks, boxes, columns):
+    """Saves the arrays of a snapshot in STR order, the directory is replaced at once when complete"""
+    fids = numpy.frombuffer(fids, dtype=numpy.int64)
+    boxes = [numpy.frombuffer(b, dtype=numpy.float64) for b in boxes]
+    order = str_order(*boxes)
+
+    partial = f"{directory}.partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    numpy.save(os.path.join(partial, "fids.npy"), fids[order])
+    numpy.save(os.path.join(partial, "ranks.npy"), numpy.frombuffer(ranks, dtype=numpy.int16)[order])
+    for name, values in zip(BOX_ARRAYS, boxes):
+        numpy.save(os.path.join(partial, f"{name}.npy"), values[order])
+    for name, column in columns.items():
+        codes = numpy.frombuffer(column.codes, dtype=numpy.int32)[order]
+        numpy.save(os.path.join(partial, f"codes_{name}.npy"), codes.astype(numpy.min_scalar_type(len(column.values))))
+    with open(os.path.join(partial, "values.pickle"), "wb") as f:
+        pickle.dump({name: column.values for name, column in columns.items()}, f, pickle.HIGHEST_PROTOCOL)
+    with open(os.path.join(partial, "key.json"), "w") as f:
+        json.dump(key, f)
+
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(partial, directory)
+    # snapshots of the previous data, still memory-mapped ones are removed by a later build
+    parent = os.path.dirname(directory)
+    for name in os.listdir(parent):
+        if os.path.join(parent, name) != directory:
+            shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
+
+
+class SnapshotBuildTask(QgsTask):
+    """Background task reading every record of the layer once and saving its snapshot
+
+    The feature source, the snapshot key and the field indexes are taken from the engine on the
+    main thread, the records are read and the arrays are saved in the task manager thread.
+    """
+
+    def __init__(self, engine, description="NNPA Reporting snapshot"):
+        super().__init__(description, QgsTask.CanCancel)
+        self.source = QgsVectorLayerFeatureSource(engine.layer)
+        self.total = engine.layer.featureCount()
+        self.precision_rank = engine.precision.rank
+        self.indexes = engine.attribute_indexes
+        self.key = snapshot_key(engine)
+        self.directory = snapshot_directory(engine.layer, self.key)
+        self.feedback = QgsFeedback()
+        self.error = None
+
+    def run(self):
+        fids = array("q")
+        ranks = array("h")
+        boxes = [array("d") for _ in BOX_ARRAYS]
+        columns = {key: DictionaryColumn() for key in RECORD_FIELDS}
+        precision_index = self.indexes[RECORD_FIELDS.index("precision")]
+        request = QgsFeatureRequest().setSubsetOfAttributes(self.indexes).setFeedback(self.feedback)
+        try:
+            for count, feature in enumerate(self.source.getFeatures(request)):
+                if self.isCanceled():
+                    return False
+                if count % 10000 == 0 and self.total > 0:
+                    self.setProgress(100 * count / self.total)
+                if not feature.hasGeometry():
+                    continue  # never matched by a spatial query
+                bbox = feature.geometry().boundingBox()
+                attributes = feature.attributes()
+                fids.append(feature.id())
+                ranks.append(self.precision_rank(attributes[precision_index]))
+                boxes[0].append(bbox.xMinimum())
+                boxes[1].append(bbox.yMinimum())
+                boxes[2].append(bbox.xMaximum())
+                boxes[3].append(bbox.yMaximum())
+                for column, i in zip(columns.values(), self.indexes):
+                    column.append(attributes[i])
+            self.save(fids, ranks, boxes, columns)
+        except Exception as e:  # exceptions must not escape the task manager thread
+            self.error = str(e)
+            return False
+        return True
+
+    def save(self, fids, ranks, boxes, columns):
+        """Saves the records read from the layer, in the task thread"""
+        write_snapshot(self.directory, self.key, fids, ranks, boxes, columns)
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
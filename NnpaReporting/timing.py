@@ -0,0 +1,163 @@
+import functools
+import inspect
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_memory_mb():
+    """Peak resident memory of the QGIS process in MB, None if it cannot be read"""
+    if resource is not None:
+        # kilobytes on Linux, bytes on macOS
+        scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    if sys.platform == "win32":
+        return windows_peak_memory_mb()
+    return None
+
+
+def windows_peak_memory_mb():
+    import ctypes
+    from ctypes import wintypes
+
+    class ProcessMemoryCounters(ctypes.Structure):
+        _fields_ = [
+            ("cb", wintypes.DWORD),
+            ("PageFaultCount", wintypes.DWORD),
+            ("PeakWorkingSetSize", ctypes.c_size_t),
+            ("WorkingSetSize", ctypes.c_size_t),
+            ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+            ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+            ("PagefileUsage", ctypes.c_size_t),
+            ("PeakPagefileUsage", ctypes.c_size_t),
+        ]
+
+    counters = ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None
+    return counters.PeakWorkingSetSize / (1024 * 1024)
+
+
+class NoPhase:
+    """Context manager doing nothing, returned for every phase when the timing is disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_PHASE = NoPhase()
+
+
+class Phase:
+    """Context manager timing a phase of a PhaseTimer"""
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.timer.start(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.stop(self.name)
+        return False
+
+
+class PhaseTimer:
+    """Wall time of the phases of a report, with the record counts and the peak memory
+
+    Each finished phase is written to `log` as a JSON entry. When the timer is disabled, `phase`
+    returns a shared no-op context manager and `start`, `stop` and `count` return immediately,
+    so the instrumentation can stay in place.
+
+    :param log: callable taking a message, e.g. writing to the QGIS message log
+    """
+
+    def __init__(self, enabled=False, log=None):
+        self.enabled = enabled
+        self.log = log
+        self.started = {}
+        self.elapsed = {}
+        self.counts = {}
+
+    def reset(self):
+        """Forgets the phases of the previous report"""
+        self.started.clear()
+        self.elapsed.clear()
+        self.counts.clear()
+
+    def phase(self, name):
+        """Context manager timing a phase"""
+        return Phase(self, name) if self.enabled else NO_PHASE
+
+    def start(self, name):
+        """Starts a phase, for the phases ending in another call, e.g. a background query"""
+        if self.enabled:
+            self.started[name] = time.perf_counter()
+
+    def stop(self, name, **counts):
+        """Ends a started phase and logs it with the optional record counts"""
+        if not self.enabled or name not in self.started:
+            return
+        elapsed = time.perf_counter() - self.started.pop(name)
+        self.elapsed[name] = self.elapsed.get(name, 0) + elapsed
+        self.counts.update(counts)
+        if self.log:
+            entry = {"phase": name, "wall_s": round(elapsed, 4), "peak_memory_mb": peak_memory_mb(), **counts}
+            self.log(json.dumps(entry))
+
+    def count(self, **counts):
+        """Records counts of the current report, e.g. the scanned and matched records"""
+        if self.enabled:
+            self.counts.update(counts)
+
+    def summary(self):
+        """Short one line summary of the timed phases"""
+        if not self.enabled or not self.elapsed:
+            return ""
+        parts = [", ".join(f"{name} {elapsed:.2f} s" for name, elapsed in self.elapsed.items())]
+        if self.counts:
+            parts.append(", ".join(f"{value} {name}" for name, value in self.counts.items()))
+        peak = peak_memory_mb()
+        if peak is not None:
+            parts.append(f"peak memory {peak:.0f} MB")
+        return " | ".join(parts)
+
+
+def timed_phase(name):
+    """Decorator timing a method as a phase with the `timer` PhaseTimer of its instance
+
+    The extra positional arguments are dropped, as PyQt does for a slot taking fewer arguments
+    than its signal, e.g. the `checked` argument of `clicked`: PyQt sees the `*args` of the
+    wrapper and always passes them.
+    """
+
+    def decorator(method):
+        parameters = inspect.signature(method).parameters.values()
+        if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+            count = None
+        else:
+            # without self
+            count = sum(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in parameters) - 1
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.timer.phase(name):
+                return method(self, *args[:count], **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,107 @@
+"""Memory benchmark of the species aggregation on a multi-million record synthetic layer
+
+Compares the former list based aggregation (every value appended to per-species lists and
+collapsed with `set()` when displayed) with the streaming `SpeciesAggregator`. The records are
+generated as a stream of freshly allocated strings, the same way features are read from a
+provider. Each aggregation runs in its own process and the peak resident memory is measured
+above the baseline of the process. Does not require QGIS (Unix only, uses `resource`):
+
+    python benchmarks/aggregator_memory.py [--records 3000000]
+"""
+
+import argparse
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from NnpaReporting.aggregator import SpeciesAggregator  # noqa: E402
+from NnpaReporting.precision import PrecisionDomain  # noqa: E402
+
+PRECISIONS = ["1m", "10m", "100m", "1km", "2km", "10km"]
+
+
+def synthetic_records(count, seed=0):
+    """Stream of records with a skewed species distribution, as in real recording data"""
+    rnd = random.Random(seed)
+    for _ in range(count):
+        s = int(2000 ** rnd.random()) - 1  # log-uniform, a few species hold most records
+        day = rnd.randrange(30 * 365)
+        yield (
+            f"Species {s}",
+            rnd.choice(PRECISIONS),
+            f"{day % 28 + 1:02d}/{day // 28 % 12 + 1:02d}/{1990 + day // 365}",
+            f"NY{rnd.randrange(100):02d}{rnd.randrange(100):02d}",
+            f"Latinus {s}",
+            f"Recorder {rnd.randrange(500)}",
+            f"Survey {rnd.randrange(100)}",
+        )
+
+
+def aggregate_lists(records, precision_rank):
+    """The former aggregation, keeping every value in lists"""
+    output_dict = {}
+    for name, precision, date, grid_refer, latin_name, recorder, survey_name in records:
+        if name not in output_dict:
+            output_dict[name] = {
+                "date": [date],
+                "grid_refer": [grid_refer],
+                "latin_name": latin_name,
+                "recorder": [recorder],
+                "survey_name": [survey_name],
+                "precision_min": precision,
+                "precision_max": precision,
+                "count": 1,
+            }
+        else:
+            dict_feature = output_dict[name]
+            dict_feature["count"] += 1
+            dict_feature["date"].append(date)
+            dict_feature["grid_refer"].append(grid_refer)
+            dict_feature["recorder"].append(recorder)
+            dict_feature["survey_name"].append(survey_name)
+    return output_dict
+
+
+def aggregate_streaming(records, precision_rank):
+    return SpeciesAggregator(precision_rank, max_distinct=10000).add_records(records).results
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(label, count):
+    """Runs one aggregation in the current process and prints its results"""
+    precision_rank = PrecisionDomain(PRECISIONS).rank
+    func = {"lists": aggregate_lists, "streaming": aggregate_streaming}[label]
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    results = func(synthetic_records(count), precision_rank)
+    elapsed = time.perf_counter() - start
+    print(f"{label:>12} {elapsed:>8.1f} {peak_rss_mb() - baseline:>13.1f} {len(results):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=3000000)
+    parser.add_argument("--run", choices=["lists", "streaming"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run(args.run, args.records)
+        return
+
+    print(f"{args.records} records")
+    print(f"{'aggregation':>12} {'time s':>8} {'peak RSS MB':>13} {'species':>8}", flush=True)
+    for label in ("lists", "streaming"):
+        subprocess.run([sys.executable, __file__, "--records", str(args.records), "--run", label], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Benchmark of the reports restricted to an observation date range
+
+Times, for the selections of the reporting suite on a synthetic GeoPackage of polygon records
+(see reporting_suite.py), the query and the aggregation of all the records and of the records of a
+date range (`SelectionGeometry.date_range`). The synthetic dates are text values compared as ISO
+strings in the grouped query and in the feature request (`ReportingEngine.date_expression`), the
+fetched features are also checked with the parsed dates. The record counts of both paths must be
+equal. Requires a QGIS Python environment:
+
+    python benchmarks/date_range.py [--records 1000000] [--years 5] [--repeat 3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from qgis.core import QgsApplication  # noqa: E402
+from reporting_suite import gpkg_layer, record_fields, selections  # noqa: E402
+
+
+def median_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--years", type=int, default=5, help="length of the date range, ending in 2019")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "nnpa_reporting_benchmark"))
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    from NnpaReporting.engine import FIELD_SETTINGS, ReportingEngine
+    from NnpaReporting.filters import DateRange
+    from NnpaReporting.selection import SelectionGeometry
+
+    mapping = {key: default for key, (_, default) in FIELD_SETTINGS.items()}
+    os.makedirs(args.data_dir, exist_ok=True)
+    layer = gpkg_layer(args.records, record_fields(mapping), args.data_dir)
+    engine = ReportingEngine(layer, mapping)
+    record_filter = engine.record_filter()
+    date_range = DateRange(date(2020 - args.years, 1, 1), date(2019, 12, 31))
+    print(f"{args.records} polygon records, date range {date_range}")
+
+    print(f"{'selection':>10} {'records':>9} {'all s':>8} {'in range':>9} {'grouped s':>10} {'features s':>11}")
+    for name, geom, buffer_value in selections():
+
+        def report(selection_range):
+            return engine.fetch_selection(SelectionGeometry(geom, buffer_value, date_range=selection_range))
+
+        def report_features():
+            selection = SelectionGeometry(geom, buffer_value, date_range=date_range)
+            return engine.collect_records(engine.features(selection))
+
+        def record_count(records):
+            return sum(value.count for value in records.aggregate(record_filter).values())
+
+        all_time, records = median_time(lambda: report(None), args.repeat)
+        grouped_time, grouped_records = median_time(lambda: report(date_range), args.repeat)
+        features_time, features_records = median_time(report_features, args.repeat)
+        range_count = record_count(features_records)
+        if record_count(grouped_records) != range_count:
+            print(f"  {name}: {record_count(grouped_records)} records in the grouped query instead of {range_count}")
+        print(
+            f"{name:>10} {record_count(records):>9} {all_time:>8.3f} {range_count:>9} {grouped_time:>10.3f} "
+            f"{features_time:>11.3f}"
+        )
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
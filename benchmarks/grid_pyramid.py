@@ -0,0 +1,96 @@
+"""Benchmark of the report queries answered from the grid square aggregates of the records layer
+
+Builds the grid pyramid of a synthetic GeoPackage of polygon records (see reporting_suite.py) and
+compares, for the selections of the reporting suite and a 20 km square, the records fetched from
+the provider (`ReportingEngine.fetch_selection`) with the aggregates of the inner grid squares
+combined with the records of the border squares (`GridPyramid.fetch`). The reported species
+counts must be equal. Reports the build time, the size of the pyramid on disk and the median time
+of each query. Requires a QGIS Python environment:
+
+    python benchmarks/grid_pyramid.py [--records 1000000] [--repeat 3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from qgis.core import QgsApplication, QgsGeometry, QgsRectangle, QgsSettings, QgsVectorLayerFeatureSource  # noqa: E402
+from reporting_suite import EXTENT, gpkg_layer, record_fields, selections  # noqa: E402
+
+
+def median_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def species_counts(records, record_filter):
+    if records is None:
+        return None
+    return {name: value.count for name, value in records.aggregate(record_filter).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "nnpa_reporting_benchmark"))
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    from NnpaReporting.engine import FIELD_SETTINGS, ReportingEngine
+    from NnpaReporting.grid_pyramid import GridPyramid, GridPyramidBuildTask, pyramid_directory, pyramid_key
+    from NnpaReporting.selection import SelectionGeometry
+
+    mapping = {key: default for key, (_, default) in FIELD_SETTINGS.items()}
+    for key, (setting, _) in FIELD_SETTINGS.items():
+        QgsSettings().setValue(f"plugins/nnpa_reporting_plugin/{setting}", mapping[key])
+    os.makedirs(args.data_dir, exist_ok=True)
+    layer = gpkg_layer(args.records, record_fields(mapping), args.data_dir)
+    engine = ReportingEngine(layer)
+
+    # built on this thread, as the task manager would do in the background
+    task = GridPyramidBuildTask(engine)
+    start = time.perf_counter()
+    if not task.run():
+        raise RuntimeError(f"Grid pyramid not built: {task.error}")
+    build_time = time.perf_counter() - start
+    key = pyramid_key(engine)
+    pyramid = GridPyramid.load(layer, key)
+    size = os.path.getsize(os.path.join(pyramid_directory(layer, key), "pyramid.pickle"))
+    print(f"{args.records} polygon records")
+    print(f"grid pyramid built in {build_time:.1f} s, {size / 1e6:.1f} MB on disk")
+
+    center = EXTENT.center()
+    square = QgsRectangle(center.x() - 10000, center.y() - 10000, center.x() + 10000, center.y() + 10000)
+    benchmarked = selections() + [("20km", QgsGeometry.fromRect(square), 0)]
+
+    source = QgsVectorLayerFeatureSource(layer)
+    record_filter = engine.record_filter()
+    print(f"{'selection':>10} {'records':>9} {'provider s':>11} {'pyramid s':>10} {'speedup':>8}")
+    for name, geom, buffer_value in benchmarked:
+        selection = SelectionGeometry(geom, buffer_value)
+        provider_time, records = median_time(lambda: engine.fetch_selection(selection), args.repeat)
+        pyramid_time, pyramid_records = median_time(lambda: pyramid.fetch(selection, engine, source), args.repeat)
+        if pyramid_records is None:
+            print(f"{name:>10} {len(records):>9} {provider_time:>11.3f} {'no inner square':>19}")
+            continue
+        if species_counts(pyramid_records, record_filter) != species_counts(records, record_filter):
+            print(f"  {name}: the species counts of the pyramid differ")
+        speedup = provider_time / pyramid_time if pyramid_time else float("inf")
+        print(f"{name:>10} {len(records):>9} {provider_time:>11.3f} {pyramid_time:>10.3f} {speedup:>7.1f}x")
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark of the live count of a geometry being drawn
+
+Replays the pauses of a rectangle dragged over a synthetic GeoPackage of polygon records (see
+reporting_suite.py), each a bit larger than the previous one, and compares counting the records
+of each rectangle from scratch with updating the `FidPrefilter` of the previous one. The final
+counts must be equal. Requires a QGIS Python environment:
+
+    python benchmarks/live_preview.py [--records 1000000] [--steps 10]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from qgis.core import QgsApplication, QgsGeometry, QgsRectangle, QgsVectorLayerFeatureSource  # noqa: E402
+from reporting_suite import EXTENT, gpkg_layer, record_fields  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--size", type=float, default=10000, help="side of the last rectangle in meters")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "nnpa_reporting_benchmark"))
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    from NnpaReporting.engine import FIELD_SETTINGS
+    from NnpaReporting.preview import FidPrefilter, matching_ids
+
+    mapping = {key: default for key, (_, default) in FIELD_SETTINGS.items()}
+    os.makedirs(args.data_dir, exist_ok=True)
+    layer = gpkg_layer(args.records, record_fields(mapping), args.data_dir)
+    source = QgsVectorLayerFeatureSource(layer)
+
+    center = EXTENT.center()
+    prefilter = FidPrefilter()
+    total_full = total_prefilter = 0
+    print(f"{args.records} polygon records")
+    print(f"{'step':>4} {'records':>9} {'full s':>8} {'prefilter s':>12}")
+    for step in range(1, args.steps + 1):
+        side = args.size * step / args.steps
+        geom = QgsGeometry.fromRect(QgsRectangle(center.x(), center.y(), center.x() + side, center.y() + side))
+
+        start = time.perf_counter()
+        fids = matching_ids(source, geom)
+        full_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        prefilter = prefilter.updated(source, geom)
+        prefilter_time = time.perf_counter() - start
+
+        if len(prefilter) != len(fids):
+            print(f"  step {step}: {len(prefilter)} prefilter records instead of {len(fids)}")
+        total_full += full_time
+        total_prefilter += prefilter_time
+        print(f"{step:>4} {len(fids):>9} {full_time:>8.3f} {prefilter_time:>12.3f}")
+    print(f"{'all':>4} {'':>9} {total_full:>8.3f} {total_prefilter:>12.3f}")
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Benchmark of the partitioned scan of large selections on several cores
+
+Compares, for the selections of the reporting suite and county-sized squares on a synthetic
+GeoPackage of polygon records (see reporting_suite.py), the records collected by a single scan of
+the selection (`ReportingEngine.features`) with the records of the partitions of its extent
+(`PartitionTask`) scanned by parallel threads, each with its own feature source, and merged with
+`RecordCache.merged`. The species counts must be equal. Requires a QGIS Python environment:
+
+    python benchmarks/partitioned_scan.py [--records 1000000] [--workers 16] [--repeat 3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from qgis.core import QgsApplication, QgsGeometry, QgsRectangle, QgsVectorLayerFeatureSource  # noqa: E402
+from qgis.PyQt.QtCore import QThread  # noqa: E402
+from reporting_suite import EXTENT, gpkg_layer, record_fields, selections  # noqa: E402
+
+
+def median_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def species_counts(records, record_filter):
+    return {name: value.count for name, value in records.aggregate(record_filter).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, default=QThread.idealThreadCount())
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "nnpa_reporting_benchmark"))
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    from NnpaReporting.engine import FIELD_SETTINGS, ReportingEngine
+    from NnpaReporting.query_task import PartitionTask
+    from NnpaReporting.record_cache import RecordCache
+    from NnpaReporting.selection import SelectionGeometry
+
+    mapping = {key: default for key, (_, default) in FIELD_SETTINGS.items()}
+    os.makedirs(args.data_dir, exist_ok=True)
+    layer = gpkg_layer(args.records, record_fields(mapping), args.data_dir)
+    engine = ReportingEngine(layer, mapping)
+    record_filter = engine.record_filter()
+
+    center = EXTENT.center()
+    benchmarked = list(selections())
+    for side in (20000, 50000):
+        half = side / 2
+        square = QgsRectangle(center.x() - half, center.y() - half, center.x() + half, center.y() + half)
+        benchmarked.append((f"{side // 1000}km", QgsGeometry.fromRect(square), 0))
+
+    def single_scan(selection):
+        source = QgsVectorLayerFeatureSource(layer)
+        return engine.collect_records(engine.features(selection, source))
+
+    def partitioned_scan(selection, rects):
+        # as the task manager runs the sub-tasks of a QueryTask, one thread per partition
+        tasks = [PartitionTask(engine, selection, rect) for rect in rects]
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            if not all(executor.map(lambda task: task.run(), tasks)):
+                raise RuntimeError(next(task.error for task in tasks if task.error))
+        return RecordCache.merged(engine.precision.rank, [task.result for task in tasks])
+
+    print(f"{args.records} polygon records, {args.workers} workers")
+    print(f"{'selection':>10} {'records':>9} {'partitions':>10} {'single s':>9} {'partitioned s':>14} {'speedup':>8}")
+    for name, geom, buffer_value in benchmarked:
+        selection = SelectionGeometry(geom, buffer_value)
+        rects = engine.partitions(selection, args.workers)
+        single_time, records = median_time(lambda: single_scan(selection), args.repeat)
+        partitioned_time, partitioned_records = median_time(lambda: partitioned_scan(selection, rects), args.repeat)
+        if species_counts(partitioned_records, record_filter) != species_counts(records, record_filter):
+            print(f"  {name}: the species counts of the partitioned scan differ")
+        speedup = single_time / partitioned_time if partitioned_time else float("inf")
+        print(
+            f"{name:>10} {len(records):>9} {len(rects):>10} {single_time:>9.3f} {partitioned_time:>14.3f} "
+            f"{speedup:>7.1f}x"
+        )
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Startup time of the plugin: loading it when QGIS starts vs. the first run of the tool
+
+Loads the plugin the way QGIS does (`classFactory` then `initGui`) with a mocked QGIS interface
+and the records layer saved in the plugin settings, then times the first `run()`, which opens the
+layer, loads the output dialog and scans the precision values. Each measurement runs in a fresh
+process so that the module imports are included. Requires a QGIS Python environment:
+
+    python benchmarks/plugin_startup.py --uri /data/records.gpkg --provider ogr [--repeat 5]
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+
+def measure(uri, provider):
+    """Prints the startup and first run times of the plugin in seconds"""
+    from qgis.core import QgsApplication, QgsSettings
+    from qgis.testing.mocked import get_iface
+
+    qgs = QgsApplication([], True)
+    qgs.initQgis()
+    iface = get_iface()
+    s = QgsSettings()
+    s.setValue("plugins/nnpa_reporting_plugin/layer_uri", uri)
+    s.setValue("plugins/nnpa_reporting_plugin/layer_provider", provider)
+
+    start = time.perf_counter()
+    import NnpaReporting
+
+    plugin = NnpaReporting.classFactory(iface)
+    plugin.initGui()
+    startup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    plugin.run()
+    first_run = time.perf_counter() - start
+    print(startup, first_run)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", required=True, help="records layer source")
+    parser.add_argument("--provider", default="ogr", help="records layer provider, e.g. ogr, postgres")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.uri, args.provider)
+        return
+
+    startups, first_runs = [], []
+    for _ in range(args.repeat):
+        command = [sys.executable, __file__, "--uri", args.uri, "--provider", args.provider, "--measure"]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        startup, first_run = (float(t) for t in output.split()[-2:])
+        startups.append(startup)
+        first_runs.append(first_run)
+
+    print(f"{'':>10} {'median s':>9} {'min s':>9}")
+    print(f"{'startup':>10} {statistics.median(startups):>9.3f} {min(startups):>9.3f}")
+    print(f"{'first run':>10} {statistics.median(first_runs):>9.3f} {min(first_runs):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
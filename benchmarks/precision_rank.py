@@ -0,0 +1,109 @@
+"""Micro-benchmark of the per-record precision min/max update of the species aggregation
+
+Compares the former `list.index` based lookup with the precomputed precision rank lookup on a
+synthetic layer, for an increasing number of precision categories. Does not require QGIS:
+
+    python benchmarks/precision_rank.py [--records 500000] [--species 300]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from NnpaReporting.precision import UNKNOWN_RANK, PrecisionDomain  # noqa: E402
+
+
+def synthetic_records(count, species, categories, seed=0):
+    """Records as (name, precision) tuples, ~2% of them with NULL or invalid precision"""
+    rnd = random.Random(seed)
+    precisions = [f"{(i + 1) * 10}m" for i in range(categories)]
+    invalid = [None, "unknown", "see notes"]
+    names = [f"Species {i}" for i in range(species)]
+    records = []
+    for _ in range(count):
+        precision = rnd.choice(invalid) if rnd.random() < 0.02 else rnd.choice(precisions)
+        records.append((rnd.choice(names), precision))
+    return records, precisions + invalid
+
+
+def aggregate_index(records, precision_values):
+    """The former implementation, four `list.index` scans per record"""
+    output_dict = {}
+    for name, precision in records:
+        if name not in output_dict:
+            output_dict[name] = {"precision_min": precision, "precision_max": precision}
+            continue
+        dict_feature = output_dict[name]
+        try:
+            if not dict_feature["precision_max"] or precision_values.index(str(precision)) > precision_values.index(
+                str(dict_feature["precision_max"])
+            ):
+                dict_feature["precision_max"] = precision
+        except ValueError:
+            pass
+        try:
+            if not dict_feature["precision_min"] or precision_values.index(str(precision)) < precision_values.index(
+                str(dict_feature["precision_min"])
+            ):
+                dict_feature["precision_min"] = precision
+        except ValueError:
+            pass
+    return output_dict
+
+
+def aggregate_rank(records, domain):
+    """The rank lookup used by `SpeciesAggregate.update_precision`"""
+    output_dict = {}
+    precision_rank = domain.rank
+    for name, precision in records:
+        rank = precision_rank(precision)
+        if name not in output_dict:
+            output_dict[name] = {
+                "precision_min": precision,
+                "precision_max": precision,
+                "rank_min": rank,
+                "rank_max": rank,
+            }
+            continue
+        dict_feature = output_dict[name]
+        if rank > dict_feature["rank_max"]:
+            dict_feature["rank_max"] = rank
+            dict_feature["precision_max"] = precision
+        if rank != UNKNOWN_RANK and (rank < dict_feature["rank_min"] or dict_feature["rank_min"] == UNKNOWN_RANK):
+            dict_feature["rank_min"] = rank
+            dict_feature["precision_min"] = precision
+    return output_dict
+
+
+def per_record_ns(func, records, *args, repeat=3):
+    best = min(timed(func, records, *args) for _ in range(repeat))
+    return best / len(records) * 1e9
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=500000)
+    parser.add_argument("--species", type=int, default=300)
+    args = parser.parse_args()
+
+    print(f"{'categories':>10} {'index ns/record':>16} {'rank ns/record':>15} {'speedup':>8}")
+    for categories in (5, 20, 100):
+        records, unique_values = synthetic_records(args.records, args.species, categories)
+        domain = PrecisionDomain(unique_values)
+        index_ns = per_record_ns(aggregate_index, records, domain.values)
+        rank_ns = per_record_ns(aggregate_rank, records, domain)
+        print(f"{categories:>10} {index_ns:>16.1f} {rank_ns:>15.1f} {index_ns / rank_ns:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""End to end benchmark of the species reports on synthetic NNPA-like record layers
+
+Generates polygon record layers (grid squares sized by the record precision, skewed species
+distribution, dates over 30 years, ~2% of unknown precision) of the requested sizes, as memory
+layers and GeoPackages, and times each phase of a report for a point, a rectangle, a buffered
+point, a complex polygon and a 50000 vertices boundary (tiled) selection:
+
+- query: fetching the records matching the selection (`ReportingEngine.fetch`)
+- aggregation: aggregating the records with the default filters (`perform_request`)
+- tree: populating the output dialog tree (`populate_results`)
+- export: loading the results as a layer (`load_results_as_layer`)
+
+Requires a QGIS Python environment. The generated GeoPackages are kept in `--data-dir` (in the
+temporary directory by default) and reused by the following runs. The results are saved as
+JSON so runs can be compared:
+
+    python benchmarks/reporting_suite.py [--sizes 10k,1M,10M] [--formats memory,gpkg] [--output results.json]
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from qgis.core import (  # noqa: E402
+    Qgis,
+    QgsApplication,
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransformContext,
+    QgsFeature,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsPointXY,
+    QgsProject,
+    QgsRectangle,
+    QgsSettings,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+from qgis.PyQt.QtCore import QVariant  # noqa: E402
+
+from NnpaReporting.selection import SelectionGeometry  # noqa: E402
+
+CRS = QgsCoordinateReferenceSystem("EPSG:27700")
+
+# 100 km x 100 km area of the National Grid
+EXTENT = QgsRectangle(400000, 500000, 500000, 600000)
+
+# precision values with their share of the records and the size of their grid square in metres
+PRECISIONS = [
+    ("1m", 0.02, 1),
+    ("10m", 0.15, 10),
+    ("100m", 0.40, 100),
+    ("1km", 0.30, 1000),
+    ("2km", 0.05, 2000),
+    ("10km", 0.06, 10000),
+]
+UNKNOWN_PRECISIONS = [None, "unknown", "see notes"]
+
+SPECIES = 2000
+BATCH_SIZE = 100000
+
+
+def parse_size(text):
+    """'10k' -> 10000, '1M' -> 1000000"""
+    multipliers = {"k": 1000, "m": 1000000}
+    text = text.strip()
+    if text[-1].lower() in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1].lower()])
+    return int(text)
+
+
+def record_fields(mapping):
+    fields = QgsFields()
+    for key in ("name", "date", "precision", "grid_refer", "latin_name", "recorder", "survey_name"):
+        fields.append(QgsField(mapping[key], QVariant.String))
+    return fields
+
+
+def synthetic_features(count, fields, seed=0):
+    """Stream of record features in the order of the record_fields"""
+    rnd = random.Random(seed)
+    values, weights, sizes = zip(*PRECISIONS)
+    square_size = dict(zip(values, sizes))
+    for fid in range(count):
+        s = int(SPECIES ** rnd.random()) - 1  # log-uniform, a few species hold most records
+        day = rnd.randrange(30 * 365)
+        if rnd.random() < 0.02:
+            precision = rnd.choice(UNKNOWN_PRECISIONS)
+            size = 100
+        else:
+            precision = rnd.choices(values, weights)[0]
+            size = square_size[precision]
+        # records cluster around a few hundred hotspots
+        rnd_hotspot = random.Random(s % 300)
+        cx = rnd_hotspot.uniform(EXTENT.xMinimum(), EXTENT.xMaximum()) + rnd.gauss(0, 5000)
+        cy = rnd_hotspot.uniform(EXTENT.yMinimum(), EXTENT.yMaximum()) + rnd.gauss(0, 5000)
+        x = math.floor(cx / size) * size
+        y = math.floor(cy / size) * size
+
+        f = QgsFeature(fields, fid + 1)
+        f.setAttributes(
+            [
+                f"Species {s}",
+                f"{day % 28 + 1:02d}/{day // 28 % 12 + 1:02d}/{1990 + day // 365}",
+                precision,
+                f"NY{int(x) // 1000 % 100:02d}{int(y) // 1000 % 100:02d}",
+                f"Latinus {s}",
+                f"Recorder {rnd.randrange(500)}",
+                f"Survey {rnd.randrange(100)}",
+            ]
+        )
+        f.setGeometry(QgsGeometry.fromRect(QgsRectangle(x, y, x + size, y + size)))
+        yield f
+
+
+def batches(features, size=BATCH_SIZE):
+    batch = []
+    for f in features:
+        batch.append(f)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def memory_layer(count, fields):
+    layer = QgsVectorLayer(f"Polygon?crs={CRS.authid()}", f"records_{count}", "memory")
+    dp = layer.dataProvider()
+    dp.addAttributes(fields.toList())
+    layer.updateFields()
+    for batch in batches(synthetic_features(count, layer.fields())):
+        dp.addFeatures(batch)
+    dp.createSpatialIndex()
+    return layer
+
+
+def gpkg_layer(count, fields, data_dir):
+    """GeoPackage with a spatial index, generated once and reused"""
+    path = os.path.join(data_dir, f"records_{count}.gpkg")
+    if not os.path.exists(path):
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = "GPKG"
+        options.layerName = "records"
+        writer = QgsVectorFileWriter.create(
+            path + ".tmp", fields, QgsWkbTypes.Polygon, CRS, QgsCoordinateTransformContext(), options
+        )
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise RuntimeError(writer.errorMessage())
+        for batch in batches(synthetic_features(count, fields)):
+            writer.addFeatures(batch)
+        del writer  # flushes and closes the file
+        os.rename(path + ".tmp", path)
+    return QgsVectorLayer(f"{path}|layername=records", f"records_{count}", "ogr")
+
+
+def complex_polygon(center, vertices=2000, seed=0):
+    """Star shaped polygon with many vertices, the kind of shape of a site boundary"""
+    rnd = random.Random(seed)
+    points = []
+    for i in range(vertices):
+        angle = 2 * math.pi * i / vertices
+        radius = rnd.uniform(3000, 5000)
+        points.append(QgsPointXY(center.x() + radius * math.cos(angle), center.y() + radius * math.sin(angle)))
+    return QgsGeometry.fromPolygonXY([points + points[:1]])
+
+
+def selections():
+    """(name, geometry, buffer) of the benchmarked selections"""
+    center = EXTENT.center()
+    rectangle = QgsRectangle(center.x(), center.y(), center.x() + 2000, center.y() + 2000)
+    return [
+        ("point", QgsGeometry.fromPointXY(center), 0),
+        ("rectangle", QgsGeometry.fromRect(rectangle), 0),
+        ("buffer", QgsGeometry.fromPointXY(center), 1000),
+        ("complex", complex_polygon(center), 0),
+        ("boundary", complex_polygon(center, vertices=50000), 0),
+    ]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run_selection(dialog, name, geom, buffer_value, repeat):
+    """Times each phase of the report of a selection, `repeat` times"""
+    timings = {"query": [], "aggregation": [], "tree": [], "export": []}
+    for _ in range(repeat):
+        records, elapsed = timed(dialog.engine.fetch, geom, buffer_value)
+        timings["query"].append(elapsed)
+        results, elapsed = timed(dialog.perform_request, records)
+        timings["aggregation"].append(elapsed)
+
+        dialog.selection = SelectionGeometry(geom, buffer_value)
+        _, elapsed = timed(dialog.populate_results, results)
+        timings["tree"].append(elapsed)
+        _, elapsed = timed(dialog.load_results_as_layer)
+        timings["export"].append(elapsed)
+        QgsProject.instance().removeAllMapLayers()
+
+    return {
+        "selection": name,
+        "buffer": buffer_value,
+        "species": len(results),
+        "records": sum(value.count for value in results.values()),
+        "phases": {
+            phase: {"min_s": min(values), "median_s": statistics.median(values)} for phase, values in timings.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10k,1M,10M", help="comma separated record counts, e.g. 10k,1M")
+    parser.add_argument("--formats", default="memory,gpkg", help="comma separated layer formats: memory, gpkg")
+    parser.add_argument("--selections", default="point,rectangle,buffer,complex,boundary")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "nnpa_reporting_benchmark"))
+    parser.add_argument("--output", default="reporting_suite.json")
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], True)
+    qgs.initQgis()
+
+    from NnpaReporting.engine import FIELD_SETTINGS
+    from NnpaReporting.output_dialog import OutputDialog
+
+    mapping = {key: default for key, (_, default) in FIELD_SETTINGS.items()}
+    fields = record_fields(mapping)
+    wanted = args.selections.split(",")
+    os.makedirs(args.data_dir, exist_ok=True)
+
+    runs = []
+    for count in (parse_size(size) for size in args.sizes.split(",")):
+        for layer_format in args.formats.split(","):
+            print(f"{layer_format} layer of {count} records", flush=True)
+            if layer_format == "memory":
+                layer, elapsed = timed(memory_layer, count, fields)
+            else:
+                layer, elapsed = timed(gpkg_layer, count, fields, args.data_dir)
+            if not layer.isValid():
+                raise RuntimeError(f"Invalid {layer_format} layer of {count} records")
+
+            # the dialog reads the field names from the settings
+            for key, (setting, _) in FIELD_SETTINGS.items():
+                QgsSettings().setValue(f"plugins/nnpa_reporting_plugin/{setting}", mapping[key])
+            dialog, dialog_elapsed = timed(OutputDialog, layer)
+            print(f"  layer ready in {elapsed:.1f} s, dialog in {dialog_elapsed:.2f} s")
+
+            for name, geom, buffer_value in selections():
+                if name not in wanted:
+                    continue
+                result = run_selection(dialog, name, geom, buffer_value, args.repeat)
+                result.update({"layer_format": layer_format, "layer_records": count})
+                runs.append(result)
+                phases = ", ".join(f"{phase} {t['median_s']:.3f} s" for phase, t in result["phases"].items())
+                print(f"  {name:>10}: {result['records']:>9} records, {result['species']:>5} species | {phases}")
+
+            dialog.deleteLater()
+            del layer
+
+    with open(args.output, "w") as output:
+        json.dump(
+            {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "qgis_version": Qgis.version(),
+                "python_version": platform.python_version(),
+                "platform": platform.platform(),
+                "repeat": args.repeat,
+                "runs": runs,
+            },
+            output,
+            indent=2,
+        )
+    print(f"Results saved to {args.output}")
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Benchmark of the feature requests reading the matching records of a polygon record layer
+
+Compares, on a synthetic GeoPackage of polygon records (see reporting_suite.py):
+
+- overwritten flags: the former request, `NoGeometry` replaced by `ExactIntersect`, so every
+  geometry is decoded and returned
+- no geometry: `NoGeometry | ExactIntersect`, the provider tests the geometries but only returns
+  the mapped attributes
+- two stages: the ids of the matching records first, then their attributes by id
+
+and reports the time per feature and the bytes returned to Python (geometry WKB and attribute
+text). Requires a QGIS Python environment:
+
+    python benchmarks/request_paths.py [--records 1000000] [--repeat 3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from qgis.core import QgsApplication, QgsFeatureRequest, QgsGeometry, QgsRectangle  # noqa: E402
+from reporting_suite import EXTENT, complex_polygon, gpkg_layer, record_fields  # noqa: E402
+
+FID_BATCH_SIZE = 10000
+
+
+def returned_bytes(feature):
+    size = sum(len(str(value)) for value in feature.attributes() if value is not None)
+    if feature.hasGeometry():
+        size += feature.geometry().wkbSize()
+    return size
+
+
+def overwritten_flags(layer, geom, indexes):
+    request = (
+        QgsFeatureRequest()
+        .setDistanceWithin(geom, 0)
+        .setFlags(QgsFeatureRequest.NoGeometry)
+        .setFlags(QgsFeatureRequest.ExactIntersect)
+        .setSubsetOfAttributes(indexes)
+    )
+    yield from layer.getFeatures(request)
+
+
+def no_geometry(layer, geom, indexes):
+    request = (
+        QgsFeatureRequest()
+        .setDistanceWithin(geom, 0)
+        .setFlags(QgsFeatureRequest.NoGeometry | QgsFeatureRequest.ExactIntersect)
+        .setSubsetOfAttributes(indexes)
+    )
+    yield from layer.getFeatures(request)
+
+
+def two_stages(layer, geom, indexes):
+    request = (
+        QgsFeatureRequest()
+        .setDistanceWithin(geom, 0)
+        .setFlags(QgsFeatureRequest.NoGeometry | QgsFeatureRequest.ExactIntersect)
+        .setNoAttributes()
+    )
+    fids = sorted(f.id() for f in layer.getFeatures(request))
+    for start in range(0, len(fids), FID_BATCH_SIZE):
+        request = (
+            QgsFeatureRequest()
+            .setFilterFids(fids[start : start + FID_BATCH_SIZE])
+            .setFlags(QgsFeatureRequest.NoGeometry)
+            .setSubsetOfAttributes(indexes)
+        )
+        yield from layer.getFeatures(request)
+
+
+def measure(path, layer, geom, indexes, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = 0
+        size = 0
+        for feature in path(layer, geom, indexes):
+            count += 1
+            size += returned_bytes(feature)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), count, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "nnpa_reporting_benchmark"))
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    from NnpaReporting.engine import FIELD_SETTINGS
+
+    mapping = {key: default for key, (_, default) in FIELD_SETTINGS.items()}
+    os.makedirs(args.data_dir, exist_ok=True)
+    layer = gpkg_layer(args.records, record_fields(mapping), args.data_dir)
+    indexes = [layer.fields().indexOf(name) for name in mapping.values()]
+
+    center = EXTENT.center()
+    rectangle = QgsRectangle(center.x(), center.y(), center.x() + 5000, center.y() + 5000)
+    selections = [
+        ("rectangle", QgsGeometry.fromRect(rectangle)),
+        ("complex", complex_polygon(center)),
+    ]
+    paths = [("overwritten flags", overwritten_flags), ("no geometry", no_geometry), ("two stages", two_stages)]
+
+    print(f"{args.records} polygon records")
+    print(f"{'selection':>10} {'request':>18} {'features':>9} {'time s':>8} {'us/feature':>11} {'MB returned':>12}")
+    for name, geom in selections:
+        for label, path in paths:
+            elapsed, count, size = measure(path, layer, geom, indexes, args.repeat)
+            per_feature = 1e6 * elapsed / max(count, 1)
+            print(f"{name:>10} {label:>18} {count:>9} {elapsed:>8.3f} {per_feature:>11.1f} {size / 1e6:>12.1f}")
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Benchmark of the sensitive species exclusion for large exclusion lists
+
+Compares the former `"name" not in ('a','b',...)` filter expression, compiled and evaluated per
+feature by QgsExpression, with the normalized hash set of `RecordFilter.accepts_name`, per record
+and per distinct name (as used on the record cache). The expression baseline requires QGIS and
+is skipped when it is not available:
+
+    python benchmarks/sensitive_exclusion.py [--records 200000] [--excluded 100,1000,5000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from NnpaReporting.filters import RecordFilter  # noqa: E402
+
+SPECIES = 20000
+
+
+def synthetic_names(count, seed=0):
+    rnd = random.Random(seed)
+    return [f"Species {int(SPECIES ** rnd.random()) - 1}" for _ in range(count)]
+
+
+def excluded_names(count):
+    # every other name of the list has a different case or spacing than the records
+    return [f"species  {i}" if i % 2 else f"Species {i}" for i in range(0, 2 * count, 2)]
+
+
+def time_expression(names, excluded):
+    """The former expression, None if QGIS is not available"""
+    try:
+        from qgis.core import QgsExpression, QgsExpressionContext, QgsFeature, QgsField, QgsFields
+        from qgis.PyQt.QtCore import QVariant
+    except ImportError:
+        return None, None
+
+    fields = QgsFields()
+    fields.append(QgsField("name", QVariant.String))
+    excluded_str = "'" + "','".join(excluded) + "'"
+    start = time.perf_counter()
+    expression = QgsExpression(f'"name" not in ({excluded_str})')
+    context = QgsExpressionContext()
+    context.setFields(fields)
+    expression.prepare(context)
+    feature = QgsFeature(fields)
+    kept = 0
+    for name in names:
+        feature.setAttributes([name])
+        context.setFeature(feature)
+        kept += bool(expression.evaluate(context))
+    return time.perf_counter() - start, kept
+
+
+def time_per_record(names, excluded):
+    start = time.perf_counter()
+    record_filter = RecordFilter(0, 0, excluded_names=excluded)
+    kept = sum(record_filter.accepts_name(name) for name in names)
+    return time.perf_counter() - start, kept
+
+
+def time_per_distinct_name(names, excluded):
+    """Filter evaluated once per distinct name, as on the dictionary encoded record cache"""
+    start = time.perf_counter()
+    record_filter = RecordFilter(0, 0, excluded_names=excluded)
+    accepted = {name: record_filter.accepts_name(name) for name in set(names)}
+    kept = sum(accepted[name] for name in names)
+    return time.perf_counter() - start, kept
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--excluded", default="100,1000,5000", help="comma separated exclusion list sizes")
+    args = parser.parse_args()
+
+    names = synthetic_names(args.records)
+    print(f"{args.records} records, times in seconds")
+    print(f"{'excluded':>8} {'expression':>11} {'hash set':>9} {'per name':>9} {'kept':>8} {'kept (expr)':>12}")
+    for count in (int(c) for c in args.excluded.split(",")):
+        excluded = excluded_names(count)
+        expr_time, expr_kept = time_expression(names, excluded)
+        set_time, kept = time_per_record(names, excluded)
+        name_time, _ = time_per_distinct_name(names, excluded)
+        expr_text = f"{expr_time:>11.3f}" if expr_time is not None else f"{'n/a':>11}"
+        expr_kept_text = f"{expr_kept:>12}" if expr_kept is not None else f"{'n/a':>12}"
+        # the expression is case sensitive, it keeps the records of the differently written names
+        print(f"{count:>8} {expr_text} {set_time:>9.3f} {name_time:>9.3f} {kept:>8} {expr_kept_text}")
+
+
+if __name__ == "__main__":
+    main()
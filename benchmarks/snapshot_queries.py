@@ -0,0 +1,88 @@
+"""Benchmark of the report queries answered from the local snapshot of the records layer
+
+Builds the snapshot of a synthetic GeoPackage of polygon records (see reporting_suite.py) and
+compares, for the selections of the reporting suite, the records fetched from the provider
+(`ReportingEngine.fetch_selection`) with the ones read from the snapshot (`RecordSnapshot.fetch`).
+Reports the build time, the size of the snapshot on disk and the median time of each query.
+Requires a QGIS Python environment with NumPy:
+
+    python benchmarks/snapshot_queries.py [--records 1000000] [--repeat 3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from qgis.core import QgsApplication, QgsSettings, QgsVectorLayerFeatureSource  # noqa: E402
+from reporting_suite import gpkg_layer, record_fields, selections  # noqa: E402
+
+
+def median_time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "nnpa_reporting_benchmark"))
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    from NnpaReporting.engine import FIELD_SETTINGS, ReportingEngine
+    from NnpaReporting.selection import SelectionGeometry
+    from NnpaReporting.snapshot import RecordSnapshot, SnapshotBuildTask, snapshot_available, snapshot_key
+
+    if not snapshot_available():
+        raise RuntimeError("NumPy is required by the snapshot")
+
+    mapping = {key: default for key, (_, default) in FIELD_SETTINGS.items()}
+    for key, (setting, _) in FIELD_SETTINGS.items():
+        QgsSettings().setValue(f"plugins/nnpa_reporting_plugin/{setting}", mapping[key])
+    os.makedirs(args.data_dir, exist_ok=True)
+    layer = gpkg_layer(args.records, record_fields(mapping), args.data_dir)
+    engine = ReportingEngine(layer)
+
+    # built on this thread, as the task manager would do in the background
+    task = SnapshotBuildTask(engine)
+    start = time.perf_counter()
+    if not task.run():
+        raise RuntimeError(f"Snapshot not built: {task.error}")
+    build_time = time.perf_counter() - start
+    snapshot = RecordSnapshot.load(layer, snapshot_key(engine))
+    print(f"{args.records} polygon records")
+    print(f"snapshot built in {build_time:.1f} s, {directory_size(snapshot.directory) / 1e6:.1f} MB on disk")
+
+    source = QgsVectorLayerFeatureSource(layer)
+    print(f"{'selection':>10} {'records':>9} {'provider s':>11} {'snapshot s':>11} {'speedup':>8}")
+    for name, geom, buffer_value in selections():
+        selection = SelectionGeometry(geom, buffer_value)
+        provider_time, records = median_time(lambda: engine.fetch_selection(selection), args.repeat)
+        snapshot_time, snapshot_records = median_time(
+            lambda: snapshot.fetch(selection, source, engine.precision.rank), args.repeat
+        )
+        if len(snapshot_records) != len(records):
+            print(f"  {name}: {len(snapshot_records)} snapshot records instead of {len(records)}")
+        speedup = provider_time / snapshot_time if snapshot_time else float("inf")
+        print(f"{name:>10} {len(records):>9} {provider_time:>11.3f} {snapshot_time:>11.3f} {speedup:>7.1f}x")
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Benchmark of the report queries on a records layer without spatial index
+
+Writes a synthetic GeoPackage of polygon records (see reporting_suite.py) without spatial index
+and times the queries of the reporting suite selections (`ReportingEngine.features`):
+
+- no index: the provider's distance filter scans the whole table
+- memory index: the candidates come from the in-memory QgsSpatialIndex of the index check
+- built index: after `createSpatialIndex`, as offered by the index check
+
+Requires a QGIS Python environment:
+
+    python benchmarks/spatial_index.py [--records 1000000] [--repeat 3]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from qgis.core import (  # noqa: E402
+    QgsApplication,
+    QgsCoordinateTransformContext,
+    QgsFeatureRequest,
+    QgsSpatialIndex,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+    QgsWkbTypes,
+)
+from reporting_suite import CRS, batches, record_fields, selections, synthetic_features  # noqa: E402
+
+
+def unindexed_gpkg_layer(count, fields, data_dir):
+    """GeoPackage without spatial index, written again on each run since the benchmark indexes it"""
+    path = os.path.join(data_dir, f"records_{count}_no_index.gpkg")
+    if os.path.exists(path):
+        os.remove(path)
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+    options.layerName = "records"
+    options.layerOptions = ["SPATIAL_INDEX=NO"]
+    writer = QgsVectorFileWriter.create(
+        path, fields, QgsWkbTypes.Polygon, CRS, QgsCoordinateTransformContext(), options
+    )
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        raise RuntimeError(writer.errorMessage())
+    for batch in batches(synthetic_features(count, fields)):
+        writer.addFeatures(batch)
+    del writer  # flushes and closes the file
+    return QgsVectorLayer(f"{path}|layername=records", f"records_{count}", "ogr")
+
+
+def median_query_time(engine, selection, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = sum(1 for _ in engine.features(selection))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "nnpa_reporting_benchmark"))
+    args = parser.parse_args()
+
+    qgs = QgsApplication([], False)
+    qgs.initQgis()
+
+    from NnpaReporting.engine import FIELD_SETTINGS, ReportingEngine
+    from NnpaReporting.selection import SelectionGeometry
+
+    mapping = {key: default for key, (_, default) in FIELD_SETTINGS.items()}
+    os.makedirs(args.data_dir, exist_ok=True)
+    layer = unindexed_gpkg_layer(args.records, record_fields(mapping), args.data_dir)
+    engine = ReportingEngine(layer, mapping)
+    print(f"{args.records} polygon records, spatial index status {layer.hasSpatialIndex()}")
+
+    start = time.perf_counter()
+    index = QgsSpatialIndex(layer.getFeatures(QgsFeatureRequest().setNoAttributes()))
+    print(f"in-memory index built in {time.perf_counter() - start:.1f} s")
+
+    timings = {}
+    for name, geom, buffer_value in selections():
+        selection = SelectionGeometry(geom, buffer_value)
+        engine.spatial_index = None
+        timings[name] = [median_query_time(engine, selection, args.repeat)]
+        engine.spatial_index = index
+        timings[name].append(median_query_time(engine, selection, args.repeat))
+    engine.spatial_index = None
+
+    start = time.perf_counter()
+    layer.dataProvider().createSpatialIndex()
+    print(f"spatial index created in {time.perf_counter() - start:.1f} s")
+    for name, geom, buffer_value in selections():
+        timings[name].append(median_query_time(engine, SelectionGeometry(geom, buffer_value), args.repeat))
+
+    print(f"{'selection':>10} {'records':>9} {'no index s':>11} {'memory s':>9} {'built s':>8}")
+    for name, ((no_index, count), (memory, memory_count), (built, _)) in timings.items():
+        if memory_count != count:
+            print(f"  {name}: {memory_count} records with the memory index instead of {count}")
+        print(f"{name:>10} {count:>9} {no_index:>11.3f} {memory:>9.3f} {built:>8.3f}")
+    qgs.exitQgis()
+
+
+if __name__ == "__main__":
+    main()
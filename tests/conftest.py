@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.fixture(scope="session")
+def qgis_app():
+    """Initialized QgsApplication of the tests needing QGIS, they are skipped without a QGIS Python environment"""
+    qgis_core = pytest.importorskip("qgis.core")
+    app = qgis_core.QgsApplication([], False)
+    app.initQgis()
+    yield app
+    app.exitQgis()
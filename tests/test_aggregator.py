@@ -0,0 +1,176 @@
+import random
+import tracemalloc
+from datetime import date
+
+from NnpaReporting.aggregator import DateParser, SpeciesAggregator, comparable_date, date_range_text, distinct_text
+from NnpaReporting.precision import UNKNOWN_RANK, PrecisionDomain
+
+PRECISION = PrecisionDomain(["100m", "1km", "10m", "10km", "unknown"])
+
+RECORDS = [
+    # name, precision, date, grid_refer, latin_name, recorder, survey_name
+    ("Otter", "100m", "2019-05-03", "NY1010", "Lutra lutra", "Ann", "Rivers"),
+    ("Otter", "1km", "03/05/2019", "NY1010", "Lutra lutra", "Bob", "Rivers"),
+    ("Otter", "10km", "2001-01-31", "NY2020", "Lutra lutra", "Ann", None),
+    ("Badger", "unknown", "not a date", "NY3030", "Meles meles", "Cat", "Setts"),
+    ("Badger", "10m", None, "NY3030", "Meles meles", "Cat", "Setts"),
+]
+
+# attributes of the SpeciesAggregate compared between two aggregations of the same records
+COMPARED_ATTRIBUTES = (
+    "count",
+    "precision_min",
+    "precision_max",
+    "date",
+    "grid_refer",
+    "recorder",
+    "survey_name",
+    "earliest_date",
+    "latest_date",
+)
+
+
+def synthetic_records(count, seed=0):
+    """Records of a few species built from fresh strings, as read from a provider"""
+    rnd = random.Random(seed)
+    for _ in range(count):
+        s = rnd.randrange(50)
+        yield (
+            f"Species {s}",
+            rnd.choice(["10m", "100m", "1km"]),
+            f"{rnd.randrange(1, 29):02d}/{rnd.randrange(1, 13):02d}/2019",
+            f"NY{rnd.randrange(100):02d}",
+            f"Latinus {s}",
+            f"Recorder {rnd.randrange(20)}",
+            f"Survey {rnd.randrange(5)}",
+        )
+
+
+def test_aggregate_counts_precision_and_distinct_values():
+    results = SpeciesAggregator(PRECISION.rank, date_key=comparable_date).add_records(RECORDS).results
+
+    otter = results["Otter"]
+    assert otter.count == 3
+    assert (otter.precision_min, otter.precision_max) == ("100m", "10km")
+    assert otter.latin_name == "Lutra lutra"
+    # both formats of the same day are distinct values but the same date
+    assert otter.date == {"2019-05-03", "03/05/2019", "2001-01-31"}
+    assert (otter.earliest_date, otter.latest_date) == (date(2001, 1, 31), date(2019, 5, 3))
+    assert otter.grid_refer == {"NY1010", "NY2020"}
+    assert otter.recorder == {"Ann", "Bob"}
+    assert otter.survey_name == {"Rivers", None}
+    assert not otter.truncated
+
+    badger = results["Badger"]
+    assert badger.count == 2
+    # an unknown precision never wins over a valid one
+    assert (badger.precision_min, badger.precision_max) == ("10m", "10m")
+    assert badger.earliest_date is None
+
+
+def test_unknown_precision_only():
+    results = SpeciesAggregator(PRECISION.rank).add_records([RECORDS[3]]).results
+    assert results["Badger"].rank_min == results["Badger"].rank_max == UNKNOWN_RANK
+    assert results["Badger"].precision_min == "unknown"
+
+
+def test_max_distinct_caps_every_distinct_field():
+    records = list(synthetic_records(2000))
+    results = SpeciesAggregator(PRECISION.rank, max_distinct=3).add_records(records).results
+
+    assert sum(aggregate.count for aggregate in results.values()) == len(records)
+    for aggregate in results.values():
+        for values in (aggregate.date, aggregate.grid_refer, aggregate.recorder, aggregate.survey_name):
+            assert len(values) <= 3
+        assert aggregate.truncated
+
+
+def test_max_distinct_keeps_complete_values_untruncated():
+    results = SpeciesAggregator(PRECISION.rank, max_distinct=3).add_records(RECORDS).results
+    assert not results["Otter"].truncated
+    assert len(results["Otter"].date) == 3
+
+
+def test_distinct_text():
+    assert distinct_text(["b", None, "a"]) == "a, b"
+    assert distinct_text(["b", "a"], truncated=True) == "a, b, …"
+
+
+def test_track_frequencies():
+    aggregator = SpeciesAggregator(PRECISION.rank, track_frequencies=True).add_records(RECORDS)
+    assert aggregator.results["Otter"].recorder == {"Ann": 2, "Bob": 1}
+    assert aggregator.total_count == len(RECORDS)
+
+
+def test_distinct_values_are_shared_between_species():
+    aggregator = SpeciesAggregator(PRECISION.rank)
+    aggregator.add("A", "1km", "2019-01-01", "NY1010", None, "Ann", "S")
+    aggregator.add("B", "1km", "".join(["2019-", "01-01"]), "NY1010", None, "Ann", "S")
+    (a_date,) = aggregator.results["A"].date
+    (b_date,) = aggregator.results["B"].date
+    assert a_date is b_date
+
+
+def test_add_aggregate_matches_single_pass():
+    records = list(synthetic_records(3000))
+    single = SpeciesAggregator(PRECISION.rank, date_key=comparable_date).add_records(records).results
+
+    merged = SpeciesAggregator(PRECISION.rank)
+    for part in (records[:1000], records[1000:]):
+        partial = SpeciesAggregator(PRECISION.rank, date_key=comparable_date).add_records(part)
+        for name, aggregate in partial.results.items():
+            merged.add_aggregate(name, aggregate)
+
+    assert merged.results.keys() == single.keys()
+    for name, aggregate in single.items():
+        other = merged.results[name]
+        for key in COMPARED_ATTRIBUTES:
+            assert getattr(other, key) == getattr(aggregate, key), (name, key)
+
+
+def test_add_aggregate_applies_max_distinct():
+    partial = SpeciesAggregator(PRECISION.rank).add_records(synthetic_records(500)).results
+    merged = SpeciesAggregator(PRECISION.rank, max_distinct=2)
+    for name, aggregate in partial.items():
+        merged.add_aggregate(name, aggregate)
+    assert all(len(aggregate.grid_refer) <= 2 and aggregate.truncated for aggregate in merged.results.values())
+
+
+def test_streaming_memory_does_not_grow_with_the_records():
+    """Regression check of the streaming memory, benchmarks/aggregator_memory.py measures a 3M record layer"""
+
+    def peak(count):
+        tracemalloc.start()
+        SpeciesAggregator(PRECISION.rank, max_distinct=100).add_records(synthetic_records(count))
+        _, peak_size = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak_size
+
+    small = peak(20000)
+    large = peak(100000)
+    # the distinct values are saturated, five times the records hold about the same memory
+    assert large < 1.5 * small
+
+
+def test_date_parser():
+    parse = DateParser()
+    assert parse("2019-05-03") == date(2019, 5, 3)
+    assert parse(" 03/05/2019 ") == date(2019, 5, 3)
+    assert parse("2019-05-03T10:30:00") == date(2019, 5, 3)
+    assert parse(date(2019, 5, 3)) == date(2019, 5, 3)
+    assert parse("31/02/2019") is None
+    assert parse("2019") is None
+    assert parse("") is None
+    assert parse(None) is None
+    assert parse(20190503) is None
+    assert parse([]) is None  # unhashable values are not dates
+    assert len(parse.dates) == 9
+
+
+def test_date_range_text():
+    results = SpeciesAggregator(PRECISION.rank, date_key=comparable_date).add_records(RECORDS).results
+    assert date_range_text(results["Otter"]) == "2001-01-31 – 2019-05-03"
+    # without a valid date, the distinct values are shown
+    assert date_range_text(results["Badger"]) == "not a date"
+    single = SpeciesAggregator(PRECISION.rank, date_key=comparable_date).add_records(RECORDS[:1]).results
+    assert date_range_text(single["Otter"]) == "2019-05-03"
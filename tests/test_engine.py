@@ -0,0 +1,39 @@
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import NULL, QgsField  # noqa: E402
+from qgis.PyQt.QtCore import QVariant  # noqa: E402
+from test_record_cache import PRECISION, RECORDS, cache_of  # noqa: E402
+
+from NnpaReporting.engine import RESULT_FIELDS, result_features, result_fields  # noqa: E402
+from NnpaReporting.filters import RecordFilter  # noqa: E402
+
+
+def results():
+    return cache_of(RECORDS).aggregate(RecordFilter(0, len(PRECISION.values) - 1))
+
+
+def test_result_features_write_the_site_id(qgis_app):
+    fields = result_fields(QgsField("site", QVariant.String))
+    features = result_features(results(), fields, "A1")
+    assert [f.attributes()[0] for f in features] == ["A1"] * len(features)
+    assert all(len(f.attributes()) == fields.count() for f in features)
+
+
+def test_result_features_write_a_missing_site_id_as_null(qgis_app):
+    fields = result_fields(QgsField("site", QVariant.String))
+    species = results()
+    features = result_features(species, fields)
+    assert features
+    for f in features:
+        assert len(f.attributes()) == fields.count()
+        assert f.attribute(0) == NULL
+        assert f.attribute(1) in species
+
+
+def test_result_features_without_site_id_field(qgis_app):
+    species = results()
+    features = result_features(species, result_fields(), "A1")
+    assert all(len(f.attributes()) == len(RESULT_FIELDS) for f in features)
+    assert [f.attribute(0) for f in features] == list(species)
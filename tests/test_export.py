@@ -0,0 +1,78 @@
+import csv
+
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsVectorLayer  # noqa: E402
+from test_record_cache import RECORDS  # noqa: E402
+
+from NnpaReporting.aggregator import RECORD_FIELDS  # noqa: E402
+from NnpaReporting.export import ExportError, ResultsExport  # noqa: E402
+from NnpaReporting.filters import RecordFilter  # noqa: E402
+from NnpaReporting.precision import PrecisionDomain  # noqa: E402
+from NnpaReporting.record_cache import RecordCache  # noqa: E402
+
+
+@pytest.fixture
+def layer(qgis_app):
+    """Point memory layer of the RECORDS, the attributes in the RECORD_FIELDS order"""
+    fields = "&".join(f"field={key}:string" for key in RECORD_FIELDS)
+    vl = QgsVectorLayer(f"Point?crs=EPSG:27700&{fields}", "records", "memory")
+    features = []
+    for fid, record in RECORDS.items():
+        f = QgsFeature(vl.fields())
+        f.setAttributes(list(record))
+        f.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(fid * 10, fid * 10)))
+        features.append(f)
+    vl.dataProvider().addFeatures(features)
+    return vl
+
+
+def export_of(layer, per_record, record_filter=None):
+    precision = PrecisionDomain(layer.uniqueValues(layer.fields().indexFromName("precision")))
+    records = RecordCache(precision.rank).add_features(layer.getFeatures(), list(range(len(RECORD_FIELDS))))
+    record_filter = record_filter or RecordFilter(0, len(precision.values) - 1)
+    results = records.aggregate(record_filter)
+    geom = QgsGeometry.fromWkt("POLYGON((0 0, 100 0, 100 100, 0 100, 0 0))")
+    return ResultsExport(layer, results, records, record_filter, geom, per_record), results, records
+
+
+def test_species_csv_export(layer, tmp_path):
+    export, results, _ = export_of(layer, per_record=False)
+    path = tmp_path / "species.csv"
+    assert export.to_file(str(path)) == len(results)
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert {row["Common Name"]: int(row["Count"]) for row in rows} == {
+        name: value.count for name, value in results.items()
+    }
+    assert all(row["WKT"].upper().startswith("POLYGON") for row in rows)
+
+
+def test_record_geopackage_export(layer, tmp_path):
+    record_filter = RecordFilter(1, 2)
+    export, _, records = export_of(layer, per_record=True, record_filter=record_filter)
+    path = tmp_path / "records.gpkg"
+    expected = sorted(records.fids[i] for i in records.filtered_records(record_filter))
+    assert export.to_file(str(path)) == len(expected)
+
+    exported = QgsVectorLayer(str(path), "exported", "ogr")
+    assert exported.isValid()
+    features = {f["Feature Id"]: f for f in exported.getFeatures()}
+    assert sorted(features) == expected
+    for fid, f in features.items():
+        assert f["Common Name"] == RECORDS[fid][0]
+        assert f.geometry().asPoint() == QgsPointXY(fid * 10, fid * 10)
+
+
+def test_memory_layer_export(layer):
+    export, results, _ = export_of(layer, per_record=False)
+    vl = export.to_memory_layer()
+    assert vl.featureCount() == len(results)
+
+
+def test_unsupported_format(layer, tmp_path):
+    export, _, _ = export_of(layer, per_record=False)
+    with pytest.raises(ExportError):
+        export.to_file(str(tmp_path / "species.xlsx"))
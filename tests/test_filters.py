@@ -0,0 +1,70 @@
+from datetime import date
+
+from NnpaReporting.filters import DateRange, RecordFilter, normalized_name
+from NnpaReporting.precision import UNKNOWN_RANK
+
+
+def test_record_filter_ranks():
+    record_filter = RecordFilter(3, 1)
+    assert (record_filter.rank_min, record_filter.rank_max) == (1, 3)
+    assert [record_filter.accepts_rank(rank) for rank in range(5)] == [False, True, True, True, False]
+    assert not record_filter.accepts_rank(UNKNOWN_RANK)
+    assert RecordFilter(0, 0, include_unknown=True).accepts_rank(UNKNOWN_RANK)
+
+
+def test_record_filter_names():
+    record_filter = RecordFilter(0, 1, excluded_names=["Red kite", None])
+    assert not record_filter.accepts_name("Red kite")
+    assert record_filter.accepts_name("Red kites")
+    assert not record_filter.accepts_name(None)
+    assert not record_filter.accepts_name([])  # unhashable NULL variant
+    assert RecordFilter(0, 1).accepts_name(None)
+
+
+def test_excluded_names_are_case_and_whitespace_insensitive():
+    record_filter = RecordFilter(0, 1, excluded_names=[" Red  Kite"])
+    assert normalized_name("  RED\tkite ") == "red kite"
+    assert not record_filter.accepts_name("red kite")
+    assert not record_filter.accepts_name("RED KITE ")
+    assert record_filter.accepts_name("Red kites")
+    assert record_filter.accepts_name("Red-kite")
+
+
+def test_date_range_bounds_are_inclusive():
+    date_range = DateRange(date(2019, 1, 1), date(2019, 12, 31))
+    assert date_range.accepts(date(2019, 1, 1))
+    assert date_range.accepts(date(2019, 12, 31))
+    assert not date_range.accepts(date(2018, 12, 31))
+    assert not date_range.accepts(date(2020, 1, 1))
+    assert not date_range.accepts(None)
+    assert date_range.end_exclusive == date(2020, 1, 1)
+
+
+def test_date_range_swaps_reversed_bounds():
+    date_range = DateRange(date(2020, 1, 1), date(2019, 1, 1))
+    assert (date_range.start, date_range.end) == (date(2019, 1, 1), date(2020, 1, 1))
+
+
+def test_date_range_open_bounds():
+    since = DateRange(start=date(2019, 1, 1))
+    assert since.accepts(date(2100, 1, 1))
+    assert not since.accepts(date(2018, 12, 31))
+    assert since.end_exclusive is None
+    assert str(since) == "2019-01-01.."
+
+    until = DateRange(end=date(2019, 2, 28))
+    assert until.accepts(date(1900, 1, 1))
+    assert not until.accepts(date(2019, 3, 1))
+    assert until.end_exclusive == date(2019, 3, 1)
+    assert str(until) == "..2019-02-28"
+
+
+def test_date_range_without_bounds_is_false():
+    assert not DateRange()
+    assert DateRange(start=date(2019, 1, 1))
+    assert str(DateRange(date(2019, 1, 1), date(2019, 1, 1))) == "2019-01-01..2019-01-01"
+
+
+def test_date_range_end_of_leap_february():
+    assert DateRange(end=date(2020, 2, 28)).end_exclusive == date(2020, 2, 29)
+    assert DateRange(end=date(2020, 2, 29)).end_exclusive == date(2020, 3, 1)
@@ -0,0 +1,100 @@
+import math
+import random
+
+from NnpaReporting.aggregator import RECORD_FIELDS
+from NnpaReporting.grid_squares import GRID_SIZES, build_levels, grid_square, inner_grid_squares
+from NnpaReporting.precision import PrecisionDomain
+from NnpaReporting.record_cache import DictionaryColumn
+
+PRECISION = PrecisionDomain(["10m", "100m", "1km", "10km"])
+
+# circular selection, the records are tested against it by their bounding box
+CENTER = (25000.0, 15000.0)
+RADIUS = 7400.0
+
+
+def contains(xmin, ymin, xmax, ymax):
+    # the circle is convex, a box is inside if its corners are
+    return all(
+        math.dist(CENTER, corner) <= RADIUS for corner in ((xmin, ymin), (xmin, ymax), (xmax, ymin), (xmax, ymax))
+    )
+
+
+def intersects(xmin, ymin, xmax, ymax):
+    x, y = CENTER
+    return math.dist(CENTER, (min(max(x, xmin), xmax), min(max(y, ymin), ymax))) <= RADIUS
+
+
+def synthetic_boxes(count, seed=0):
+    """Record boxes around the selection, mostly points and small squares, some crossing grid lines"""
+    rnd = random.Random(seed)
+    for _ in range(count):
+        x = rnd.uniform(10000, 40000)
+        y = rnd.uniform(5000, 30000)
+        side = rnd.choice([0, 0, 10, 100, 300, 1500, 12000])
+        yield x, y, x + side, y + side
+
+
+def pyramid_of(boxes):
+    fids = list(range(100, 100 + len(boxes)))
+    ranks = [i % len(PRECISION.values) for i in range(len(boxes))]
+    columns = {key: DictionaryColumn() for key in RECORD_FIELDS}
+    for i in range(len(boxes)):
+        record = (f"Species {i % 7}", PRECISION.values[ranks[i]], f"2019-01-{i % 28 + 1:02d}", "NY", None, "Ann", None)
+        for column, value in zip(columns.values(), record):
+            column.append(value)
+    return fids, build_levels(fids, ranks, list(zip(*boxes)), columns, PRECISION.rank)
+
+
+def test_grid_square():
+    assert grid_square(1500, 2500, 1600, 2600, 1000) == (1, 2)
+    assert grid_square(1500, 2500, 2000, 3000, 1000) == (1, 2)  # touching the upper lines
+    assert grid_square(-10, -10, -5, -5, 1000) == (-1, -1)
+    assert grid_square(1500, 2500, 2100, 2600, 1000) is None
+    assert grid_square(1500, 2500, 2100, 2600, 10000) == (0, 0)
+
+
+def test_build_levels_counts_each_record_once_per_level():
+    boxes = list(synthetic_boxes(3000))
+    fids, (levels, spanning) = pyramid_of(boxes)
+    for size in GRID_SIZES:
+        squares = [grid_square(*box, size) for box in boxes]
+        counts = {}
+        for square in squares:
+            if square is not None:
+                counts[square] = counts.get(square, 0) + 1
+        assert {
+            square: sum(v.count for v in aggregates.values()) for square, aggregates in levels[size].items()
+        } == counts
+    assert spanning == [(fid, *box) for fid, box in zip(fids, boxes) if grid_square(*box, GRID_SIZES[-1]) is None]
+
+
+def test_inner_squares_match_the_records_in_the_selection():
+    boxes = list(synthetic_boxes(3000, seed=1))
+    fids, (levels, spanning) = pyramid_of(boxes)
+    x, y = CENTER
+    inner, border = inner_grid_squares(levels, (x - RADIUS, y - RADIUS, x + RADIUS, y + RADIUS), contains, intersects)
+    assert inner[GRID_SIZES[0]] and inner[GRID_SIZES[-1]] and border
+
+    # the records of the inner squares are aggregated, those of the border squares and the spanning ones are tested
+    aggregated = set()
+    for i, box in enumerate(boxes):
+        levels_in = [size for size in GRID_SIZES if grid_square(*box, size) in inner[size]]
+        assert len(levels_in) <= 1  # the inner squares of the levels never overlap
+        if levels_in:
+            aggregated.add(i)
+    border = set(border)
+    tested = {
+        i
+        for i, box in enumerate(boxes)
+        if i not in aggregated and grid_square(*box, GRID_SIZES[-1]) in border and intersects(*box)
+    }
+    tested |= {fids.index(fid) for fid, *box in spanning if fids.index(fid) not in aggregated and intersects(*box)}
+
+    assert not aggregated & tested
+    assert aggregated | tested == {i for i, box in enumerate(boxes) if intersects(*box)}
+    # the aggregates of the inner squares hold the aggregated records
+    count = sum(
+        aggregate.count for size in GRID_SIZES for square in inner[size] for aggregate in levels[size][square].values()
+    )
+    assert count == len(aggregated)
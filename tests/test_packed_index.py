@@ -0,0 +1,87 @@
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from NnpaReporting.packed_index import NODE_SIZE, PackedIndex, expand_ranges, str_order  # noqa: E402
+
+
+class Rect:
+    """Stand-in for the QgsRectangle bounds read by the index"""
+
+    def __init__(self, xmin, ymin, xmax, ymax):
+        self.bounds = xmin, ymin, xmax, ymax
+
+    def xMinimum(self):
+        return self.bounds[0]
+
+    def yMinimum(self):
+        return self.bounds[1]
+
+    def xMaximum(self):
+        return self.bounds[2]
+
+    def yMaximum(self):
+        return self.bounds[3]
+
+
+def random_boxes(count, rng):
+    """Boxes of records, a quarter of them points"""
+    xmin = rng.uniform(0, 10000, count)
+    ymin = rng.uniform(0, 10000, count)
+    size = rng.exponential(50, count) * (rng.random(count) > 0.25)
+    return xmin, ymin, xmin + size, ymin + size * rng.uniform(0.5, 2, count)
+
+
+def linear_scan(boxes, rect):
+    xmin, ymin, xmax, ymax = boxes
+    mask = (xmin <= rect.xMaximum()) & (xmax >= rect.xMinimum()) & (ymin <= rect.yMaximum()) & (ymax >= rect.yMinimum())
+    return numpy.flatnonzero(mask)
+
+
+def test_expand_ranges():
+    starts = numpy.array([0, 10, 5])
+    ends = numpy.array([3, 10, 7])
+    assert expand_ranges(starts, ends).tolist() == [0, 1, 2, 5, 6]
+
+
+def test_str_order_is_a_permutation_of_sorted_slices():
+    rng = numpy.random.default_rng(0)
+    boxes = random_boxes(10000, rng)
+    order = str_order(*boxes)
+    assert sorted(order.tolist()) == list(range(10000))
+    cx = ((boxes[0] + boxes[2]) / 2)[order]
+    cy = ((boxes[1] + boxes[3]) / 2)[order]
+    slice_size = NODE_SIZE * 13  # ceil(sqrt(ceil(10000 / 64)))
+    for start in range(0, 10000, slice_size):
+        assert (numpy.diff(cy[start : start + slice_size]) >= 0).all()
+        if start:
+            assert cx[start - slice_size : start].max() <= cx[start : start + slice_size].min()
+
+
+@pytest.mark.parametrize("count", [0, 1, NODE_SIZE, NODE_SIZE + 1, NODE_SIZE**2 + 7, 20000])
+def test_query_matches_a_linear_scan(count):
+    rng = numpy.random.default_rng(count)
+    boxes = random_boxes(count, rng)
+    order = str_order(*boxes)
+    boxes = tuple(b[order] for b in boxes)
+    index = PackedIndex(boxes)
+
+    rects = [Rect(-1, -1, 10001, 10001), Rect(20000, 20000, 30000, 30000)]
+    for _ in range(50):
+        x, y = rng.uniform(-500, 10000, 2)
+        width, height = rng.exponential(1000, 2)
+        rects.append(Rect(x, y, x + width, y + height))
+    # a point rectangle on a record corner
+    if count:
+        rects.append(Rect(boxes[0][0], boxes[1][0], boxes[0][0], boxes[1][0]))
+
+    for rect in rects:
+        assert index.query(rect).tolist() == linear_scan(boxes, rect).tolist()
+
+
+def test_query_of_unsorted_boxes():
+    # the index is correct in any order, the STR order only makes its nodes tight
+    boxes = random_boxes(5000, numpy.random.default_rng(1))
+    index = PackedIndex(boxes)
+    rect = Rect(2000, 2000, 4000, 3000)
+    assert index.query(rect).tolist() == linear_scan(boxes, rect).tolist()
@@ -0,0 +1,181 @@
+from NnpaReporting.aggregator import RECORD_FIELDS, SpeciesAggregator, comparable_date
+from NnpaReporting.filters import RecordFilter
+from NnpaReporting.precision import PrecisionDomain
+from NnpaReporting.record_cache import DictionaryColumn, FederatedRecords, GroupedRecords, RecordCache
+
+PRECISION = PrecisionDomain(["10m", "100m", "1km", "10km", "bad"])
+
+RECORDS = {
+    # fid: name, precision, date, grid_refer, latin_name, recorder, survey_name
+    1: ("Otter", "100m", "2019-05-03", "NY1010", "Lutra lutra", "Ann", "Rivers"),
+    2: ("Otter", "1km", "03/05/2018", "NY1010", "Lutra lutra", "Bob", "Rivers"),
+    3: ("Otter", "10km", "2001-01-31", "NY2020", "Lutra lutra", "Ann", None),
+    4: ("Badger", "bad", "2010-06-01", "NY3030", "Meles meles", "Cat", "Setts"),
+    5: ("Badger", "10m", None, "NY3030", "Meles meles", "Cat", "Setts"),
+    6: ("Red kite", "1km", "2015-04-04", "NY4040", "Milvus milvus", "Dan", "Birds"),
+    7: ("  red KITE ", "1km", "2016-04-04", "NY4040", "Milvus milvus", "Dan", "Birds"),
+}
+
+# attribute indexes of the RECORD_FIELDS in the fake features
+INDEXES = list(range(len(RECORD_FIELDS)))
+
+
+class Feature:
+    """Stand-in for the QgsFeature id and attributes read by the caches"""
+
+    def __init__(self, fid, attributes):
+        self.fid = fid
+        self.values = list(attributes)
+
+    def id(self):
+        return self.fid
+
+    def attributes(self):
+        return self.values
+
+
+def cache_of(fids):
+    return RecordCache(PRECISION.rank).add_features((Feature(fid, RECORDS[fid]) for fid in fids), INDEXES)
+
+
+def expected(fids, record_filter):
+    """Results of the streaming aggregator on the records passing the filter"""
+    aggregator = SpeciesAggregator(PRECISION.rank, date_key=comparable_date)
+    for fid in fids:
+        record = RECORDS[fid]
+        rank = PRECISION.rank(record[1])
+        if record_filter.accepts_rank(rank) and record_filter.accepts_name(record[0]):
+            aggregator.add_ranked(rank, *record)
+    return aggregator.results
+
+
+def summary(results):
+    return {
+        name: (
+            value.count,
+            value.precision_min,
+            value.precision_max,
+            value.date,
+            value.grid_refer,
+            value.recorder,
+            value.survey_name,
+            value.earliest_date,
+            value.latest_date,
+        )
+        for name, value in results.items()
+    }
+
+
+def test_dictionary_column_stores_each_value_once():
+    column = DictionaryColumn()
+    for value in ["a", "b", "a", None, "b", []]:  # unhashable NULL variants are stored as None
+        column.append(value)
+    assert column.values == ["a", "b", None]
+    assert list(column.codes) == [0, 1, 0, 2, 1, 2]
+    assert column[2] == "a"
+    assert column.code("c") == 3
+
+
+def test_aggregate_without_filter_matches_the_aggregator():
+    cache = cache_of(RECORDS)
+    record_filter = RecordFilter(0, len(PRECISION.values) - 1, include_unknown=True)
+    assert len(cache) == len(RECORDS)
+    assert summary(cache.aggregate(record_filter)) == summary(expected(RECORDS, record_filter))
+
+
+def test_aggregate_filters_precision():
+    cache = cache_of(RECORDS)
+    # 100m to 1km, the unknown precision is excluded
+    record_filter = RecordFilter(2, 1, include_unknown=False)
+    results = cache.aggregate(record_filter)
+    assert summary(results) == summary(expected(RECORDS, record_filter))
+    assert set(results) == {"Otter", "Red kite", "  red KITE "}
+    assert results["Otter"].count == 2
+
+
+def test_aggregate_include_unknown_precision():
+    cache = cache_of(RECORDS)
+    results = cache.aggregate(RecordFilter(0, 0, include_unknown=True))
+    assert results["Badger"].count == 2
+    assert set(results) == {"Badger"}
+
+
+def test_aggregate_max_distinct():
+    results = cache_of(RECORDS).aggregate(RecordFilter(0, 3), max_distinct=1)
+    assert len(results["Otter"].grid_refer) == 1
+    assert results["Otter"].truncated
+
+
+def test_merged_keeps_each_record_once():
+    parts = [cache_of([1, 2, 3, 6]), cache_of([3, 4, 6, 7]), cache_of([]), cache_of([7, 5])]
+    merged = RecordCache.merged(PRECISION.rank, parts)
+
+    assert sorted(merged.fids) == sorted(RECORDS)
+    assert len(merged) == len(RECORDS)
+    for i, fid in enumerate(merged.fids):
+        assert merged.record(i) == (fid, RECORDS[fid])
+        assert merged.ranks[i] == PRECISION.rank(RECORDS[fid][1])
+    # the distinct values of the parts are encoded once
+    assert len(merged.columns["name"].values) == len({record[0] for record in RECORDS.values()})
+
+    record_filter = RecordFilter(0, 3, include_unknown=True)
+    assert summary(merged.aggregate(record_filter)) == summary(cache_of(RECORDS).aggregate(record_filter))
+
+
+def test_merged_of_no_parts():
+    assert len(RecordCache.merged(PRECISION.rank, [])) == 0
+
+
+def grouped_records(fids):
+    """GroupedRecords of the records, one group per record as returned by a grouped query"""
+    groups = GroupedRecords(PRECISION.rank)
+    for fid in fids:
+        record = RECORDS[fid]
+        partial = SpeciesAggregator(PRECISION.rank, date_key=comparable_date)
+        rank = PRECISION.rank(record[1])
+        partial.add_ranked(rank, *record)
+        groups.add_group(record[0], rank, partial.results[record[0]])
+    return groups
+
+
+def test_grouped_records_match_the_cache():
+    groups = grouped_records(RECORDS)
+    assert len(groups) == len(RECORDS)
+    for record_filter in (RecordFilter(1, 3), RecordFilter(0, 4, include_unknown=True)):
+        assert summary(groups.aggregate(record_filter)) == summary(cache_of(RECORDS).aggregate(record_filter))
+
+
+def test_species_records_and_record():
+    cache = cache_of(RECORDS)
+    record_filter = RecordFilter(2, 1)
+    assert cache.species_records("Otter", record_filter) == [0, 1]
+    assert cache.species_records("Badger", record_filter) == []
+    assert cache.species_records("Wolf", record_filter) == []
+    assert cache_of([3, 5]).record(1) == (5, RECORDS[5])
+
+
+def test_filtered_records():
+    cache = cache_of(RECORDS)
+    assert cache.filtered_records(RecordFilter(2, 1)) == [0, 1, 5, 6]
+    assert cache.filtered_records(RecordFilter(0, 0, include_unknown=True)) == [3, 4]
+
+
+def test_aggregate_excluded_names():
+    cache = cache_of(RECORDS)
+    # both spellings of the excluded name are dropped
+    record_filter = RecordFilter(2, 1, excluded_names=["Red Kite"])
+    results = cache.aggregate(record_filter)
+    assert summary(results) == summary(expected(RECORDS, record_filter))
+    assert set(results) == {"Otter"}
+    assert cache.filtered_records(record_filter) == [0, 1]
+    assert cache.species_records("Red kite", record_filter) == []
+    assert summary(grouped_records(RECORDS).aggregate(record_filter)) == summary(results)
+
+
+def test_federated_records_match_a_single_cache():
+    # a layer read feature by feature and a layer answered by a grouped query
+    federated = FederatedRecords(PRECISION.rank, [cache_of([1, 2, 3]), grouped_records([4, 5, 6, 7])])
+    assert len(federated) == len(RECORDS)
+    assert not federated.has_records
+    for record_filter in (RecordFilter(1, 3, excluded_names=["badger"]), RecordFilter(0, 3, include_unknown=True)):
+        assert summary(federated.aggregate(record_filter)) == summary(cache_of(RECORDS).aggregate(record_filter))
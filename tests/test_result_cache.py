@@ -0,0 +1,70 @@
+from NnpaReporting.result_cache import ResultCache, cache_key
+
+
+class Geometry:
+    """Stand-in for the QgsGeometry WKB read by the cache key"""
+
+    def __init__(self, wkb):
+        self.wkb = wkb
+
+    def asWkb(self):
+        return self.wkb
+
+
+class Records:
+    """Stand-in for cached records of a given estimated size"""
+
+    def __init__(self, size):
+        self.size = size
+
+    def memory_size(self):
+        return self.size
+
+
+def test_cache_key():
+    key = cache_key(Geometry(b"\x01\x02"), 100, "subset")
+    assert key == cache_key(Geometry(b"\x01\x02"), 100.0, "subset")
+    assert key != cache_key(Geometry(b"\x01\x03"), 100, "subset")
+    assert key != cache_key(Geometry(b"\x01\x02"), 50, "subset")
+    assert key != cache_key(Geometry(b"\x01\x02"), 100)
+    assert cache_key(Geometry(b""), 0, None) == cache_key(Geometry(b""), 0, "")
+
+
+def test_hits_and_misses():
+    cache = ResultCache(100)
+    records = Records(10)
+    assert cache.get("a") is None
+    cache.put("a", records)
+    assert cache.get("a") is records
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResultCache(100)
+    for key in "abc":
+        cache.put(key, Records(40))
+    assert list(cache.entries) == ["b", "c"]
+    cache.get("b")
+    cache.put("d", Records(40))
+    assert list(cache.entries) == ["b", "d"]
+    assert cache.size == 80
+
+
+def test_replaced_and_oversized_entries():
+    cache = ResultCache(100)
+    cache.put("a", Records(40))
+    cache.put("a", Records(60))
+    assert (len(cache), cache.size) == (1, 60)
+    cache.put("b", Records(101))
+    assert cache.get("b") is None
+    assert cache.size == 60
+
+
+def test_validate_clears_the_cache_when_the_fingerprint_changes():
+    cache = ResultCache(100)
+    cache.validate(("layer", 1))
+    cache.put("a", Records(10))
+    cache.validate(("layer", 1))
+    assert len(cache) == 1
+    cache.validate(("layer", 2))
+    assert (len(cache), cache.size) == (0, 0)
@@ -0,0 +1,91 @@
+import random
+from datetime import date
+
+from NnpaReporting.aggregator import SpeciesAggregator, comparable_date
+from NnpaReporting.precision import PrecisionDomain
+from NnpaReporting.result_rows import record_row_text, species_sort_key, species_text
+
+PRECISION = PrecisionDomain(["10m", "100m", "1km", "2km", "10km"])
+
+
+def random_species(count, seed=0):
+    """Records of each species, with counts, precisions and dates that sort differently as text"""
+    rnd = random.Random(seed)
+    species = {}
+    for i in range(count):
+        name = f"{rnd.choice(['otter', 'Badger', 'adder', 'Bat'])} {i}"
+        species[name] = [
+            (
+                name,
+                rnd.choice(PRECISION.values),
+                rnd.choice(
+                    [None, f"{rnd.randrange(1, 29):02d}/{rnd.randrange(1, 13):02d}/{rnd.randrange(1990, 2024)}"]
+                ),
+                f"NY{rnd.randrange(100):02d}",
+                rnd.choice([None, f"Latinus {i}"]),
+                f"Recorder {rnd.randrange(20)}",
+                None,
+            )
+            for _ in range(rnd.randrange(1, 15))
+        ]
+    return species
+
+
+def brute_force_key(name, records, column):
+    """Sort key of a species computed from its records"""
+    if column == 0:
+        return name.lower()
+    if column == 1:
+        return len(records)
+    if column == 2:
+        dates = [comparable_date(record[2]) for record in records if record[2] is not None]
+        return (min(dates), max(dates)) if dates else (date.min, date.min)
+    if column == 3:
+        return min(PRECISION.rank(record[1]) for record in records)
+    if column == 4:
+        return max(PRECISION.rank(record[1]) for record in records)
+    if column == 6:
+        return (records[0][4] or "").lower()
+    return sorted({record[3] for record in records})
+
+
+def test_species_sort_matches_brute_force():
+    species = random_species(200)
+    aggregator = SpeciesAggregator(PRECISION.rank, date_key=comparable_date)
+    for records in species.values():
+        aggregator.add_records(records)
+    results = aggregator.results
+    assert list(results) == list(species)
+
+    for column in (0, 1, 2, 3, 4, 5, 6):
+        for reverse in (False, True):
+            by_key = sorted(results, key=lambda name: species_sort_key(name, results[name], column), reverse=reverse)
+            expected = sorted(species, key=lambda name: brute_force_key(name, species[name], column), reverse=reverse)
+            assert by_key == expected, column
+
+
+def test_counts_and_precisions_sort_as_numbers():
+    aggregator = SpeciesAggregator(PRECISION.rank)
+    aggregator.add_records([("a", "2km", None, None, None, None, None)] * 9)
+    aggregator.add_records([("b", "10m", None, None, None, None, None)] * 10)
+    results = aggregator.results
+    # "10" < "9" and "10m" < "2km" as text
+    assert species_sort_key("a", results["a"], 1) < species_sort_key("b", results["b"], 1)
+    assert species_sort_key("b", results["b"], 3) < species_sort_key("a", results["a"], 3)
+    assert species_text("b", results["b"], 1) == "10"
+    assert species_text("b", results["b"], 3) == "10m"
+
+
+def test_record_row_text():
+    record = ("Otter", "1km", "2019-05-03", "NY1010", None, "Ann", "Rivers")
+    assert record_row_text(7, record) == [
+        "Feature 7",
+        "",
+        "2019-05-03",
+        "1km",
+        "1km",
+        "NY1010",
+        "",
+        "Ann",
+        "Rivers",
+    ]
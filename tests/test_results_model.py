@@ -0,0 +1,53 @@
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.PyQt.QtCore import QModelIndex, QPersistentModelIndex, Qt  # noqa: E402
+from test_record_cache import PRECISION, RECORDS, cache_of  # noqa: E402
+
+from NnpaReporting.filters import RecordFilter  # noqa: E402
+from NnpaReporting.result_rows import species_sort_key  # noqa: E402
+from NnpaReporting.results_model import ResultsModel  # noqa: E402
+
+
+def displayed_names(model):
+    return [model.data(model.index(row, 0)) for row in range(model.rowCount())]
+
+
+def test_sort_matches_the_sort_keys():
+    records = cache_of(RECORDS)
+    record_filter = RecordFilter(0, len(PRECISION.values) - 1, include_unknown=True)
+    results = records.aggregate(record_filter)
+    model = ResultsModel()
+    model.set_results(results, records, record_filter)
+
+    for column in range(model.columnCount()):
+        for order in (Qt.AscendingOrder, Qt.DescendingOrder):
+            model.sort(column, order)
+            expected = sorted(
+                results,
+                key=lambda name: species_sort_key(name, results[name], column),
+                reverse=order == Qt.DescendingOrder,
+            )
+            assert displayed_names(model) == expected, (column, order)
+            for row, name in enumerate(expected):
+                assert model.data(model.index(row, 1)) == str(results[name].count)
+
+
+def test_sort_keeps_the_record_rows_of_their_species():
+    records = cache_of(RECORDS)
+    record_filter = RecordFilter(0, len(PRECISION.values) - 1, include_unknown=True)
+    model = ResultsModel()
+    model.set_results(records.aggregate(record_filter), records, record_filter)
+    model.sort(0, Qt.AscendingOrder)
+    otter = model.index(displayed_names(model).index("Otter"), 0)
+    assert model.canFetchMore(otter)
+    model.fetchMore(otter)
+    assert model.rowCount(otter) == 3
+    record = QPersistentModelIndex(model.index(0, 0, otter))
+    species = QPersistentModelIndex(otter)
+
+    model.sort(0, Qt.DescendingOrder)
+    assert model.data(QModelIndex(species)) == "Otter"
+    assert model.parent(QModelIndex(record)).row() == displayed_names(model).index("Otter")
+    assert model.data(QModelIndex(record)) == "Feature 1"
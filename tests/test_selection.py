@@ -0,0 +1,27 @@
+import math
+
+import pytest
+
+pytest.importorskip("qgis.core")
+
+from qgis.core import QgsGeometry, QgsPointXY  # noqa: E402
+
+from NnpaReporting.selection import TILE_MIN_VERTICES, SelectionGeometry, matches_tiles  # noqa: E402
+
+
+def points_around_corner(distance, count=200):
+    """Points at the distance of the (1000, 1000) corner, along its quarter circle"""
+    for i in range(count):
+        angle = math.pi / 2 * (i + 0.5) / count
+        yield QgsGeometry.fromPointXY(QgsPointXY(1000 + distance * math.cos(angle), 1000 + distance * math.sin(angle)))
+
+
+def test_tiles_match_the_exact_buffer_distance(qgis_app):
+    square = QgsGeometry.fromWkt("POLYGON((0 0, 1000 0, 1000 1000, 0 1000, 0 0))")
+    selection = SelectionGeometry(square.densifyByCount(2 * TILE_MIN_VERTICES // 4), 100)
+    assert selection.tiled and len(selection.tiles) > 1
+
+    # the segmented buffer misses some of these points
+    assert all(matches_tiles(selection.tiles, point) for point in points_around_corner(99.99))
+    assert not any(matches_tiles(selection.tiles, point) for point in points_around_corner(100.01))
+    assert matches_tiles(selection.tiles, QgsGeometry.fromPointXY(QgsPointXY(500, 500)))
@@ -0,0 +1,66 @@
+import json
+
+from NnpaReporting.timing import PhaseTimer, timed_phase
+
+
+class Dialog:
+    """Object timed by its `timer`, as the output dialog"""
+
+    def __init__(self, enabled=True):
+        self.log = []
+        self.timer = PhaseTimer(enabled, self.log.append)
+        self.calls = []
+
+    @timed_phase("export")
+    def export_results(self):
+        self.calls.append(())
+        return "exported"
+
+    @timed_phase("aggregation")
+    def perform_request(self, records, max_distinct=None):
+        self.calls.append((records, max_distinct))
+        return len(records)
+
+    @timed_phase("any")
+    def any_arguments(self, *args):
+        self.calls.append(args)
+
+
+def test_slot_called_with_the_clicked_checked_argument():
+    dialog = Dialog()
+    # QPushButton.clicked passes `checked` to the connected slot
+    assert dialog.export_results(False) == "exported"
+    assert dialog.calls == [()]
+    assert json.loads(dialog.log[0])["phase"] == "export"
+    assert "export" in dialog.timer.elapsed
+
+
+def test_timed_method_arguments():
+    dialog = Dialog()
+    assert dialog.perform_request([1, 2], 10) == 2
+    assert dialog.perform_request([1], max_distinct=5) == 1
+    assert dialog.perform_request([1, 2, 3], 7, True) == 3
+    dialog.any_arguments(1, 2, 3)
+    assert dialog.calls == [([1, 2], 10), ([1], 5), ([1, 2, 3], 7), (1, 2, 3)]
+    assert dialog.export_results.__name__ == "export_results"
+
+
+def test_disabled_timer():
+    dialog = Dialog(enabled=False)
+    assert dialog.export_results(False) == "exported"
+    dialog.timer.count(matched=3)
+    assert dialog.log == []
+    assert dialog.timer.summary() == ""
+
+
+def test_phases_and_counts():
+    timer = PhaseTimer(True)
+    with timer.phase("query"):
+        pass
+    timer.start("tree")
+    timer.stop("tree", matched=5)
+    timer.stop("never started")
+    assert set(timer.elapsed) == {"query", "tree"}
+    assert "5 matched" in timer.summary()
+    timer.reset()
+    assert timer.summary() == ""